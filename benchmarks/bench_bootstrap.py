@@ -0,0 +1,103 @@
+'''
+Bootstrapped backtests per second, through the vectorized BlockBootstrap and through a loop
+that rebuilds every resampled price history and runs backtest_portfolios and compute_metrics
+on it, as a single realized path is backtested.
+
+The portfolios are optimized once and both modes use the same bootstrap indices, so their
+metrics are checked to agree.
+
+Usage: python -m benchmarks.bench_bootstrap --paths 500 --loop-paths 50 --models historical
+'''
+# Standard library imports
+import argparse
+import contextlib
+import copy
+import io
+import json
+import time
+
+# Third party imports
+import numpy as np
+import pandas as pd
+
+# Local application imports
+from src.backtester import Backtester
+from src.executor import SerialExecutor, cell_seed
+from src.robustness import BlockBootstrap, METRICS, stationary_bootstrap_indices
+from src.utils import load_data
+
+
+def loop_metrics(backtester, portfolios, indices):
+    '''
+    Backtests the portfolios on each resampled history, one pandas price table at a time.
+    '''
+    dates = portfolios[backtester.generators[0].name].index
+    prices = backtester.asset_prices.loc[dates[0]:dates[-1]]
+    log_returns = np.diff(np.log(prices.values), axis=0)
+    path_backtester = copy.copy(backtester)
+    rows = []
+    for path, path_indices in enumerate(indices):
+        growth = np.exp(np.cumsum(log_returns[path_indices], axis=0))
+        path_prices = np.vstack([prices.values[:1], prices.values[:1] * growth])
+        path_backtester.asset_prices = pd.DataFrame(path_prices, index=prices.index, columns=prices.columns)
+        backtests = path_backtester.compute_metrics(path_backtester.backtest_portfolios(portfolios))
+        for name, results in backtests.items():
+            rows.append({'path': path, 'model': name, **{metric: results[metric] for metric in METRICS}})
+    return pd.DataFrame(rows).sort_values(['model', 'path'], ignore_index=True)
+
+
+def run(config, n_paths, loop_paths):
+    asset_prices, asset_returns, features, rebalance_dates = load_data(config)
+    backtester = Backtester(asset_prices=asset_prices, asset_returns=asset_returns, config=config,
+                            rebalance_dates=rebalance_dates, features=features)
+    with contextlib.redirect_stdout(io.StringIO()):
+        backtests = backtester.run_backtests()
+    portfolios = {model.name: backtests[model.name]['portfolios'] for model in backtester.generators}
+
+    bootstrap = BlockBootstrap(asset_prices, n_paths=n_paths, mean_block=config.get('bootstrap_block_days', 30),
+                               chunk_size=n_paths, seed=config.get('seed', 42))
+    start = time.perf_counter()
+    vectorized = bootstrap.run(portfolios, SerialExecutor())
+    vectorized_seconds = time.perf_counter() - start
+
+    # the first loop_paths paths of the single chunk, drawn from the same seed
+    dates = portfolios[backtester.generators[0].name].index
+    n_days = len(asset_prices.loc[dates[0]:dates[-1]]) - 1
+    rng = np.random.default_rng(cell_seed(bootstrap.seed, 0, 0))
+    indices = stationary_bootstrap_indices(n_days, n_paths, bootstrap.mean_block, rng)[:loop_paths]
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        looped = loop_metrics(backtester, portfolios, indices)
+        loop_seconds = time.perf_counter() - start
+
+    expected = vectorized[vectorized['path'] < loop_paths].reset_index(drop=True)
+    max_error = max(np.abs(expected[metric] - looped[metric]).max() for metric in METRICS)
+    return {'paths': n_paths, 'vectorized_seconds': vectorized_seconds,
+            'vectorized_paths_per_second': n_paths / vectorized_seconds,
+            'loop_paths': loop_paths, 'loop_seconds': loop_seconds,
+            'loop_paths_per_second': loop_paths / loop_seconds, 'max_metric_difference': max_error}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', default='./config.json')
+    parser.add_argument('--paths', type=int, default=500)
+    parser.add_argument('--loop-paths', type=int, default=50)
+    parser.add_argument('--models', nargs='+', default=['historical'])
+    parser.add_argument('--output', default=None, help='optional path of a JSON report')
+    args = parser.parse_args()
+
+    config = json.load(open(args.config))
+    config.update(model_names=args.models, executor='serial')
+    report = run(config, args.paths, args.loop_paths)
+
+    print(f"vectorized: {report['paths']} paths in {report['vectorized_seconds']:.3f}s "
+          f"({report['vectorized_paths_per_second']:.0f} paths/s)")
+    print(f"loop:       {report['loop_paths']} paths in {report['loop_seconds']:.3f}s "
+          f"({report['loop_paths_per_second']:.0f} paths/s)")
+    print(f"speed-up: {report['vectorized_paths_per_second'] / report['loop_paths_per_second']:.0f}x, "
+          f"max metric difference: {report['max_metric_difference']:.2e}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,85 @@
+'''
+Scenarios per second drawn from a fitted CTGAN, through SDV's sample and through the fast
+path straight from the ctgan synthesizer, for several batch sizes.
+
+The model is fitted once on the lookback window of the first rebalance date and only the
+drawing, PCA back-projection and de-normalization are timed.
+
+Usage: python -m benchmarks.bench_ctgan_sampling --sizes 10000 100000 --batches 10000 50000
+'''
+# Standard library imports
+import argparse
+import json
+import time
+
+# Third party imports
+import numpy as np
+
+# Local application imports
+from src.backtester import Backtester
+from src.generators.gan_generator import CTGANGenerator
+from src.utils import load_data
+
+
+class _FittedModel():
+    '''
+    Records the model, PCA, normalizer and column bounds of a generate_sample call, so they can be redrawn.
+    '''
+    def __init__(self, generator):
+        self.generator = generator
+        self.draw_args = None
+        self._draw_sample = generator._draw_sample
+        generator._draw_sample = self._record
+
+    def _record(self, *args):
+        self.draw_args = args
+        return self._draw_sample(*args)
+
+
+def run(config, sizes, batch_sizes, seed=0):
+    asset_prices, asset_returns, features, rebalance_dates = load_data(config)
+    backtester = Backtester(asset_prices=asset_prices, asset_returns=asset_returns,
+                            config=dict(config, model_names=[]), rebalance_dates=rebalance_dates,
+                            features=features)
+    generator = CTGANGenerator(asset_returns=asset_returns, features=features,
+                               window_index=backtester.window_index,
+                               embedding=config.get('ctgan_embedding', 'tsne'))
+    fitted = _FittedModel(generator)
+    start_date, end_date = backtester._get_start_end_dates(rebalance_dates[0])
+    generator.generate_sample(sample_size=1, start_date=start_date, end_date=end_date, seed=seed)
+    model, pca, normalizer, _, sample_cols, bounds = fitted.draw_args
+
+    rows = []
+    for sample_size in sizes:
+        for batch_size in batch_sizes:
+            row = {'sample_size': sample_size, 'batch_size': batch_size}
+            for mode, fast_sampling in (('sdv', False), ('fast', True)):
+                generator.chunk_size = batch_size
+                generator.fast_sampling = fast_sampling
+                start = time.perf_counter()
+                fitted._draw_sample(model, pca, normalizer, sample_size, sample_cols, bounds)
+                row[mode] = time.perf_counter() - start
+            rows.append(row)
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', default='./config.json')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--batches', type=int, nargs='+', default=[10000, 50000])
+    parser.add_argument('--output', default=None, help='optional path of a JSON report')
+    args = parser.parse_args()
+
+    config = json.load(open(args.config))
+    rows = run(config, args.sizes, args.batches)
+
+    print(f"{'scenarios':>10} {'batch':>8} {'sdv (s)':>9} {'fast (s)':>9} {'fast rows/s':>12}")
+    for row in rows:
+        print(f"{row['sample_size']:>10} {row['batch_size']:>8} {row['sdv']:>9.3f} {row['fast']:>9.3f} "
+              f"{row['sample_size'] / row['fast']:>12.0f}")
+    print(f"\nMean speed-up of the fast path: {np.mean([row['sdv'] / row['fast'] for row in rows]):.1f}x")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(rows, f, indent=2)
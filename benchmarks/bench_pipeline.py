@@ -0,0 +1,147 @@
+'''
+End-to-end timing of the backtest pipeline on synthetic data, one stage at a time:
+loading the data, generating the samples of each generator, optimizing every portfolio,
+the performance backtest, the metrics and the dashboard rendering.
+
+Each stage runs --repeat times and the JSON report keeps every timing with the commit,
+the machine and the data sizes, so reports of different commits can be compared.
+Runs on CPU only and needs no data download.
+
+Usage: python -m benchmarks.bench_pipeline --years 20 --assets 10 --features 8 --models historical CTGAN
+           --sample-size 500 --repeat 3 --output bench_pipeline.json
+'''
+# Standard library imports
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# Third party imports
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+import pandas as pd
+
+# Local application imports
+from benchmarks.synthetic_data import write_market_data
+from src.backtester import Backtester, _generate_cell
+from src.uryasev_optimization import UryasevOptimization
+from src.utils import load_data
+from src.visualization import PortfolioVisualizer
+
+
+def timed(stages, name, repeat, fn):
+    '''
+    Runs fn repeat times, records its wall-clock seconds under name and returns its last result.
+    The pipeline prints its progress, which is silenced but still timed.
+    '''
+    seconds = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = fn()
+            seconds.append(time.perf_counter() - start)
+    stages[name] = {'seconds': seconds, 'min': min(seconds), 'median': statistics.median(seconds)}
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    try:
+        import torch
+        cuda = torch.cuda.is_available()
+    except ImportError:
+        cuda = False
+    return {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'cuda_available': cuda,
+    }
+
+
+def run(config, model_names, repeat=1, data_dir=None, **data_params):
+    data_dir = data_dir or tempfile.mkdtemp(prefix='bench_pipeline_')
+    config = write_market_data(data_dir, config, **data_params)
+    # every stage is timed on its own, without caches or worker pools
+    config.update(model_names=model_names, executor='serial', read_samples=False, read_backtest=False)
+    stages = {}
+
+    asset_prices, asset_returns, features, rebalance_dates = timed(stages, 'load_data', repeat, lambda: load_data(config))
+    backtester = Backtester(asset_prices=asset_prices, asset_returns=asset_returns, config=config,
+                            rebalance_dates=rebalance_dates, features=features)
+
+    results = {}
+    for generator in backtester.generators:
+        cells = [(key, args) for key, args in backtester._sample_cells() if key[1] == generator.name]
+        generated = timed(stages, f"generate_samples.{generator.name}", repeat,
+                          lambda: {key: _generate_cell(*args) for key, args in cells})
+        results.update(generated)
+
+    optimization = UryasevOptimization(alpha=backtester.alpha, cvar=backtester.cvar, bounds=backtester.bounds)
+    problems = {key: backtester._prepare_sample(sample, key[0], key[1]) for key, sample in results.items()}
+    portfolios = timed(stages, 'get_optimal_portfolio', repeat,
+                       lambda: {key: optimization.get_optimal_portfolio(sample=sample_assets, density=density)
+                                for key, (sample_assets, density) in problems.items()})
+    stages['get_optimal_portfolio']['calls'] = len(problems)
+
+    historical_portfolios = {}
+    for generator in backtester.generators:
+        weights = [portfolios[(rebalance_date, generator.name)].values for rebalance_date in rebalance_dates]
+        historical_portfolios[generator.name] = pd.DataFrame(weights, index=rebalance_dates, columns=asset_returns.columns)
+
+    backtests = timed(stages, 'backtest_portfolios', repeat,
+                      lambda: backtester.backtest_portfolios(historical_portfolios=historical_portfolios))
+    timed(stages, 'compute_metrics', repeat, lambda: backtester.compute_metrics(backtests=backtests))
+
+    charts_dir = os.path.join(data_dir, 'charts')
+    visualizer = PortfolioVisualizer(backtests, asset_prices.columns.tolist())
+    timed(stages, 'dashboard', repeat,
+          lambda: visualizer.render_dashboard(save_path=charts_dir, fmt=config.get('chart_format', 'png'),
+                                              dpi=config.get('chart_dpi', 300), n_jobs=config.get('chart_jobs', 1)))
+
+    parameters = dict(data_params, models=model_names, sample_size=config['sample_size'], repeat=repeat,
+                      rebalance_dates=len(rebalance_dates))
+    return {'environment': environment(), 'parameters': parameters, 'stages': stages}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', default='./config.json')
+    parser.add_argument('--years', type=float, default=20)
+    parser.add_argument('--assets', type=int, default=10)
+    parser.add_argument('--features', type=int, default=8)
+    parser.add_argument('--models', nargs='+', default=['historical'])
+    parser.add_argument('--sample-size', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=None, help='where the synthetic data is written, a temporary directory by default')
+    parser.add_argument('--output', default='bench_pipeline.json', help='path of the JSON report')
+    args = parser.parse_args()
+
+    config = json.load(open(args.config))
+    if args.sample_size is not None:
+        config['sample_size'] = args.sample_size
+    report = run(config, args.models, repeat=args.repeat, data_dir=args.data_dir, n_years=args.years,
+                 n_assets=args.assets, n_features=args.features, seed=args.seed)
+
+    print(f"{'stage':<32} {'min (s)':>10} {'median (s)':>11}")
+    for name, stage in report['stages'].items():
+        print(f"{name:<32} {stage['min']:>10.4f} {stage['median']:>11.4f}")
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to: {args.output}")
@@ -0,0 +1,71 @@
+'''
+Time and tail fidelity of scenario reduction: J fat tailed scenarios are reduced to K with
+each method, then the LP over the K representatives is solved. For each method the report
+gives the reduction and solve times, the CVaR error on the test portfolios (cvar_error) and
+the CVaR of the optimal portfolio re-measured on the full sample, against the cvar target.
+With --full, the LP over all J scenarios is solved too, for reference.
+
+Usage: python -m benchmarks.bench_scenario_reduction --scenarios 200000 --reduced 2000
+           --methods kmeans forward [--full]
+'''
+# Standard library imports
+import argparse
+import time
+
+# Third party imports
+import numpy as np
+
+# Local application imports
+from src.scenario_reduction import cvar_error, reduce_scenarios, weighted_cvar
+from src.uryasev_optimization import UryasevOptimization
+
+
+def solve(optimization, sample, density, full_sample, full_density):
+    start = time.perf_counter()
+    weights = optimization.get_optimal_portfolio(sample, density).values / 100
+    solve_time = time.perf_counter() - start
+    realized_cvar = weighted_cvar(-(full_sample @ weights)[:, np.newaxis], full_density, optimization.alpha)[0]
+    return solve_time, realized_cvar, full_sample.T.dot(full_density).dot(weights)
+
+
+def run(n_scenarios, n_reduced, methods, n_assets=10, alpha=0.95, cvar=0.15, full=False, seed=0):
+    rng = np.random.default_rng(seed)
+    # student-t asset and market shocks, so the tail matters
+    sample = 0.05 + 0.1 * rng.standard_t(4, (n_scenarios, n_assets)) + 0.05 * rng.standard_t(3, (n_scenarios, 1))
+    density = rng.random(n_scenarios)
+    density /= density.sum()
+    optimization = UryasevOptimization(alpha=alpha, cvar=cvar, bounds=[0.0, 1.0])
+
+    rows = []
+    for method in methods:
+        start = time.perf_counter()
+        reduced_sample, reduced_density = reduce_scenarios(sample, density, n_scenarios=n_reduced, method=method,
+                                                           seed=seed, alpha=alpha)
+        reduce_time = time.perf_counter() - start
+        solve_time, realized_cvar, expected_return = solve(optimization, reduced_sample, reduced_density, sample, density)
+        rows.append({'method': method, 'scenarios': len(reduced_sample), 'reduce_s': reduce_time, 'solve_s': solve_time,
+                     'cvar_error': cvar_error(sample, density, reduced_sample, reduced_density, alpha),
+                     'realized_cvar': realized_cvar, 'expected_return': expected_return})
+    if full:
+        solve_time, realized_cvar, expected_return = solve(optimization, sample, density, sample, density)
+        rows.append({'method': 'full', 'scenarios': n_scenarios, 'reduce_s': 0.0, 'solve_s': solve_time,
+                     'cvar_error': 0.0, 'realized_cvar': realized_cvar, 'expected_return': expected_return})
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', type=int, default=200000)
+    parser.add_argument('--reduced', type=int, default=2000)
+    parser.add_argument('--methods', nargs='+', default=['kmeans', 'forward'])
+    parser.add_argument('--assets', type=int, default=10)
+    parser.add_argument('--cvar', type=float, default=0.15)
+    parser.add_argument('--full', action='store_true', help='also solve the LP over every scenario')
+    args = parser.parse_args()
+
+    rows = run(args.scenarios, args.reduced, args.methods, n_assets=args.assets, cvar=args.cvar, full=args.full)
+    print(f"{'method':>8} {'K':>7} {'reduce (s)':>11} {'solve (s)':>10} {'cvar error':>11} {'realized cvar':>14} {'return':>8}")
+    for row in rows:
+        print(f"{row['method']:>8} {row['scenarios']:>7} {row['reduce_s']:>11.2f} {row['solve_s']:>10.2f} "
+              f"{row['cvar_error']:>11.4f} {row['realized_cvar']:>14.4f} {row['expected_return']:>8.4f}")
+    print(f"cvar target: {args.cvar}")
@@ -0,0 +1,77 @@
+'''
+Build and solve time of Uryasev's LP as the number of scenarios J grows.
+
+With --dates, also compares solving that many problems of each size one after another
+against a single block-diagonal LP (UryasevOptimization.get_optimal_portfolios).
+
+Usage: python -m benchmarks.bench_uryasev --sizes 500 5000 50000 --assets 10 [--dates 15]
+'''
+# Standard library imports
+import argparse
+import time
+
+# Third party imports
+import numpy as np
+from scipy.optimize import linprog
+
+# Local application imports
+from src.uryasev_optimization import UryasevOptimization
+
+
+def run(sizes, n_assets, alpha, cvar, seed=0):
+    rng = np.random.default_rng(seed)
+    optimization = UryasevOptimization(alpha=alpha, cvar=cvar, bounds=[0.0, 1.0])
+    rows = []
+    for J in sizes:
+        sample = rng.normal(0.05, 0.15, size=(J, n_assets))
+        density = rng.random(J)
+        density /= density.sum()
+
+        start = time.perf_counter()
+        c, A, b, v = optimization.build_problem(sample, density)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = linprog(c, A_ub=A, b_ub=b, bounds=v, method='highs')
+        solve_time = time.perf_counter() - start
+
+        rows.append({'J': J, 'nnz': A.nnz, 'build_s': build_time, 'solve_s': solve_time, 'status': result.status})
+    return rows
+
+
+def run_batch(sizes, n_assets, n_dates, alpha, cvar, seed=0):
+    rng = np.random.default_rng(seed)
+    optimization = UryasevOptimization(alpha=alpha, cvar=cvar, bounds=[0.0, 1.0])
+    rows = []
+    for J in sizes:
+        problems = []
+        for _ in range(n_dates):
+            density = rng.random(J)
+            problems.append((rng.normal(0.05, 0.15, size=(J, n_assets)), density / density.sum()))
+        row = {'J': J}
+        for mode in ('sequential', 'block'):
+            start = time.perf_counter()
+            optimization.get_optimal_portfolios(problems, mode=mode)
+            row[mode] = time.perf_counter() - start
+        rows.append(row)
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 2000, 10000, 50000])
+    parser.add_argument('--assets', type=int, default=10)
+    parser.add_argument('--alpha', type=float, default=0.95)
+    parser.add_argument('--cvar', type=float, default=0.05)
+    parser.add_argument('--dates', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'J':>8} {'nnz':>10} {'build (s)':>10} {'solve (s)':>10} {'status':>7}")
+    for row in run(args.sizes, args.assets, args.alpha, args.cvar):
+        print(f"{row['J']:>8} {row['nnz']:>10} {row['build_s']:>10.4f} {row['solve_s']:>10.4f} {row['status']:>7}")
+
+    if args.dates:
+        print(f"\n{args.dates} problems per size")
+        print(f"{'J':>8} {'sequential (s)':>15} {'block (s)':>10}")
+        for row in run_batch(args.sizes, args.assets, args.dates, args.alpha, args.cvar):
+            print(f"{row['J']:>8} {row['sequential']:>15.4f} {row['block']:>10.4f}")
@@ -9,7 +9,6 @@ warnings.filterwarnings("ignore", category=UserWarning, module="joblib")
 # Local application imports
 from src.backtester import Backtester
 from src.utils import load_data
-from src.visualization import PortfolioVisualizer
 from src.progress_display import HackerProgressDisplay
 
 # Initialize progress display and show header
@@ -26,8 +25,38 @@ backtester = Backtester(
                         rebalance_dates=rebalance_dates,
                         features=features)
 
+if config.get('generate_multiple_backstests', False):
+    # Sweep every (alpha, cvar) pair of the config and store the frontier portfolios
+    frontier = backtester.run_frontier()
+    frontier_path = config.get('frontier_path', './frontier_portfolios.csv')
+    frontier.to_csv(frontier_path, index=False)
+    if config.get('trace', False):
+        backtester.tracer.export(config.get('trace_path', './cache/trace.jsonl'))
+    print(f"CVaR frontier with {len(frontier)} portfolios saved to: {frontier_path}")
+    progress.print_footer()
+    raise SystemExit(0)
+
 backtests = backtester.run_backtests()
 
+if config.get('trace', False):
+    trace_path = config.get('trace_path', './cache/trace.jsonl')
+    backtester.tracer.export(trace_path)
+    print(f"Trace saved to: {trace_path}")
+
+# Start rendering the charts in the background, so they are drawn while results are printed
+charts = None
+if config.get('create_visualizations', False):
+    # matplotlib is only loaded by runs that plot
+    from src.visualization import PortfolioVisualizer
+
+    asset_names = asset_prices.columns.tolist()
+    visualizer = PortfolioVisualizer(backtests, asset_names)
+    charts = visualizer.render_dashboard(save_path="./charts",
+                                         fmt=config.get('chart_format', 'png'),
+                                         dpi=config.get('chart_dpi', 300),
+                                         n_jobs=config.get('chart_jobs', 1),
+                                         background=True)
+
 # Print formatted results using progress display
 progress.print_results_header()
 
@@ -36,17 +65,28 @@ for model_name, results in backtests.items():
         'return': f"{results['annualized_return']:.2f}%",
         'cvar': f"{results['cvar_expost']:.2f}%", 
         'hhi': f"{results['mean_hhi']:.4f}",
-        'rotation': f"{results['mean_rotation']:.4f}"
+        'rotation': f"{results['mean_rotation']:.4f}",
+        'max_drawdown': f"{results['max_drawdown']:.2f}%",
+        'sortino': f"{results['sortino']:.2f}"
     }
     progress.print_model_results(model_name, metrics)
 
-# Create visualizations if enabled
-if config.get('create_visualizations', False):
-    asset_names = asset_prices.columns.tolist()
-    visualizer = PortfolioVisualizer(backtests, asset_names)
+if config.get('robustness', False):
+    from src.robustness import compare_models, summarize
+
+    # metric distributions over bootstrapped price histories, with every model on the same paths
+    distributions = backtester.run_robustness(backtests)
+    robustness_path = config.get('robustness_path', './robustness_paths.csv')
+    distributions.to_csv(robustness_path, index=False)
+    confidence = config.get('bootstrap_confidence', 0.95)
+    print(f"\n{summarize(distributions, confidence=confidence).to_string(index=False)}")
+    if 'historical' in backtests and len(backtests) > 1:
+        print(f"\n{compare_models(distributions, baseline='historical', confidence=confidence).to_string(index=False)}")
+    print(f"Bootstrapped metrics saved to: {robustness_path}")
 
-    # Create comprehensive dashboard
-    visualizer.create_summary_dashboard(save_path="./charts")
+# Wait for the dashboard
+if charts is not None:
+    charts.result()
     progress.print_visualization_status("./charts")
 
 # Print completion footer
@@ -1,13 +1,24 @@
+# Standard library imports
+import inspect
+from concurrent.futures import ProcessPoolExecutor
+
 # Third party imports
+import numpy as np
 import pandas as pd
 
 # Local imports
-from src.generators.historical_generator import HistoricalGenerator
-from src.generators.gan_generator import CTGANGenerator
-from src.metrics import compute_annualized_return, compute_cvar, compute_mean_hhi, compute_mean_rotation
+from src.generators.registry import get_generator_class
+from src.metrics import compute_annualized_return, compute_cvar, compute_daily_risk, compute_mean_hhi, compute_mean_rotation
 from src.uryasev_optimization import UryasevOptimization
-from src.utils import zscore_euclidean
+from src.performance import backtest_weights, stack_weights
+from src.executor import SerialExecutor, cell_seed, get_executor, name_key, run_cells
+from src.sample_cache import SampleCache, data_fingerprint
+from src.tracing import Tracer, span
+from src.utils import feature_density
+from src.window_index import WindowIndex
 from src.progress_display import HackerProgressDisplay
+from src.robustness import BlockBootstrap
+from src.scenario_reduction import cvar_error, reduce_scenarios
 
 
 class Backtester():
@@ -21,169 +32,433 @@ class Backtester():
         self.rebalance_dates = rebalance_dates
         self.features = features
         self.progress = HackerProgressDisplay()
+        # the progress display reads the same phase and cell events the tracer records
+        self.tracer = Tracer(enabled=config.get('trace', False), trace_memory=config.get('trace_memory', False))
+        self.tracer.subscribe(self.progress.on_event)
         self.lookback_years = config['lookback_years']
+        self.window_index = WindowIndex(asset_returns, features=features, lookback_years=self.lookback_years)
         self.generators = self._instanciate_generators(config['model_names'])
         self.cvar = config['cvar']
         self.alpha = config['alpha']
         self.bounds = config['bounds']
         self.backtest_name = 'default'
+        self.sample_cache = self._instanciate_cache()
+        self.data_fingerprint = None
+        # CVaR error of every reduced (date, model) sample, see _prepare_sample
+        self.reduction_errors = {}
 
     def run_backtests(self, save=False):
         '''
         Runs a backtest and saves it in a json file. The name is for the case the caller runs several backtests.
         '''
+        with self.tracer.activate():
+            # when read_backtest is set, reuse the portfolios optimized over the very same samples
+            in_sample_portfolios = self._read_cached_portfolios() if self.config.get('read_backtest', False) else None
 
-        # first we generate the samples for each rebalance date
-        samples = self.generate_samples()
+            if in_sample_portfolios is None:
+                # streamed cells are independent, turnover aware portfolios are built date after date
+                if self.config.get('stream_samples', False) and not self._optimization().tracks_turnover:
+                    # each sample is optimized as soon as it is generated and released right after
+                    in_sample_portfolios = self.build_streaming_portfolios()
+                else:
+                    # first we generate the samples for each rebalance date
+                    samples = self.generate_samples()
 
-        # we compute the optimizations for each rebalance date and store the portfolio of each model for each date
-        in_sample_portfolios = self.build_in_sample_portfolios(samples, self.rebalance_dates,  self.lookback_years, self.cvar, self.alpha, self.bounds)
-        
-        # we run the performance of the historical portfolios
-        backtests  = self.backtest_portfolios(historical_portfolios=in_sample_portfolios)
-        
-        # we add some interesting metrics for analysis
-        backtests = self.compute_metrics(backtests=backtests)
+                    # we compute the optimizations for each rebalance date and store the portfolio of each model for each date
+                    in_sample_portfolios = self.build_in_sample_portfolios(samples, self.rebalance_dates,  self.lookback_years, self.cvar, self.alpha, self.bounds)
 
-        return backtests
+                if self.config.get('read_backtest', False):
+                    self._write_cached_portfolios(in_sample_portfolios)
+
+            # we run the performance of the historical portfolios
+            backtests  = self.backtest_portfolios(historical_portfolios=in_sample_portfolios)
+
+            # we add some interesting metrics for analysis
+            backtests = self.compute_metrics(backtests=backtests)
+
+            return backtests
+
+    def run_frontier(self):
+        '''
+        Runs the cvar frontier sweep over the alpha_range and cvar_range of the config.
+        Samples are generated once and every grid point reuses them.
+        '''
+        with self.tracer.activate():
+            samples = self.generate_samples()
+            frontier = self.build_frontier_portfolios(samples, self.rebalance_dates, self.config['alpha_range'],
+                                                      self.config['cvar_range'], self.bounds)
+            return frontier
 
     def generate_samples(self):
         '''
         Generates the samples for each rebalance date and for each model.
+        Every (date, model) cell runs on the configured executor with its own seed, and
+        when read_samples is set the sample cache is consulted before generating.
         '''
         total_steps = len(self.rebalance_dates) * len(self.generators)
-        self.progress.start_phase("SAMPLE GENERATION", total_steps)
-        
+        phase = self.tracer.start_phase("SAMPLE GENERATION", total_steps)
+
+        results = {}
+        cells = []
+        sample_cells = self._sample_cells()
+        cache_keys = self._sample_keys(sample_cells) if self.config.get('read_samples', False) else {}
+        cached = {}
+        for key, args in sample_cells:
+            if key in cache_keys:
+                with self.tracer.span("Sample cache lookup", date=key[0], model=key[1]):
+                    cached[key] = self.sample_cache.get(cache_keys[key])
+        incomplete = self._incomplete_chains(sample_cells, cached)
+
+        for key, args in sample_cells:
+            if cached.get(key) is not None and key[1] not in incomplete:
+                # a hit completes its cell here, a miss is counted when its generation finishes
+                with self.tracer.span("Loading cached scenarios", category='cell', date=key[0], model=key[1]):
+                    results[key] = cached[key]
+                continue
+            cells.append((key, args))
+        del cached
+
+        # generators that carry state from one date to the next run in date order on the calling process
+        sequential_cells = [cell for cell in cells if getattr(cell[1][0], 'sequential', False)]
+        parallel_cells = [cell for cell in cells if not getattr(cell[1][0], 'sequential', False)]
+
         # for each date and model we generate samples and store them in a dictionary
+        traced = {'tracer': self.tracer, 'name': "Generating scenarios"}
+        with self._get_executor() as executor:
+            generated = run_cells(executor, _generate_cell, parallel_cells, **traced)
+        generated.update(run_cells(SerialExecutor(), _generate_cell, sequential_cells, **traced))
+
+        for key, sample in generated.items():
+            if key in cache_keys:
+                self.sample_cache.put(cache_keys[key], sample)
+        results.update(generated)
+
         samples = {}
         for rebalance_date in self.rebalance_dates:
-        
-            start_date, end_date = self._get_start_end_dates(rebalance_date)
-            samples[rebalance_date] = {}
+            samples[rebalance_date] = {generator.name: results[(rebalance_date, generator.name)]
+                                       for generator in self.generators}
 
-            for generator in self.generators:
-                self.progress.update_progress(
-                    current_date=rebalance_date, 
-                    model_name=generator.name,
-                    sub_task="Generating scenarios"
-                )
-                sample = generator.generate_sample(sample_size=self.config['sample_size'],
-                                                start_date=start_date,
-                                                end_date=end_date)
-                samples[rebalance_date][generator.name] = sample
-
-        self.progress.complete_phase()
+        phase.end()
         return samples
 
+    def build_streaming_portfolios(self):
+        '''
+        Generates and optimizes each (date, model) cell in one go. Only the optimal portfolio
+        leaves the cell, so peak memory holds a single sample per worker whatever the number
+        of rebalance dates, and CTGAN samples can be drawn in chunks and spilled to disk.
+        '''
+        total_steps = len(self.rebalance_dates) * len(self.generators)
+        phase = self.tracer.start_phase("STREAMING GENERATION + OPTIMIZATION", total_steps)
+
+        uryasev_optimization = self._optimization()
+        n_assets = len(self.asset_returns.columns)
+        settings = self._sample_settings()
+
+        # cells only carry their generator, the optimizer and the arrays of their date, never the backtester
+        cells = []
+        sample_cells = self._sample_cells()
+        # cache keys are computed here, so workers don't fingerprint the data
+        cache_keys = self._sample_keys(sample_cells) if self.config.get('read_samples', False) else {}
+        # only the chains of sequential models need checking before the cells read the cache
+        sequential = self._sequential_models()
+        incomplete = self._incomplete_chains(sample_cells, {key: self.sample_cache.get(cache_key)
+                                                            for key, cache_key in cache_keys.items() if key[1] in sequential})
+        for key, args in sample_cells:
+            cells.append((key, (uryasev_optimization, n_assets, self._spot_feature(key[0]), settings,
+                                self.sample_cache, cache_keys.get(key), key[1] not in incomplete) + args))
+        sequential_cells = [cell for cell in cells if getattr(cell[1][7], 'sequential', False)]
+        parallel_cells = [cell for cell in cells if not getattr(cell[1][7], 'sequential', False)]
+
+        traced = {'tracer': self.tracer, 'name': "Sampling + CVaR optimization"}
+        with self._get_executor() as executor:
+            if isinstance(executor, ProcessPoolExecutor):
+                # cells pickled to workers ship a generator holding their window only, not the whole history
+                parallel_cells = [(key, args[:7] + (args[7].for_window(args[9], args[10]),) + args[8:])
+                                  for key, args in parallel_cells]
+            results = run_cells(executor, _stream_cell, parallel_cells, **traced)
+        results.update(run_cells(SerialExecutor(), _stream_cell, sequential_cells, **traced))
+
+        # reduction errors come back with the portfolios, workers can't record them on this backtester
+        for key, (_, reduction_error) in results.items():
+            if reduction_error is not None:
+                self.reduction_errors[key] = reduction_error
+
+        portfolios = {}
+        for model in self.generators:
+            model_portfolios = pd.DataFrame(columns=self.asset_returns.columns)
+            for rebalance_date in self.rebalance_dates:
+                portfolio = results[(rebalance_date, model.name)][0]
+                portfolio.index = self.asset_returns.columns
+                model_portfolios.loc[rebalance_date] = portfolio
+            portfolios[model.name] = model_portfolios
+
+        phase.end()
+        return portfolios
+
+    def _sample_cells(self):
+        '''
+        Lists the (date, model) cells of the sample generation with the arguments of each generator call.
+        '''
+        cells = []
+        for date_index, rebalance_date in enumerate(self.rebalance_dates):
+            start_date, end_date = self._get_start_end_dates(rebalance_date)
+            for generator in self.generators:
+                # keyed by the model name, so a model draws the same sample whatever models run with it
+                seed = cell_seed(self.config.get('seed'), date_index, name_key(generator.name))
+                args = (generator, self.config['sample_size'], start_date, end_date, seed)
+                cells.append(((rebalance_date, generator.name), args))
+        return cells
+
+    def _sample_keys(self, sample_cells):
+        '''
+        Sample cache key of every (date, model) cell. The sample of a generator carrying state from
+        one date to the next, such as a warm started CTGAN, depends on every date before it, so its
+        keys are chained: each one includes the key of the previous date of that model.
+        '''
+        keys = {}
+        previous = {}
+        for key, args in sample_cells:
+            generator = args[0]
+            chain = previous.get(generator.name) if getattr(generator, 'sequential', False) else None
+            keys[key] = previous[generator.name] = self._sample_key(*args, previous=chain)
+        return keys
+
+    def _sequential_models(self):
+        return {generator.name for generator in self.generators if getattr(generator, 'sequential', False)}
+
+    def _incomplete_chains(self, sample_cells, cached):
+        '''
+        Sequential models with a date missing from the cache. Their state is built by training on
+        every date in order, so a hit can't stand in for a date and all their dates are generated again.
+        '''
+        sequential = self._sequential_models()
+        return {key[1] for key, _ in sample_cells if key[1] in sequential and cached.get(key) is None}
+
+    def _sample_key(self, generator, sample_size, start_date, end_date, seed, previous=None):
+        # hardware and logging settings don't change the sample, and without a run seed any draw is reusable
+        params = {k: v for k, v in getattr(generator, 'params', {}).items() if k not in ('cuda', 'verbose')}
+        warm_start = getattr(generator, 'warm_start', False)
+        return self.sample_cache.key(generator=generator.name,
+                                     params=params,
+                                     warm_start=warm_start,
+                                     warm_start_epochs=getattr(generator, 'warm_start_epochs', None) if warm_start else None,
+                                     embedding=getattr(generator, 'embedding', None),
+                                     fast_sampling=getattr(generator, 'fast_sampling', False),
+                                     normalizer_method=getattr(generator, 'normalizer_method', None),
+                                     # chunked draws consume the random streams differently from a single draw
+                                     chunk_size=getattr(generator, 'chunk_size', None),
+                                     sample_size=sample_size,
+                                     start_date=start_date,
+                                     end_date=end_date,
+                                     data=self._get_data_fingerprint(),
+                                     seed=seed if self.config.get('seed') is not None else None,
+                                     previous=previous)
+
+    def _portfolios_key(self, model_name, sample_keys):
+        return self.sample_cache.key(stage='portfolios',
+                                     model=model_name,
+                                     samples=sample_keys,
+                                     cvar=self.cvar,
+                                     alpha=self.alpha,
+                                     bounds=self.bounds,
+                                     reduction=[self.config.get('scenario_reduction'),
+                                                self.config.get('reduced_scenarios', 2000),
+                                                self.config.get('reduction_chunk_size', 2000)],
+                                     turnover=[self.config.get('turnover_penalty', 0.0),
+                                               self.config.get('max_turnover'),
+                                               self.config.get('min_lot')],
+                                     density=[self.config.get('density_kernel', 'inverse'),
+                                              self.config.get('density_bandwidth', 1.0),
+                                              self.config.get('density_top_k')])
+
+    def _read_cached_portfolios(self):
+        sample_keys = self._sample_keys(self._sample_cells())
+        portfolios = {}
+        for model in self.generators:
+            model_keys = [sample_keys[(rebalance_date, model.name)] for rebalance_date in self.rebalance_dates]
+            weights = self.sample_cache.get(self._portfolios_key(model.name, model_keys))
+            if weights is None:
+                return None
+            portfolios[model.name] = pd.DataFrame(weights, index=self.rebalance_dates, columns=self.asset_returns.columns)
+        return portfolios
+
+    def _write_cached_portfolios(self, portfolios):
+        sample_keys = self._sample_keys(self._sample_cells())
+        for model in self.generators:
+            model_keys = [sample_keys[(rebalance_date, model.name)] for rebalance_date in self.rebalance_dates]
+            weights = portfolios[model.name].values.astype(float)
+            self.sample_cache.put(self._portfolios_key(model.name, model_keys), weights)
+
+    def _get_data_fingerprint(self):
+        if self.data_fingerprint is None:
+            self.data_fingerprint = data_fingerprint(self.asset_returns, self.features)
+        return self.data_fingerprint
+
     def _get_start_end_dates(self, rebalance_date):
-        if self.features is None:
-            end_date = rebalance_date
-            start_date =  self.asset_returns[self.asset_returns.index<=end_date].resample('Y').last().index[-1*self.lookback_years-1]
-        else:
-            # this one is hard coded, won't work if we decide to change from 365 returns
-            end_date = self.asset_returns[self.asset_returns.index<=rebalance_date].resample('Y').last().index[-2]
-            start_date =  self.asset_returns[self.asset_returns.index<=end_date].resample('Y').last().index[-1*self.lookback_years-1]
-        
-        return start_date, end_date
+        # the yearly anchors are precomputed once, see WindowIndex
+        return self.window_index.get_start_end_dates(rebalance_date)
 
     def build_in_sample_portfolios(self, samples, rebalance_dates, lookback_years, cvar, alpha, bounds):
         '''
         Given the samples, runs a uryasev optimisation for each rebalance date and model.
         '''
+        # initialize optimitazion object
+        uryasev_optimization = self._optimization(alpha=alpha, cvar=cvar, bounds=bounds)
+        # turnover aware portfolios start from the previous one, so each model is solved in date order
+        if self.config.get('batch_optimization', False) or uryasev_optimization.tracks_turnover:
+            return self._build_batched_portfolios(samples, rebalance_dates, uryasev_optimization)
+
         total_steps = len(self.generators) * len(rebalance_dates)
-        self.progress.start_phase("PORTFOLIO OPTIMIZATION", total_steps)
+        phase = self.tracer.start_phase("PORTFOLIO OPTIMIZATION", total_steps)
+
+        cells = []
+        for model in self.generators:
+            for rebalance_date in rebalance_dates:
+                sample_assets, density = self._prepare_sample(samples[rebalance_date][model.name], rebalance_date, model.name)
+                cells.append(((rebalance_date, model.name), (uryasev_optimization, sample_assets, density)))
 
-        # initialize optimitazion object
-        uryasev_optimization = UryasevOptimization(alpha=alpha, cvar=cvar, bounds=bounds)
-        portfolios = {}
         # for each date and model run an optimization problem
+        with self._get_executor() as executor:
+            results = run_cells(executor, _optimize_cell, cells, tracer=self.tracer, name="CVaR optimization")
+
+        portfolios = {}
         for model in self.generators:
-            portfolios[model.name] = {}
             model_portfolios = pd.DataFrame(columns=self.asset_returns.columns)
             for rebalance_date in rebalance_dates:
-                self.progress.update_progress(
-                    current_date=rebalance_date,
-                    model_name=model.name,
-                    sub_task="CVaR optimization"
-                )
-                sample = samples[rebalance_date][model.name]
-                if self.features is not None:
-                    density = self.compute_density(sample, rebalance_date)
-                    sample_columns = self.asset_returns.columns.tolist() + self.features.columns.tolist()
-                else:
-                    density = None
-                    sample_columns = self.asset_returns.columns.tolist()
-                
-                sample_assets = pd.DataFrame(sample, columns=sample_columns)[self.asset_returns.columns].values
-                portfolio = uryasev_optimization.get_optimal_portfolio(sample=sample_assets, density=density)
+                portfolio = results[(rebalance_date, model.name)]
                 portfolio.index = self.asset_returns.columns
                 model_portfolios.loc[rebalance_date] = portfolio
-                portfolios[model.name] = model_portfolios
+            portfolios[model.name] = model_portfolios
+
+        phase.end()
+        return portfolios
+
+    def _build_batched_portfolios(self, samples, rebalance_dates, uryasev_optimization):
+        '''
+        Solves every rebalance date of a model in a single batch, one executor task per model.
+        '''
+        phase = self.tracer.start_phase("BATCHED PORTFOLIO OPTIMIZATION", len(self.generators))
+
+        problems = {}
+        for model in self.generators:
+            problems[model.name] = [self._prepare_sample(samples[rebalance_date][model.name], rebalance_date, model.name)
+                                    for rebalance_date in rebalance_dates]
+        mode = 'sequential' if uryasev_optimization.tracks_turnover else self.config.get('batch_mode', 'sequential')
+        growth = self._rebalance_growth(rebalance_dates)
+        batch_cells = [((None, model_name), (uryasev_optimization, model_problems, rebalance_dates, mode, growth))
+                       for model_name, model_problems in problems.items()]
 
-        self.progress.complete_phase()
+        with self._get_executor() as executor:
+            results = run_cells(executor, _optimize_batch_cell, batch_cells,
+                                tracer=self.tracer, name=f"Batched CVaR optimization ({mode})")
+
+        portfolios = {}
+        for model in self.generators:
+            model_portfolios = results[(None, model.name)]
+            model_portfolios.columns = self.asset_returns.columns
+            portfolios[model.name] = model_portfolios
+
+        phase.end()
         return portfolios
-    
+
+    def build_frontier_portfolios(self, samples, rebalance_dates, alpha_range, cvar_range, bounds):
+        '''
+        Given the samples, solves the cvar frontier for each rebalance date and model.
+        Returns a tidy table with one row per date, model, alpha and cvar.
+        '''
+        total_steps = len(self.generators) * len(rebalance_dates)
+        phase = self.tracer.start_phase("CVAR FRONTIER OPTIMIZATION", total_steps)
+
+        uryasev_optimization = self._optimization(alpha=alpha_range[0], cvar=cvar_range[0], bounds=bounds)
+        cells = []
+        for model in self.generators:
+            for rebalance_date in rebalance_dates:
+                sample_assets, density = self._prepare_sample(samples[rebalance_date][model.name], rebalance_date, model.name)
+                args = (uryasev_optimization, sample_assets, density, alpha_range, cvar_range)
+                cells.append(((rebalance_date, model.name), args))
+
+        sub_task = f"CVaR frontier ({len(alpha_range) * len(cvar_range)} points)"
+        with self._get_executor() as executor:
+            results = run_cells(executor, _frontier_cell, cells, tracer=self.tracer, name=sub_task)
+
+        frontiers = []
+        for model in self.generators:
+            for rebalance_date in rebalance_dates:
+                frontier = results[(rebalance_date, model.name)]
+                frontier.columns = ['alpha', 'cvar'] + self.asset_returns.columns.tolist()
+                frontier.insert(0, 'model', model.name)
+                frontier.insert(0, 'date', rebalance_date)
+                frontiers.append(frontier)
+
+        phase.end()
+        return pd.concat(frontiers, ignore_index=True)
+
+    def _prepare_sample(self, sample, rebalance_date, model_name=None):
+        '''
+        Splits a sample into its asset returns and, when features are used, its scenario density,
+        and reduces its scenarios when scenario_reduction is set, see _prepare_arrays. The CVaR
+        error of a reduction is recorded under the (date, model) cell.
+        '''
+        sample_assets, density, reduction_error = _prepare_arrays(sample, len(self.asset_returns.columns),
+                                                                  self._spot_feature(rebalance_date),
+                                                                  self._sample_settings())
+        if reduction_error is not None:
+            self.reduction_errors[(rebalance_date, model_name)] = reduction_error
+        return sample_assets, density
+
     def compute_density(self, sample, rebalance_date):
-        columns = self.asset_returns.columns.tolist() + self.features.columns.tolist()
-        sampled_features = pd.DataFrame(sample, columns=columns)[self.features.columns]
-        spot_feature = self.features.loc[rebalance_date]
-        # use zscore normalized euclidean
-        distances = 1 / zscore_euclidean(spot_feature, sampled_features)
-        density = distances / distances.sum()
-        
-        
-        return density.values
+        return _density(sample, len(self.asset_returns.columns), self._spot_feature(rebalance_date),
+                        self._sample_settings())
+
+    def _spot_feature(self, rebalance_date):
+        return None if self.features is None else self.features.loc[rebalance_date].values
 
+    def _sample_settings(self):
+        '''
+        Density and reduction settings of _prepare_arrays, small enough to ship with every cell.
+        '''
+        return {'density_kernel': self.config.get('density_kernel', 'inverse'),
+                'density_bandwidth': self.config.get('density_bandwidth', 1.0),
+                'density_top_k': self.config.get('density_top_k'),
+                'scenario_reduction': self.config.get('scenario_reduction'),
+                'reduced_scenarios': self.config.get('reduced_scenarios', 2000),
+                'reduction_chunk_size': self.config.get('reduction_chunk_size', 2000),
+                'seed': self.config.get('seed'),
+                'alpha': self.alpha}
 
     def backtest_portfolios(self, historical_portfolios):
         '''
         Given a historical portfolio and the total returns, computes the performance backtest.
         Uses proper annual rebalancing: calculates returns between rebalancing periods.
+        All models are computed at once on their stacked weights, see src.performance.
         '''
         total_steps = len(self.generators)
-        self.progress.start_phase("PERFORMANCE CALCULATION", total_steps)
-        
+        phase = self.tracer.start_phase("PERFORMANCE CALCULATION", total_steps)
+
+        model_names = [model.name for model in self.generators]
+        columns = self.asset_prices.columns
+        dates = historical_portfolios[model_names[0]].index
+        weights = stack_weights(historical_portfolios, model_names, columns)
+        daily = self.config.get('daily_mark_to_market', False)
+        with self.tracer.span('backtest_weights', models=len(model_names)):
+            performance = backtest_weights(weights, self.asset_prices, dates, daily=daily)
+
         backtests = {}
-        for model in self.generators:
-            self.progress.update_progress(
-                model_name=model.name,
-                sub_task="Computing returns"
-            )
-            backtests[model.name] = {}
-            portfolios = historical_portfolios[model.name]
-            
-            # Convert portfolio weights from percentage to fractional
-            portfolios_frac = portfolios / 100
-            
-            # Calculate portfolio performance using period returns between rebalancing dates
-            portfolio_values = pd.Series(index=portfolios.index, dtype=float)
-            portfolio_values.iloc[0] = 100  # Starting value of 100
-            
-            for i in range(len(portfolios.index) - 1):
-                current_date = portfolios.index[i]
-                next_date = portfolios.index[i + 1]
-                
-                # Get asset prices at start and end of period
-                start_prices = self.asset_prices.loc[current_date]
-                end_prices = self.asset_prices.loc[next_date]
-                
-                # Calculate period returns for each asset
-                period_returns = (end_prices / start_prices) - 1
-                
-                # Apply portfolio weights to get portfolio return for this period
-                portfolio_weights = portfolios_frac.loc[current_date]
-                portfolio_return = (portfolio_weights * period_returns).sum()
-                
-                
-                # Calculate portfolio value at end of period
-                portfolio_values.iloc[i + 1] = portfolio_values.iloc[i] * (1 + portfolio_return)
-            
-            backtests[model.name]['total_return_serie'] = portfolio_values
-            backtests[model.name]['portfolios'] = portfolios
-        
-        self.progress.complete_phase()
+        for i, name in enumerate(model_names):
+            with self.tracer.span("Computing returns", category='cell', model=name):
+                backtests[name] = {}
+                backtests[name]['total_return_serie'] = pd.Series(performance['values'][i], index=dates)
+                backtests[name]['portfolios'] = historical_portfolios[name]
+                backtests[name]['hhi_serie'] = pd.Series(performance['hhi'][i], index=dates)
+                # rotation is reported in percentage points, like the portfolios
+                backtests[name]['rotation_serie'] = pd.Series(100 * performance['rotation'][i], index=dates[1:])
+                if daily:
+                    backtests[name]['daily_value_serie'] = pd.Series(performance['daily_values'][i],
+                                                                     index=performance['daily_index'])
+
+        phase.end()
         return backtests
-    
+
     def compute_metrics(self, backtests):
         '''
         Calculates some ex post metrics.
@@ -195,16 +470,178 @@ class Backtester():
             backtests[model.name]['cvar_expost'] = compute_cvar(serie, tf=self.config['returns_timeframe'])
             backtests[model.name]['mean_hhi'] = compute_mean_hhi(portfolios)
             backtests[model.name]['mean_rotation'] = compute_mean_rotation(portfolios)
-        
+
+        # worst CVaR error of the scenario reduction over the dates, when samples were reduced in this process
+        for name in [model.name for model in self.generators]:
+            errors = [error for (_, model_name), error in self.reduction_errors.items() if model_name == name]
+            if errors:
+                backtests[name]['reduction_cvar_error'] = 100 * max(errors)
+
+        # daily risk of every model at once, from the values drifting with prices between rebalances
+        model_names = [model.name for model in self.generators]
+        columns = self.asset_prices.columns
+        dates = backtests[model_names[0]]['portfolios'].index
+        weights = stack_weights({name: backtests[name]['portfolios'] for name in model_names}, model_names, columns)
+        with self.tracer.span('daily_risk', models=len(model_names)):
+            risk = compute_daily_risk(weights, self.asset_prices, dates,
+                                      periods_per_year=self.config['returns_timeframe'],
+                                      window=self.config.get('risk_window', 365),
+                                      step=self.config.get('risk_step', 7),
+                                      cost_bps=self.config.get('transaction_cost_bps', 10))
+        daily_index = risk['daily_index']
+        for i, name in enumerate(model_names):
+            for metric in ('max_drawdown', 'daily_cvar', 'sortino', 'turnover_cost', 'tracking_error'):
+                backtests[name][metric] = risk[metric][i]
+            backtests[name]['drawdown_serie'] = pd.Series(risk['drawdowns'][i], index=daily_index)
+            backtests[name]['rolling_cvar_serie'] = pd.Series(risk['rolling_cvar'][i], index=risk['rolling_cvar_index'])
+            backtests[name]['turnover_serie'] = pd.Series(100 * risk['turnover'][i], index=dates[1:])
+
         return backtests
 
+    def run_robustness(self, backtests):
+        '''
+        Backtests the portfolios of every model over bootstrap_paths block bootstrapped price
+        histories and returns one row per path and model with its metrics, see src.robustness.
+        '''
+        bootstrap = BlockBootstrap(self.asset_prices,
+                                   n_paths=self.config.get('bootstrap_paths', 500),
+                                   mean_block=self.config.get('bootstrap_block_days', 30),
+                                   chunk_size=self.config.get('bootstrap_chunk_size', 50),
+                                   seed=self.config.get('seed', 42))
+        historical_portfolios = {model.name: backtests[model.name]['portfolios'] for model in self.generators}
+        with self.tracer.activate(), self._get_executor() as executor:
+            return bootstrap.run(historical_portfolios, executor, tracer=self.tracer)
+
+    def _optimization(self, alpha=None, cvar=None, bounds=None):
+        '''
+        Uryasev problem with the turnover and lot settings of the config.
+        '''
+        return UryasevOptimization(alpha=self.alpha if alpha is None else alpha,
+                                   cvar=self.cvar if cvar is None else cvar,
+                                   bounds=self.bounds if bounds is None else bounds,
+                                   turnover_penalty=self.config.get('turnover_penalty', 0.0),
+                                   max_turnover=self.config.get('max_turnover'),
+                                   min_lot=self.config.get('min_lot'))
+
+    def _rebalance_growth(self, rebalance_dates):
+        '''
+        Price ratio of every asset since the previous rebalance date, None for the first date.
+        '''
+        prices = self.asset_prices[self.asset_returns.columns].reindex(pd.DatetimeIndex(rebalance_dates)).values
+        return [None] + list(prices[1:] / prices[:-1])
+
+    def _get_executor(self):
+        return get_executor(backend=self.config.get('executor', 'serial'), n_jobs=self.config.get('n_jobs', 1))
+
+    def _instanciate_cache(self):
+        if not (self.config.get('read_samples', False) or self.config.get('read_backtest', False)):
+            return None
+        return SampleCache(cache_dir=self.config.get('samples_cache_path', './cache/samples'),
+                           max_bytes=_megabytes(self.config.get('samples_cache_max_mb')))
+
+    def _generator_kwargs(self, model_name, generator_class):
+        # settings of any model can be set under generator_params, e.g. {"fhs": {"decay": 0.97}}
+        kwargs = dict(self.config.get('generator_params', {}).get(model_name, {}))
+        accepted = inspect.signature(generator_class).parameters
+        unknown = [name for name in kwargs if name not in accepted or name in ('asset_returns', 'features', 'window_index')]
+        if unknown and 'params' in accepted:
+            # the underlying model's own settings, e.g. CTGAN's epochs, go through params
+            kwargs['params'] = dict(kwargs.get('params') or {}, **{name: kwargs.pop(name) for name in unknown})
+        elif unknown:
+            raise ValueError(f"Unknown generator_params for {model_name}: {unknown}, expected some of "
+                             f"{[name for name in accepted if name not in ('asset_returns', 'features', 'window_index')]}")
+        if model_name == 'CTGAN':
+            kwargs.update({'normalizer_method': self.config.get('normalizer_method', 'quantile'),
+                           'warm_start': self.config.get('ctgan_warm_start', False),
+                           'warm_start_epochs': self.config.get('ctgan_warm_start_epochs'),
+                           'embedding': self.config.get('ctgan_embedding', 'tsne'),
+                           'preprocessing_cache_path': self.config.get('preprocessing_cache_path'),
+                           'preprocessing_cache_max_bytes': _megabytes(self.config.get('preprocessing_cache_max_mb')),
+                           'seeded': self.config.get('seed') is not None,
+                           'chunk_size': self.config.get('sample_chunk_size'),
+                           'spill_dir': self.config.get('spill_dir'),
+                           'fast_sampling': self.config.get('ctgan_fast_sampling', False)})
+        return kwargs
+
     def _instanciate_generators(self, model_names):
         generators = []
-        if 'historical' in model_names:
-            historical_generator = HistoricalGenerator(asset_returns=self.asset_returns, features=self.features)
-            generators.append(historical_generator)
-        if 'CTGAN' in model_names:
-            ctgan_generator = CTGANGenerator(asset_returns=self.asset_returns, features=self.features)
-            generators.append(ctgan_generator)
-
-        return generators
\ No newline at end of file
+        # unknown names raise instead of silently leaving a model out of the backtest
+        for model_name in dict.fromkeys(model_names):
+            generator_class = get_generator_class(model_name)
+            generators.append(generator_class(asset_returns=self.asset_returns, features=self.features,
+                                              window_index=self.window_index,
+                                              **self._generator_kwargs(model_name, generator_class)))
+        return generators
+
+
+def _megabytes(max_mb):
+    return None if max_mb is None else max_mb * 2**20
+
+
+def _generate_cell(generator, sample_size, start_date, end_date, seed):
+    return generator.generate_sample(sample_size=sample_size, start_date=start_date, end_date=end_date, seed=seed)
+
+
+def _optimize_cell(uryasev_optimization, sample_assets, density):
+    return uryasev_optimization.get_optimal_portfolio(sample=sample_assets, density=density)
+
+
+def _optimize_batch_cell(uryasev_optimization, problems, rebalance_dates, mode, growth=None):
+    return uryasev_optimization.get_optimal_portfolios(problems, index=rebalance_dates, mode=mode, growth=growth)
+
+
+def _frontier_cell(uryasev_optimization, sample_assets, density, alpha_range, cvar_range):
+    return uryasev_optimization.get_frontier(sample=sample_assets, density=density,
+                                             alpha_range=alpha_range, cvar_range=cvar_range)
+
+
+def _stream_cell(uryasev_optimization, n_assets, spot_feature, settings, sample_cache, cache_key, read_cached,
+                 generator, sample_size, start_date, end_date, seed):
+    '''
+    Generates, or reads from the sample cache when a cache_key is given and read_cached is set, and
+    optimizes the sample of a cell. Returns the portfolio and the CVaR error of the scenario reduction, if any.
+    '''
+    sample = sample_cache.get(cache_key) if cache_key is not None and read_cached else None
+    if sample is None:
+        sample = generator.generate_sample(sample_size=sample_size, start_date=start_date, end_date=end_date, seed=seed)
+        if cache_key is not None:
+            sample_cache.put(cache_key, sample)
+
+    sample_assets, density, reduction_error = _prepare_arrays(sample, n_assets, spot_feature, settings)
+    del sample
+    return uryasev_optimization.get_optimal_portfolio(sample=sample_assets, density=density), reduction_error
+
+
+def _prepare_arrays(sample, n_assets, spot_feature, settings):
+    '''
+    Splits a sample into its asset returns and, when a spot_feature is given, its scenario density.
+    Samples hold the asset columns first and the feature columns after them. Scenarios left
+    without weight by a top-k density are dropped, so they don't enlarge the optimization.
+    With scenario_reduction set, the scenarios are then compressed into reduced_scenarios
+    weighted representatives, see src.scenario_reduction, and their CVaR error is returned.
+    '''
+    sample_assets = np.asarray(sample)[:, :n_assets]
+    density = None
+    if spot_feature is not None:
+        with span('density', kernel=settings['density_kernel']):
+            density = _density(sample, n_assets, spot_feature, settings)
+        if settings['density_top_k'] is not None:
+            kept = density > 0
+            sample_assets, density = sample_assets[kept], density[kept]
+
+    method = settings['scenario_reduction']
+    if method is None:
+        return sample_assets, density, None
+    with span('scenario_reduction', method=method, scenarios=len(sample_assets)):
+        reduced_assets, reduced_density = reduce_scenarios(sample_assets, density, n_scenarios=settings['reduced_scenarios'],
+                                                           method=method, chunk_size=settings['reduction_chunk_size'],
+                                                           seed=settings['seed'], alpha=settings['alpha'])
+    reduction_error = cvar_error(sample_assets, density, reduced_assets, reduced_density, alpha=settings['alpha'])
+    return reduced_assets, reduced_density, reduction_error
+
+
+def _density(sample, n_assets, spot_feature, settings):
+    sampled_features = np.asarray(sample)[:, n_assets:n_assets + len(spot_feature)]
+    # by default, the inverse of the zscore normalized euclidean distance
+    return feature_density(sampled_features, spot_feature, kernel=settings['density_kernel'],
+                           bandwidth=settings['density_bandwidth'], top_k=settings['density_top_k'])
@@ -0,0 +1,99 @@
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import hashlib
+import os
+
+import numpy as np
+
+from src.tracing import traced_cell
+
+
+class SerialExecutor():
+    """
+    Runs every task in the calling process, with the same interface as the concurrent.futures executors.
+    """
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        return False
+
+
+def get_executor(backend='serial', n_jobs=1):
+    '''
+    Returns the executor used to schedule the (date, model) cells of a backtest.
+    n_jobs=-1 uses every available core, and a single job always runs serially.
+    '''
+    if n_jobs is None or n_jobs == 0:
+        n_jobs = 1
+    elif n_jobs < 0:
+        n_jobs = os.cpu_count() or 1
+
+    if backend == 'serial' or n_jobs == 1:
+        return SerialExecutor()
+    if backend == 'thread':
+        return ThreadPoolExecutor(max_workers=n_jobs)
+    if backend == 'process':
+        return ProcessPoolExecutor(max_workers=n_jobs)
+    raise ValueError(f"Unknown executor backend: {backend}")
+
+
+def cell_seed(seed, date_index, model_index):
+    '''
+    Derives the seed of a (date, model) cell from the run seed.
+    The seed only depends on the cell position, never on the order cells are scheduled in.
+    '''
+    sequence = np.random.SeedSequence(entropy=seed, spawn_key=(date_index, model_index))
+    return int(sequence.generate_state(1)[0])
+
+
+def name_key(name):
+    '''
+    Stable 32 bit key of a name, used in place of a position in cell_seed so that the stream of
+    a model does not depend on the other models of the run. Python's hash() is salted per process.
+    '''
+    return int.from_bytes(hashlib.sha256(name.encode()).digest()[:4], 'little')
+
+
+def spawn_seeds(seed, n_streams):
+    '''
+    Splits a cell seed into n_streams independent seeds, e.g. one per random number generator a cell uses.
+    '''
+    return [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(n_streams)]
+
+
+def run_cells(executor, fn, cells, on_done=None, tracer=None, name=None):
+    '''
+    Submits fn(*args) for every (key, args) cell and returns the results keyed by cell.
+    on_done(key) is called in the calling process as each cell finishes, whatever the backend.
+    With a tracer, each cell runs in a span called name and the events it records, including
+    those of worker processes, are replayed on the tracer as the cell finishes.
+    '''
+    if tracer is None:
+        futures = {executor.submit(fn, *args): key for key, args in cells}
+    else:
+        settings = tracer.settings()
+        futures = {executor.submit(traced_cell, fn, settings, name or fn.__name__, key, args): key
+                   for key, args in cells}
+    results = {}
+    for future in as_completed(futures):
+        key = futures[future]
+        if tracer is None:
+            results[key] = future.result()
+        else:
+            results[key], events = future.result()
+            tracer.replay(events)
+        if on_done is not None:
+            on_done(key)
+    return results
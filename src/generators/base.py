@@ -0,0 +1,65 @@
+# Standard library imports
+import copy
+
+# Third party imports
+import numpy as np
+
+# Local application imports
+from src.tracing import span
+
+
+class ScenarioGenerator():
+    """
+    Base of the scenario generators registered in src.generators.registry.
+
+    Handles the lookback window of a rebalance date: the asset returns joined with the
+    features, as precomputed by WindowIndex, with the asset columns first. Subclasses set
+    name, keep their settings in params (they key the sample cache) and implement
+    draw(window, sample_size, rng), which returns a (sample_size, columns) array with the
+    columns of the window.
+    """
+    name = None
+
+    def __init__(self, asset_returns, features=None, window_index=None):
+        self.asset_returns = asset_returns
+        self.features = features
+        # precomputed windows of the backtest, see WindowIndex
+        self.window_index = window_index
+        self.n_assets = len(asset_returns.columns)
+        self.params = {}
+
+    def window(self, start_date, end_date):
+        '''
+        Rows of the lookback window between both dates, with the features joined after the assets.
+        '''
+        if self.window_index is not None:
+            return self.window_index.frame(start_date, end_date)
+        window = self.asset_returns.loc[(self.asset_returns.index <= end_date) & (self.asset_returns.index >= start_date)]
+        if self.features is not None:
+            window = window.join(self.features, how='left').ffill()
+        return window
+
+    def for_window(self, start_date, end_date):
+        '''
+        Copy of the generator that only holds the rows of one window, which is all a cell shipped
+        to a worker process needs.
+        '''
+        generator = copy.copy(self)
+        if self.window_index is not None:
+            generator.window_index = self.window_index.restrict(start_date, end_date)
+            # only the columns of the frames are used next to a window index
+            generator.asset_returns = self.asset_returns.iloc[:0]
+            generator.features = None if self.features is None else self.features.iloc[:0]
+        else:
+            generator.asset_returns = self.asset_returns.loc[start_date:end_date]
+            generator.features = None if self.features is None else self.features.loc[start_date:end_date]
+        return generator
+
+    def generate_sample(self, sample_size, start_date, end_date, seed=None):
+        window = np.asarray(self.window(start_date, end_date).values, dtype=float)
+        rng = np.random.default_rng(seed)
+        with span(f'{self.name}.draw', sample_size=sample_size, rows=len(window)):
+            return self.draw(window, sample_size, rng)
+
+    def draw(self, window, sample_size, rng):
+        raise NotImplementedError
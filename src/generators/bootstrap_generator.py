@@ -0,0 +1,23 @@
+# Local application imports
+from src.generators.base import ScenarioGenerator
+from src.robustness import stationary_bootstrap_indices
+
+
+class BlockBootstrapGenerator(ScenarioGenerator):
+    """
+    Stationary block bootstrap of the window rows (Politis & Romano, 1994).
+
+    Rows are drawn in blocks of consecutive days with geometric lengths of mean mean_block,
+    wrapping around the end of the window. The sample then comes in stretches of the history
+    instead of independent days, which keeps the clustering of calm and turbulent periods in
+    the scenario set.
+    """
+    name = 'block_bootstrap'
+
+    def __init__(self, asset_returns, features=None, window_index=None, mean_block=30):
+        super().__init__(asset_returns, features=features, window_index=window_index)
+        self.params = {'mean_block': mean_block}
+
+    def draw(self, window, sample_size, rng):
+        rows = stationary_bootstrap_indices(len(window), 1, self.params['mean_block'], rng, length=sample_size)[0]
+        return window[rows]
@@ -0,0 +1,32 @@
+# Third party imports
+import numpy as np
+from scipy.stats import norm, rankdata
+
+# Local application imports
+from src.generators.base import ScenarioGenerator
+
+
+class GaussianCopulaGenerator(ScenarioGenerator):
+    """
+    Gaussian copula with empirical margins.
+
+    Every column of the window is mapped to normal scores through its ranks, the correlation
+    of the scores is the copula, and correlated normal draws are mapped back through the
+    empirical quantiles of each column. Fitting is a rank, a correlation and a sort per window.
+    """
+    name = 'gaussian_copula'
+
+    def draw(self, window, sample_size, rng):
+        scores = norm.ppf(rankdata(window, axis=0) / (len(window) + 1))
+        # constant columns have no correlation, keep them independent
+        with np.errstate(invalid='ignore', divide='ignore'):
+            correlation = np.nan_to_num(np.corrcoef(scores, rowvar=False))
+        np.fill_diagonal(correlation, 1.0)
+
+        draws = norm.cdf(rng.multivariate_normal(np.zeros(len(correlation)), correlation, size=sample_size,
+                                                 method='eigh'))
+        # linear interpolation between the order statistics of each column
+        positions = draws * (len(window) - 1)
+        references = np.arange(len(window))
+        ordered = np.sort(window, axis=0)
+        return np.column_stack([np.interp(positions[:, j], references, ordered[:, j]) for j in range(window.shape[1])])
@@ -0,0 +1,46 @@
+# Third party imports
+import numpy as np
+from scipy.signal import lfilter
+
+# Local application imports
+from src.generators.base import ScenarioGenerator
+
+
+class FilteredHistoricalGenerator(ScenarioGenerator):
+    """
+    Filtered historical simulation (Barone-Adesi et al., 1999).
+
+    The asset returns of the window are standardized by their EWMA volatility, resampled with
+    replacement and scaled back by the volatility at the end of the window, so the sample keeps
+    the empirical shape of the shocks at today's level of risk. Feature columns are those of
+    the resampled rows.
+    """
+    name = 'fhs'
+
+    def __init__(self, asset_returns, features=None, window_index=None, decay=0.99):
+        super().__init__(asset_returns, features=features, window_index=window_index)
+        self.params = {'decay': decay}
+
+    def draw(self, window, sample_size, rng):
+        assets = window[:, :self.n_assets]
+        mean = assets.mean(axis=0)
+        residuals = assets - mean
+        volatility = np.sqrt(ewma_variance(residuals, self.params['decay']))
+        # flat assets have no volatility, their residuals stay at zero
+        volatility[volatility == 0] = 1.0
+        standardized = residuals / volatility
+
+        rows = rng.integers(len(window), size=sample_size)
+        sample = window[rows]
+        sample[:, :self.n_assets] = mean + standardized[rows] * volatility[-1]
+        return sample
+
+
+def ewma_variance(residuals, decay):
+    '''
+    Exponentially weighted variance of every column of the (T, n) residuals, started from
+    their sample variance: v_t = decay * v_t-1 + (1 - decay) * e_t ** 2.
+    '''
+    initial = (residuals**2).mean(axis=0)
+    variance, _ = lfilter([1 - decay], [1, -decay], residuals**2, axis=0, zi=decay * initial[np.newaxis])
+    return variance
@@ -1,16 +1,22 @@
 # Standard library imports
+import copy
+import os
+import tempfile
+import threading
 import warnings
+from contextlib import contextmanager, nullcontext
 
 # Third party imports
-import hdbscan
-import pandas as pd
+import numpy as np
 import torch
 from sdv.tabular import CTGAN
-from sklearn.decomposition import PCA
-from sklearn.manifold import TSNE
 
 # Local application imports
+from src.generators.base import ScenarioGenerator
 from src.generators.normalizer import Normalizer
+from src.executor import spawn_seeds
+from src.generators.preprocessing import PreprocessorCache
+from src.tracing import span
 
 warnings.filterwarnings("ignore")
 
@@ -55,12 +61,125 @@ def _select_optimal_cuda_setting(sample_size, epochs, features_count):
     
     return use_cuda
 
-class CTGANGenerator():
+def _load_matching_state(module, state):
+    """
+    Copies the tensors of a previous state dict whose names and shapes match into a module.
+
+    The input width of the first layers depends on the conditional vector and, in the
+    discriminator, on the pac packing of the rows, and the output width of the generator on the
+    modes found per column. A tensor of another shape lays its rows and columns out differently,
+    so it keeps its fresh initialization. Returns the number of tensors copied.
+    """
+    if state is None:
+        return 0
+    own_state = module.state_dict()
+    copied = 0
+    for name, tensor in own_state.items():
+        previous = state.get(name)
+        if previous is not None and previous.shape == tensor.shape:
+            tensor.copy_(previous.to(tensor.device))
+            copied += 1
+    module.load_state_dict(own_state)
+    return copied
+
+
+class _WarmStart():
+    """
+    Carries the generator and discriminator weights of a CTGAN fit over to the next fit.
+    """
+    def __init__(self):
+        self.generator_state = None
+        self.discriminator_state = None
+        self.pca_components = None
+        # tensors of the last fit that started from the stored weights, out of all of them
+        self.reused = (0, 0)
+
+    @property
+    def is_warm(self):
+        return self.generator_state is not None
+
+    @contextmanager
+    def fitting(self):
+        '''
+        Patches the networks built by ctgan's fit so they start from the stored weights,
+        and stores the weights they end up with.
+        '''
+        from ctgan.synthesizers import ctgan as ctgan_module
+
+        generator_cls, discriminator_cls = ctgan_module.Generator, ctgan_module.Discriminator
+        built, reused = {}, {}
+
+        def build(name, cls, state):
+            def builder(*args, **kwargs):
+                # ctgan's __init__ calls super() with the module level class, so it is put back meanwhile
+                setattr(ctgan_module, name, cls)
+                try:
+                    built[name] = cls(*args, **kwargs)
+                finally:
+                    setattr(ctgan_module, name, builder)
+                reused[name] = _load_matching_state(built[name], state)
+                return built[name]
+            return builder
+
+        ctgan_module.Generator = build('Generator', generator_cls, self.generator_state)
+        ctgan_module.Discriminator = build('Discriminator', discriminator_cls, self.discriminator_state)
+        try:
+            yield
+        finally:
+            ctgan_module.Generator, ctgan_module.Discriminator = generator_cls, discriminator_cls
+
+        self.generator_state = {k: v.detach().clone() for k, v in built['Generator'].state_dict().items()}
+        self.discriminator_state = {k: v.detach().clone() for k, v in built['Discriminator'].state_dict().items()}
+        self.reused = (sum(reused.values()), len(self.generator_state) + len(self.discriminator_state))
+
+
+# the global generators are shared by the threads of a process, so seeded cells take turns
+_GLOBAL_RNG_LOCK = threading.Lock()
+# guards the approx normalizer that the cells of a generator roll from one window to the next
+_ROLLING_NORMALIZER_LOCK = threading.Lock()
+
+@contextmanager
+def _seeded_global_rngs(numpy_seed, torch_seed):
+    """
+    SDV and ctgan draw from the global numpy and torch generators and take no generator argument.
+    They are seeded for the duration of a cell and restored afterwards, so a cell's draws only
+    depend on its own seeds, whatever ran before it in the same process.
+    """
+    with _GLOBAL_RNG_LOCK, torch.random.fork_rng():
+        numpy_state = np.random.get_state()
+        np.random.seed(numpy_seed)
+        torch.manual_seed(torch_seed)
+        try:
+            yield
+        finally:
+            np.random.set_state(numpy_state)
+
+class CTGANGenerator(ScenarioGenerator):
+    name = 'CTGAN'
 
-    def __init__(self, asset_returns, params=None, features=None):
-        self.asset_returns = asset_returns
-        self.features = features
-        self.name = 'CTGAN'
+    def __init__(self, asset_returns, params=None, features=None, warm_start=False, warm_start_epochs=None,
+                 embedding='tsne', preprocessing_cache_path=None, chunk_size=None, spill_dir=None,
+                 window_index=None, normalizer_method='quantile', fast_sampling=False,
+                 preprocessing_cache_max_bytes=None, seeded=True):
+        super().__init__(asset_returns, features=features, window_index=window_index)
+        # 'approx' normalizers are rolled forward from the previous window when dates run in order
+        self.normalizer_method = normalizer_method
+        self._rolling_normalizer = None
+        # fitted PCA, embedding and clusters per window, see ClusterPreprocessor for the embedding backends
+        self.embedding = embedding
+        self.preprocessors = PreprocessorCache(cache_dir=preprocessing_cache_path, max_bytes=preprocessing_cache_max_bytes)
+        # whether cell seeds derive from a run seed, or from fresh entropy and can't be looked up again
+        self.seeded = seeded
+        # samples are drawn chunk_size rows at a time and, with a spill_dir, written to a memory-mapped file
+        self.chunk_size = chunk_size
+        self.spill_dir = spill_dir
+        # draws from the underlying ctgan synthesizer, skipping SDV's DataFrame reverse transforms
+        self.fast_sampling = fast_sampling
+        # when warm starting, each date fine-tunes the networks of the previous date, so dates must run in order
+        self.warm_start = warm_start
+        self.warm_start_epochs = warm_start_epochs
+        self.sequential = warm_start
+        self._warm_state = _WarmStart()
         
         # Default parameters with intelligent CUDA selection
         default_params = {
@@ -73,14 +192,23 @@ class CTGANGenerator():
             'verbose': False
         }
         
-        if params:
-            self.params = params
-        else:
-            # Intelligent CUDA selection will be done when we know dataset size
-            self.params = default_params
+        # given params override the defaults, CUDA is selected once the dataset size is known unless set
+        self.params = dict(default_params, **(params or {}))
+
+
+    def generate_sample(self, sample_size, start_date, end_date, seed=None):
+        '''
+        Fits CTGAN on the window and draws sample_size scenarios. The cell seed is split into
+        independent numpy, torch and embedding streams, without a seed the draws are not reproducible.
+        '''
+        if seed is None:
+            return self._generate_sample(sample_size, start_date, end_date, embedding_seed=None)
 
+        numpy_seed, torch_seed, embedding_seed = spawn_seeds(seed, 3)
+        with _seeded_global_rngs(numpy_seed, torch_seed):
+            return self._generate_sample(sample_size, start_date, end_date, embedding_seed=embedding_seed)
 
-    def generate_sample(self, sample_size, start_date, end_date):
+    def _generate_sample(self, sample_size, start_date, end_date, embedding_seed):
         # Intelligent CUDA selection if not explicitly set
         if 'cuda' not in self.params:
             features_count = len(self.asset_returns.columns)
@@ -93,66 +221,138 @@ class CTGANGenerator():
                 features_count=features_count
             )
 
-        model = CTGAN(**self.params)
-        returns_interval = self.asset_returns.loc[
-            (self.asset_returns.index <= end_date) & (self.asset_returns.index >= start_date)]
+        params = self.params
+        if self.warm_start and self._warm_state.is_warm:
+            params = dict(self.params, epochs=self.warm_start_epochs or max(1, self.params['epochs'] // 2))
+        model = CTGAN(**params)
+        returns_interval = self.window(start_date, end_date)
         fit_cols = list(self.asset_returns.columns) + ['cluster']
         normalizer = None
         
         if self.features is not None:
-            returns_interval = returns_interval.join(self.features, how='left').ffill()
-            normalizer = Normalizer()
-            returns_interval = normalizer.normalize(returns_interval)
+            with span('ctgan.normalize', method=self.normalizer_method):
+                normalizer = self._get_normalizer(returns_interval, start_date, end_date)
+                returns_interval = normalizer.transform(returns_interval)
             fit_cols = list(self.asset_returns.columns) + list(self.features.columns) + ['cluster']
 
 
-        # Applies PCA
-        pca, returns_interval = self._construct_pca(returns_interval)
+        # Applies PCA, dimensionality reduction and clusters definition, reusing the fit of a window seen before
+        with span('ctgan.preprocess', embedding=self.embedding):
+            preprocessor = self.preprocessors.get_or_fit(returns_interval, embedding=self.embedding,
+                                                         random_state=embedding_seed, reproducible=self.seeded)
+            pca = preprocessor.pca
+            returns_interval = preprocessor.transform(returns_interval)
         fit_cols = [f"C_{i}" for i in range(pca.n_components_)] + ['cluster']
+        if self.warm_start:
+            pca, returns_interval = self._align_pca(pca, returns_interval, fit_cols[:-1])
 
+        # Fits CTGAN using categorical variable of state       
+        with span('ctgan.fit', rows=len(returns_interval), epochs=params['epochs']):
+            with self._warm_state.fitting() if self.warm_start else nullcontext():
+                model.fit(returns_interval[fit_cols])
 
-        # Dimensionality reduction
-        returns_interval, X_embedded = self._reduce_dim(returns_interval)
+        # SDV clips sampled float columns to the range seen in training
+        fitted = returns_interval[fit_cols[:-1]].values
+        bounds = (fitted.min(axis=0), fitted.max(axis=0))
 
+        with span('ctgan.draw', sample_size=sample_size):
+            return self._draw_sample(model, pca, normalizer, sample_size, fit_cols[:-1], bounds)
 
-        # Clusters definition
-        returns_interval = self._define_clusters(returns_interval, X_embedded)
+    def _draw_sample(self, model, pca, normalizer, sample_size, sample_cols, bounds=None):
+        '''
+        Samples the fitted model chunk by chunk, reconstructing and de-normalizing each chunk
+        in place in a preallocated array so the full sampled DataFrame is never materialized.
+        The PCA back-projection is a single matrix multiply into the output rows.
+        '''
+        chunk_size = self.chunk_size or sample_size
+        n_columns = pca.components_.shape[1]
+        # same as pca.inverse_transform: x = c @ components + mean, components scaled back when whitened
+        projection = pca.components_
+        if pca.whiten:
+            projection = np.sqrt(pca.explained_variance_)[:, None] * projection
+        if self.spill_dir is not None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            fd, path = tempfile.mkstemp(suffix='.npy', dir=self.spill_dir)
+            os.close(fd)
+            sample_val = np.lib.format.open_memmap(path, mode='w+', dtype=float, shape=(sample_size, n_columns))
+            # the mapping outlives the file name, and the disk space is released with the array
+            os.remove(path)
+        else:
+            sample_val = np.empty((sample_size, n_columns))
 
-        # Fits CTGAN using categorical variable of state       
-        model.fit(returns_interval[fit_cols])
+        for start in range(0, sample_size, chunk_size):
+            rows = min(chunk_size, sample_size - start)
+            with span('ctgan.sample', rows=rows):
+                chunk = self._sample_components(model, rows, sample_cols, bounds)
 
-        sample = model.sample(sample_size)[fit_cols[:-1]]
-        sample_val = sample.values
-
-       # Reconstruct assets
-        sample_val = pca.inverse_transform(sample_val)
-        
-        # De-normalizes
-        if self.features is not None:
-            sample_val = normalizer.denormalize(sample_val)
+            # Reconstruct assets
+            with span('ctgan.inverse_transform', rows=rows):
+                rows_val = sample_val[start:start + rows]
+                np.matmul(chunk, projection, out=rows_val)
+                rows_val += pca.mean_
 
+                # De-normalizes
+                if normalizer is not None:
+                    normalizer.denormalize(rows_val, out=rows_val)
 
         return sample_val
-    
-    def _construct_pca(self, returns_interval):
-        pca = PCA(n_components=returns_interval.shape[1])
-        pca.fit(returns_interval)
-        asset_returns_interval_trans = pca.transform(returns_interval)
-        pca_cols = [f"C_{i}" for i in range(pca.n_components_)]
-        return pca, pd.DataFrame(asset_returns_interval_trans,
-                                        index=returns_interval.index,
-                                        columns=pca_cols)
-
-    def _reduce_dim(self, returns_interval, dims=2):
-        X_embedded = TSNE(n_components=dims, learning_rate='auto', init='pca').fit_transform(returns_interval)
-        returns_interval['x'] = X_embedded[:, 0]
-        returns_interval['y'] = X_embedded[:, 1]
-        return returns_interval, X_embedded
-
-    def _define_clusters(self, returns_interval, X_embedded):
-        cluster_dim = max(10, int(len(returns_interval) * 0.005))
-        clusterer = hdbscan.HDBSCAN(min_samples=cluster_dim, min_cluster_size=cluster_dim)
-        clusterer.fit(X_embedded)
-        returns_interval['cluster'] = ['c_' + str(c) for c in clusterer.labels_]
-
-        return returns_interval
\ No newline at end of file
+
+    def _sample_components(self, model, rows, sample_cols, bounds):
+        '''
+        Draws rows of principal components as a float array. With fast_sampling, they come straight
+        from the ctgan synthesizer SDV wraps, whose float columns SDV only clips to the training
+        range on the way out, and SDV's sample is the fallback when its columns are not found.
+        '''
+        synthesizer = getattr(model, '_model', None) if self.fast_sampling else None
+        if synthesizer is not None:
+            raw = synthesizer.sample(rows)
+            # SDV names the transformed float columns '<column>.value'
+            columns = [column if column in raw.columns else f"{column}.value" for column in sample_cols]
+            if all(column in raw.columns for column in columns):
+                chunk = raw[columns].to_numpy(dtype=float)
+                if bounds is not None:
+                    np.clip(chunk, bounds[0], bounds[1], out=chunk)
+                return chunk
+        return model.sample(rows)[sample_cols].to_numpy(dtype=float)
+
+    def _get_normalizer(self, returns_interval, start_date, end_date):
+        '''
+        Fits the normalizer of the window. An approx normalizer on the window index is rolled from
+        a copy of the previous window's normalizer, updated with the rows entering and leaving the
+        window when that window precedes the current one. Its knots and counts only depend on the
+        window, so a rolled normalizer is the one a fresh fit would give, on any executor.
+        '''
+        if self.normalizer_method != 'approx' or self.window_index is None:
+            return Normalizer(method=self.normalizer_method).fit(returns_interval)
+
+        start, end = self.window_index.positions(start_date, end_date)
+        with _ROLLING_NORMALIZER_LOCK:
+            previous = self._rolling_normalizer
+        if previous is not None and previous[0] <= start <= previous[1] <= end:
+            previous_start, previous_end, previous_normalizer = previous
+            # the stored normalizer is never modified, cells on other threads may be rolling it too
+            normalizer = copy.deepcopy(previous_normalizer)
+            normalizer.update(added=self.window_index.values[previous_end:end],
+                              removed=self.window_index.values[previous_start:start])
+        else:
+            normalizer = Normalizer(method='approx').fit(returns_interval)
+        with _ROLLING_NORMALIZER_LOCK:
+            self._rolling_normalizer = (start, end, normalizer)
+        return normalizer
+
+    def _align_pca(self, pca, returns_interval, pca_cols):
+        '''
+        Flips the sign of the components that point against those of the previous window,
+        so the warm started networks see the same orientation of the data.
+        '''
+        previous = self._warm_state.pca_components
+        if previous is not None and previous.shape == pca.components_.shape:
+            signs = np.sign(np.sum(pca.components_ * previous, axis=1))
+            signs[signs == 0] = 1
+            # the fitted preprocessor may be shared with other dates, so flip a copy
+            pca = copy.deepcopy(pca)
+            pca.components_ *= signs[:, None]
+            returns_interval = returns_interval.copy()
+            returns_interval[pca_cols] = returns_interval[pca_cols] * signs
+        self._warm_state.pca_components = pca.components_.copy()
+        return pca, returns_interval
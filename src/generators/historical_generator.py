@@ -3,35 +3,29 @@ import numpy as np
 
 # Local application imports
 from ..utils import save_file
+from src.generators.base import ScenarioGenerator
 from src.generators.normalizer import Normalizer
+from src.tracing import span
 
-class HistoricalGenerator():
+class HistoricalGenerator(ScenarioGenerator):
     """
     Generates a random sample, based on a historical dataset.
     """
-    def __init__(self, asset_returns, features=None):
-        self.features = features
-        self.asset_returns = asset_returns
-        self.name = 'historical'
-    
-    def generate_sample(self, sample_size, start_date, end_date, normalize_features=False):
-        asset_returns_interval = self.asset_returns.loc[(self.asset_returns.index <= end_date)&(self.asset_returns.index >= start_date)]
-        if self.features is not None:
-            asset_returns_interval = asset_returns_interval.join(self.features, how='left').ffill()
+    name = 'historical'
 
-        if normalize_features:
-            normalizer = Normalizer()
-            asset_returns_interval = normalizer.normalize(asset_returns_interval)
-        else:
-            normalizer = None
+    def generate_sample(self, sample_size, start_date, end_date, normalize_features=False, seed=None):
+        if not normalize_features:
+            return super().generate_sample(sample_size, start_date, end_date, seed=seed)
 
-        total_windows = len(asset_returns_interval)
-        size = sample_size if sample_size < total_windows else total_windows
-
-        sample = np.random.choice(total_windows, size, replace=False)
-        sample = asset_returns_interval.iloc[sample, :].reset_index(drop=True)
+        normalizer = Normalizer()
+        asset_returns_interval = normalizer.normalize(self.window(start_date, end_date))
+        with span('historical.draw', sample_size=sample_size):
+            sample = self.draw(asset_returns_interval.values, sample_size, np.random.default_rng(seed))
+        return normalizer.denormalize(sample)
 
-        if normalize_features:
-            sample = normalizer.denormalize(sample)
-
-        return sample.values
+    def draw(self, window, sample_size, rng):
+        # windows are drawn without replacement, so the sample is at most the window
+        total_windows = len(window)
+        size = sample_size if sample_size < total_windows else total_windows
+        # column-major like the DataFrame rows drawn before, which keeps the LP results bit for bit
+        return np.asfortranarray(window[rng.choice(total_windows, size, replace=False)])
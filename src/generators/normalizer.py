@@ -1,38 +1,178 @@
 import numpy as np
 import pandas as pd
-from sklearn import preprocessing
 
 
 class Normalizer:
-    def __init__(self, method='quantile'):
+    """
+    Maps the factor columns (those named f_*) to uniform [0, 1] scores and back.
+
+    Works on column positions, never copies or mutates its input, and returns the same type it
+    is given. Methods:
+        'quantile': exact empirical quantile transform, equivalent to sklearn's
+            QuantileTransformer with up to n_quantiles references.
+        'approx': piecewise-linear CDF on knots, from a histogram of counts per knot interval.
+            Knots default to an even grid over the range of the fitted window, and the sorted
+            window is kept so a rolling window is updated with the rows that enter and leave it
+            and gives exactly the knots and counts of a fit on the new window. Given fixed knots,
+            only the counts are updated.
+    """
+    def __init__(self, method='quantile', n_quantiles=1000, n_knots=256, knots=None):
         self.method = method
+        self.n_quantiles = n_quantiles
+        self.n_knots = n_knots
         self.factor_columns = None
         self.total_columns = None
+        self.factor_idx = None
         self.params = {}
+        self.fixed_knots = knots is not None
+        if knots is not None:
+            self.params['knots'] = np.asarray(knots, dtype=float)
 
-    def normalize(self, data):
-        """ Normalization proces, returns a dataframe with each column normalized """
+    def normalize(self, data, factor_idx=None):
+        """ Normalization proces, fits the transform and returns the data with each factor column normalized """
+        self.fit(data, factor_idx)
+        return self.transform(data)
 
-        self.total_columns = data.columns
-        self.factor_columns = [x for x in data.columns if x.startswith('f_')]
+    def fit(self, data, factor_idx=None):
+        values = self._set_columns(data, factor_idx)
+        factors = values[:, self.factor_idx]
 
         if self.method == 'quantile':
-            self.params['quantile'] = preprocessing.QuantileTransformer(random_state=0)
-            data[self.factor_columns] = self.params['quantile'].fit_transform(data[self.factor_columns])
+            n_quantiles = max(1, min(self.n_quantiles, len(factors)))
+            references = np.linspace(0, 1, n_quantiles)
+            quantiles = np.nanpercentile(factors, references * 100, axis=0)
+            self.params['references'] = references
+            # percentiles may be off by rounding, keep them monotonic
+            self.params['quantiles'] = np.maximum.accumulate(quantiles, axis=0)
 
-        return data
+        elif self.method == 'approx':
+            if self.fixed_knots:
+                self.params['counts'] = self._histogram(factors)
+            else:
+                self._sorted = [np.sort(column[~np.isnan(column)]) for column in factors.T]
+                self._fit_sorted()
 
-    def denormalize(self, data):
-        """ De-Normalization proces, given a normalized dataframe, returns an inverse-transformed dataframe """
+        else:
+            raise ValueError(f"Unknown normalization method: {self.method}")
+        return self
 
-        if self.method == 'quantile':
-            if type(data) == pd.DataFrame:
-                data[self.factor_columns] = self.params['quantile'].inverse_transform(data[self.factor_columns])
+    def update(self, added=None, removed=None):
+        """ Rolls an approx normalizer forward with the rows entering and leaving the window """
+        if self.method != 'approx':
+            raise ValueError("Only the approx normalizer can be updated incrementally")
+        if self.fixed_knots:
+            if added is not None and len(added):
+                self.params['counts'] += self._histogram(self._factors_of(added))
+            if removed is not None and len(removed):
+                self.params['counts'] -= self._histogram(self._factors_of(removed))
+            return self
+
+        for j in range(len(self._sorted)):
+            column = self._sorted[j]
+            if removed is not None and len(removed):
+                leaving = self._factors_of(removed)[:, j]
+                leaving = np.sort(leaving[~np.isnan(leaving)])
+                # the first occurrence of each leaving value, shifted past the copies removed before it
+                positions = np.searchsorted(column, leaving, side='left')
+                positions += np.arange(len(leaving)) - np.searchsorted(leaving, leaving, side='left')
+                column = np.delete(column, positions)
+            if added is not None and len(added):
+                entering = self._factors_of(added)[:, j]
+                entering = np.sort(entering[~np.isnan(entering)])
+                column = np.insert(column, np.searchsorted(column, entering, side='left'), entering)
+            self._sorted[j] = column
+        self._fit_sorted()
+        return self
+
+    def transform(self, data):
+        return self._apply(data, inverse=False)
+
+    def denormalize(self, data, out=None):
+        """ De-Normalization proces, given normalized data, returns the inverse-transformed data """
+        return self._apply(data, inverse=True, out=out)
+
+    def _apply(self, data, inverse, out=None):
+        """ With an out array, arrays are written to it, which may be data itself """
+        is_frame = isinstance(data, pd.DataFrame)
+        values = data.values if is_frame else np.asarray(data)
+        if out is None or is_frame:
+            result = np.array(values, dtype=float)
+        else:
+            result = out
+            if result is not values:
+                result[...] = values
+
+        for j, column in enumerate(self.factor_idx):
+            if self.method == 'quantile':
+                result[:, column] = self._quantile_column(values[:, column], j, inverse)
+            else:
+                result[:, column] = self._approx_column(values[:, column], j, inverse)
+
+        if is_frame:
+            return pd.DataFrame(result, index=data.index, columns=data.columns, copy=False)
+        return result
+
+    def _quantile_column(self, x, j, inverse):
+        references = self.params['references']
+        quantiles = self.params['quantiles'][:, j]
+        if inverse:
+            lower_x, upper_x, lower_y, upper_y = 0, 1, quantiles[0], quantiles[-1]
+            y = np.interp(x, references, quantiles)
+        else:
+            lower_x, upper_x, lower_y, upper_y = quantiles[0], quantiles[-1], 0, 1
+            # interpolating in both directions and averaging handles repeated quantiles
+            y = 0.5 * (np.interp(x, quantiles, references) - np.interp(-x, -quantiles[::-1], -references[::-1]))
+        y[x == upper_x] = upper_y
+        y[x == lower_x] = lower_y
+        return y
+
+    def _approx_column(self, x, j, inverse):
+        knots = self.params['knots'][:, j]
+        counts = self.params['counts'][:, j]
+        # a tiny floor keeps the CDF strictly increasing so it can be inverted
+        cdf = np.concatenate(([0.0], np.cumsum(counts + 1e-9)))
+        cdf /= cdf[-1]
+        if inverse:
+            return np.interp(x, cdf, knots)
+        return np.interp(x, knots, cdf)
+
+    def _fit_sorted(self):
+        # same knots and counts as _histogram over the window, read off the sorted columns
+        lower = [column[0] if len(column) else np.nan for column in self._sorted]
+        upper = [column[-1] if len(column) else np.nan for column in self._sorted]
+        knots = np.linspace(lower, upper, self.n_knots)
+        counts = np.zeros((self.n_knots - 1, len(self._sorted)))
+        for j, column in enumerate(self._sorted):
+            below = np.searchsorted(column, knots[1:-1, j], side='left')
+            counts[:, j] = np.diff(np.concatenate(([0], below, [len(column)])))
+        self.params['knots'] = knots
+        self.params['counts'] = counts
 
-            elif type(data) == np.ndarray:
-                data_df = pd.DataFrame(data, columns=self.total_columns)
-                data_df[self.factor_columns] = self.params['quantile'].inverse_transform(data_df[self.factor_columns])
+    def _histogram(self, factors):
+        knots = self.params['knots']
+        counts = np.zeros((knots.shape[0] - 1, knots.shape[1]))
+        for j in range(knots.shape[1]):
+            column = factors[:, j]
+            column = column[~np.isnan(column)]
+            # values beyond the knots fall in the outer intervals
+            bins = np.clip(np.searchsorted(knots[:, j], column, side='right') - 1, 0, len(counts) - 1)
+            counts[:, j] = np.bincount(bins, minlength=len(counts))
+        return counts
 
-                data = data_df.values
+    def _set_columns(self, data, factor_idx):
+        if isinstance(data, pd.DataFrame):
+            self.total_columns = data.columns
+            if factor_idx is None:
+                factor_idx = [i for i, x in enumerate(data.columns) if str(x).startswith('f_')]
+            self.factor_columns = [data.columns[i] for i in factor_idx]
+            values = data.values
+        else:
+            if factor_idx is None:
+                raise ValueError("factor_idx is required to normalize an array")
+            values = np.asarray(data)
+        self.factor_idx = np.asarray(factor_idx, dtype=int)
+        return values
 
-        return data
+    def _factors_of(self, data):
+        values = data.values if isinstance(data, pd.DataFrame) else np.asarray(data)
+        return values[:, self.factor_idx]
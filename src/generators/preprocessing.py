@@ -0,0 +1,135 @@
+# Standard library imports
+import os
+import pickle
+
+# Third party imports
+import hdbscan
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import PCA
+from sklearn.manifold import TSNE
+
+# Local application imports
+from src.sample_cache import data_fingerprint, evict_lru
+from src.tracing import span
+
+EMBEDDINGS = ('tsne', 'opentsne', 'pca')
+
+
+class ClusterPreprocessor():
+    """
+    Fitted PCA, 2D embedding and HDBSCAN clustering of a lookback window.
+
+    The embedding backend is one of:
+        'tsne': sklearn's exact Barnes-Hut t-SNE (the original behaviour).
+        'opentsne': openTSNE's FFT-accelerated t-SNE, much faster on long windows.
+        'pca': the leading principal components, skipping the embedding altogether.
+    """
+    def __init__(self, embedding='tsne', dims=2, random_state=None):
+        if embedding not in EMBEDDINGS:
+            raise ValueError(f"Unknown embedding backend: {embedding}, expected one of {EMBEDDINGS}")
+        self.embedding = embedding
+        self.dims = dims
+        self.random_state = random_state
+        self.pca = None
+        self.embedding_ = None
+        self.labels_ = None
+
+    def fit(self, data):
+        with span('preprocess.pca', rows=len(data)):
+            self.pca = PCA(n_components=data.shape[1])
+            components = self.pca.fit_transform(data)
+        with span('preprocess.embedding', backend=self.embedding):
+            self.embedding_ = self._embed(components)
+        with span('preprocess.hdbscan'):
+            self.labels_ = self._define_clusters(self.embedding_)
+        return self
+
+    def transform(self, data):
+        '''
+        Projects the window on its principal components and adds the embedding and the cluster of each row.
+        '''
+        components = self.pca.transform(data)
+        pca_cols = [f"C_{i}" for i in range(self.pca.n_components_)]
+        transformed = pd.DataFrame(components, index=data.index, columns=pca_cols)
+        transformed['x'] = self.embedding_[:, 0]
+        transformed['y'] = self.embedding_[:, 1]
+        transformed['cluster'] = ['c_' + str(c) for c in self.labels_]
+        return transformed
+
+    def fit_transform(self, data):
+        return self.fit(data).transform(data)
+
+    def inverse_transform(self, components):
+        return self.pca.inverse_transform(components)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def _embed(self, components):
+        if self.embedding == 'pca':
+            return np.ascontiguousarray(components[:, :self.dims])
+        if self.embedding == 'opentsne':
+            from openTSNE import TSNE as OpenTSNE
+            return np.asarray(OpenTSNE(n_components=self.dims, negative_gradient_method='fft',
+                                       random_state=self.random_state).fit(components))
+        return TSNE(n_components=self.dims, learning_rate='auto', init='pca',
+                    random_state=self.random_state).fit_transform(components)
+
+    def _define_clusters(self, X_embedded):
+        cluster_dim = max(10, int(len(X_embedded) * 0.005))
+        clusterer = hdbscan.HDBSCAN(min_samples=cluster_dim, min_cluster_size=cluster_dim)
+        clusterer.fit(X_embedded)
+        return clusterer.labels_
+
+
+class PreprocessorCache():
+    """
+    Keeps fitted preprocessors per window in memory and, when a directory is given, pickled on disk.
+    Reads refresh an entry's modification time and the least recently used pickles are evicted
+    once the directory grows beyond max_bytes.
+    """
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.preprocessors = {}
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get_or_fit(self, data, embedding='tsne', random_state=None, reproducible=True):
+        '''
+        Returns the preprocessor fitted on data, fitting and storing it on a miss.
+        Only t-SNE embeddings depend on the random state, so the pca backend is shared across seeds.
+        A random state that is not reproducible, e.g. drawn from fresh entropy in an unseeded run,
+        would never be looked up again, so those fits are kept in memory only.
+        '''
+        seed = None if embedding == 'pca' else random_state
+        key = data_fingerprint(data) + f"_{embedding}_{seed}"
+        if key in self.preprocessors:
+            return self.preprocessors[key]
+
+        persist = self.cache_dir is not None and (reproducible or embedding == 'pca')
+        path = os.path.join(self.cache_dir, f"{key}.pkl") if persist else None
+        preprocessor = None
+        if path is not None and os.path.exists(path):
+            try:
+                preprocessor = ClusterPreprocessor.load(path)
+                # mark the entry as recently used
+                os.utime(path)
+            except FileNotFoundError:
+                # evicted meanwhile by another process
+                preprocessor = None
+        if preprocessor is None:
+            preprocessor = ClusterPreprocessor(embedding=embedding, random_state=random_state).fit(data)
+            if path is not None:
+                preprocessor.save(path)
+                evict_lru(self.cache_dir, '.pkl', self.max_bytes)
+
+        self.preprocessors[key] = preprocessor
+        return preprocessor
@@ -0,0 +1,45 @@
+# Third party imports
+import numpy as np
+
+# Local application imports
+from src.generators.base import ScenarioGenerator
+
+
+class RegimeGenerator(ScenarioGenerator):
+    """
+    Regime-conditional resampling.
+
+    The standardized window is clustered with the PCA embedding and HDBSCAN of
+    ClusterPreprocessor, the regime is the cluster of the last clustered row, and the sample
+    is drawn with replacement from the rows of that regime. Windows whose regime has fewer
+    than min_regime_rows rows, or where HDBSCAN finds no cluster, are resampled whole.
+    """
+    name = 'regime'
+
+    def __init__(self, asset_returns, features=None, window_index=None, embedding='pca', min_regime_rows=50):
+        super().__init__(asset_returns, features=features, window_index=window_index)
+        self.embedding = embedding
+        self.params = {'embedding': embedding, 'min_regime_rows': min_regime_rows}
+
+    def draw(self, window, sample_size, rng):
+        labels = self.regimes(window, rng)
+        clustered = np.flatnonzero(labels >= 0)
+        rows = np.arange(len(window))
+        if len(clustered):
+            regime_rows = np.flatnonzero(labels == labels[clustered[-1]])
+            if len(regime_rows) >= self.params['min_regime_rows']:
+                rows = regime_rows
+        return window[rows[rng.integers(len(rows), size=sample_size)]]
+
+    def regimes(self, window, rng):
+        '''
+        HDBSCAN cluster of every row of the window, -1 for noise.
+        '''
+        # hdbscan is only imported by runs using this model
+        from src.generators.preprocessing import ClusterPreprocessor
+
+        scale = window.std(axis=0)
+        scale[scale == 0] = 1.0
+        standardized = (window - window.mean(axis=0)) / scale
+        random_state = None if self.embedding == 'pca' else int(rng.integers(2**31))
+        return ClusterPreprocessor(embedding=self.embedding, random_state=random_state).fit(standardized).labels_
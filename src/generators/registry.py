@@ -0,0 +1,29 @@
+import importlib
+
+# model name -> (module, class), the module is only imported when the model is used
+GENERATORS = {
+    'historical': ('src.generators.historical_generator', 'HistoricalGenerator'),
+    'CTGAN': ('src.generators.gan_generator', 'CTGANGenerator'),
+    'fhs': ('src.generators.fhs_generator', 'FilteredHistoricalGenerator'),
+    'gaussian_copula': ('src.generators.copula_generator', 'GaussianCopulaGenerator'),
+    'block_bootstrap': ('src.generators.bootstrap_generator', 'BlockBootstrapGenerator'),
+    'regime': ('src.generators.regime_generator', 'RegimeGenerator'),
+}
+
+
+def register_generator(model_name, module_name, class_name):
+    '''
+    Adds a generator to the registry, or replaces the one of that name. The class should follow ScenarioGenerator of src.generators.base.
+    '''
+    GENERATORS[model_name] = (module_name, class_name)
+
+
+def get_generator_class(model_name):
+    '''
+    Imports and returns the generator class of a model name. Heavy dependencies such as torch,
+    sdv or hdbscan are then only loaded by runs that use the models needing them.
+    '''
+    if model_name not in GENERATORS:
+        raise ValueError(f"Unknown model: {model_name}, expected one of {list(GENERATORS)}")
+    module_name, class_name = GENERATORS[model_name]
+    return getattr(importlib.import_module(module_name), class_name)
@@ -1,5 +1,8 @@
 import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from src.performance import compute_daily_values, compute_hhi, compute_period_returns, compute_rotation, compute_values
 
 
 def compute_annualized_return(serie):
@@ -46,26 +49,111 @@ def compute_mean_hhi(portfolios):
     '''
     Calculates the diversification measure (HHI) for a set of historical portfolios.
     '''
-    mean_hhi = pd.Series(dtype=np.float)
-    for t, portfolio in portfolios.iterrows():
-            m = len(portfolio)
-            w = portfolio[portfolio>0.0]
-            w /= 100
-            hhi = w**2
-            hhi = hhi.sum()
-            hhi = (1-hhi) / (1-(1/m))
-            mean_hhi[t] = hhi
-    mean_hhi = mean_hhi.mean()
-    return mean_hhi
+    weights = portfolios.values.astype(float) / 100
+    return compute_hhi(weights).mean()
 
 def compute_mean_rotation(portfolios):
     '''
     Calculates the mean absolute rotation of the historical portfolios
     '''
-    rotation = portfolios.diff()
-    rotation = rotation.dropna()
-    rotation = rotation.abs()
-    rotation = rotation.sum(axis=1)
-    rotation /= 2
-    mean_rotation = rotation.mean()
-    return mean_rotation
\ No newline at end of file
+    weights = portfolios.values.astype(float)
+    if len(weights) < 2:
+        return np.nan
+    return compute_rotation(weights).mean()
+
+
+def compute_drawdowns(values):
+    '''
+    Drawdown of each (models, days) value path from its running peak, as a negative fraction.
+    '''
+    return values / np.maximum.accumulate(values, axis=-1) - 1
+
+
+def compute_tail_mean(returns, alpha=0.95):
+    '''
+    Ex post CVaR of the returns along the last axis: the mean of their worst ceil((1 - alpha) * n)
+    values, as a positive percentage.
+    '''
+    k = max(int(np.ceil((1 - alpha) * returns.shape[-1])), 1)
+    worst = np.partition(returns, k - 1, axis=-1)[..., :k]
+    return -100 * worst.mean(axis=-1)
+
+
+def compute_rolling_cvar(returns, window, alpha=0.95, step=1):
+    '''
+    Ex post CVaR over the windows of daily returns ending every step days, a (models, windows)
+    array whose column j covers returns j * step to j * step + window - 1.
+    '''
+    window = min(window, returns.shape[-1])
+    return compute_tail_mean(sliding_window_view(returns, window, axis=-1)[..., ::step, :], alpha=alpha)
+
+
+def compute_sortino(returns, periods_per_year=365):
+    '''
+    Annualized Sortino ratio of the daily returns, with a zero target.
+    '''
+    downside = np.sqrt((np.minimum(returns, 0)**2).mean(axis=-1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return returns.mean(axis=-1) / downside * np.sqrt(periods_per_year)
+
+
+def compute_turnover(weights, prices):
+    '''
+    Two-way turnover of every rebalance after the first: the traded fraction of the portfolio
+    between the weights that drifted with prices over the period and the new weights. The cash
+    left out of the weights keeps its value while the assets drift.
+    '''
+    asset_growth = prices[1:] / prices[:-1]
+    drifted = weights[:, :-1] * asset_growth
+    cash = 1 - weights[:, :-1].sum(axis=-1, keepdims=True)
+    drifted /= drifted.sum(axis=-1, keepdims=True) + cash
+    return np.abs(weights[:, 1:] - drifted).sum(axis=-1)
+
+
+def compute_daily_risk(weights, asset_prices, dates, periods_per_year=365, window=365, step=7, alpha=0.95,
+                       cost_bps=10, benchmark_weights=None):
+    '''
+    Daily ex post risk engine for every model at once.
+
+    weights is a (models, dates, assets) array of fractional weights rebalanced on dates, whose
+    assets follow the columns of asset_prices. Values drift with the daily prices between
+    rebalances, and the daily returns give the max drawdown, the daily CVaR over the whole
+    period and over rolling windows of window days ending every step days (a rolling tail is
+    a partial sort of every window, the only costly part), the Sortino ratio and the tracking error
+    against the benchmark weights (equal weights by default), rebalanced on the same dates.
+    The turnover cost is the yearly cost of trading the turnover at cost_bps basis points.
+    Percentages are returned in percent, and every array has the models as first axis.
+    '''
+    dates = pd.DatetimeIndex(dates)
+    daily_prices = asset_prices.loc[dates[0]:dates[-1]]
+    positions = daily_prices.index.get_indexer(dates)
+    prices = daily_prices.values
+    if benchmark_weights is None:
+        benchmark_weights = np.full(weights.shape[1:], 1 / weights.shape[-1])
+    # the benchmark is backtested as one more model
+    all_weights = np.concatenate([weights, benchmark_weights[np.newaxis]])
+
+    values = compute_values(compute_period_returns(all_weights, prices[positions]))
+    daily_values = compute_daily_values(all_weights, values, prices, positions)
+    daily_returns = daily_values[:, 1:] / daily_values[:, :-1] - 1
+    returns, benchmark_returns = daily_returns[:-1], daily_returns[-1]
+
+    turnover = compute_turnover(weights, prices[positions])
+    years = (dates[-1] - dates[0]).days / 365.25
+    drawdowns = compute_drawdowns(daily_values[:-1])
+    rolling_cvar = compute_rolling_cvar(returns, window, alpha=alpha, step=step)
+    # a window ending on return j ends on day j + 1
+    window_ends = np.arange(rolling_cvar.shape[-1]) * step + min(window, returns.shape[-1])
+    return {
+        'daily_index': daily_prices.index,
+        'daily_values': daily_values[:-1],
+        'drawdowns': 100 * drawdowns,
+        'max_drawdown': -100 * drawdowns.min(axis=-1),
+        'daily_cvar': compute_tail_mean(returns, alpha=alpha),
+        'rolling_cvar': rolling_cvar,
+        'rolling_cvar_index': daily_prices.index[window_ends],
+        'sortino': compute_sortino(returns, periods_per_year=periods_per_year),
+        'turnover': turnover,
+        'turnover_cost': 100 * cost_bps / 1e4 * turnover.sum(axis=-1) / years,
+        'tracking_error': 100 * (returns - benchmark_returns).std(axis=-1, ddof=1) * np.sqrt(periods_per_year),
+    }
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+
+def stack_weights(historical_portfolios, model_names, columns):
+    '''
+    Stacks the portfolios of each model into a (models, dates, assets) array of fractional weights.
+    '''
+    return np.stack([historical_portfolios[name][columns].values.astype(float) / 100 for name in model_names])
+
+
+def compute_period_returns(weights, prices):
+    '''
+    Returns the (models, dates - 1) portfolio returns between consecutive rebalance dates,
+    given the weights at each date and the (dates, assets) prices at the same dates.
+    '''
+    asset_returns = prices[1:] / prices[:-1] - 1
+    return np.einsum('mtn,tn->mt', weights[:, :-1], asset_returns)
+
+
+def compute_values(period_returns, start_value=100):
+    '''
+    Compounds the period returns into the portfolio value at every rebalance date.
+    '''
+    growth = np.cumprod(1 + period_returns, axis=-1)
+    ones = np.ones(period_returns.shape[:-1] + (1,))
+    return start_value * np.concatenate([ones, growth], axis=-1)
+
+
+def compute_hhi(weights):
+    '''
+    Diversification measure (normalized HHI) of each portfolio, 0=concentrated and 1=diversified.
+    '''
+    m = weights.shape[-1]
+    return (1 - (weights**2).sum(axis=-1)) / (1 - (1/m))
+
+
+def compute_rotation(weights):
+    '''
+    Absolute rotation between consecutive portfolios.
+    '''
+    return np.abs(np.diff(weights, axis=-2)).sum(axis=-1) / 2
+
+
+def compute_daily_values(weights, values, prices, rebalance_positions):
+    '''
+    Marks the portfolios to market every day between rebalances.
+
+    Weights drift with prices inside each period: a day t after the rebalance at position p
+    is worth values[p] * (sum(w_p * prices[t] / prices[p]) + 1 - sum(w_p)), the rest of the
+    portfolio being held in cash. The (days, assets) prices must
+    span the first to the last rebalance date, whose rows are rebalance_positions.
+    '''
+    days = np.arange(len(prices))
+    period = np.searchsorted(rebalance_positions, days, side='right') - 1
+    # on the last rebalance date the value is set by the previous period
+    period = np.clip(period, 0, max(len(rebalance_positions) - 2, 0))
+    anchors = rebalance_positions[period]
+    relative_prices = prices / prices[anchors]
+    period_weights = weights[:, period]
+    cash = 1 - period_weights.sum(axis=-1)
+    return values[:, period] * (np.einsum('mdn,dn->md', period_weights, relative_prices) + cash)
+
+
+def backtest_weights(weights, asset_prices, dates, daily=False, start_value=100):
+    '''
+    Vectorized performance engine for every model at once.
+
+    weights is a (models, dates, assets) array of fractional weights whose assets follow the
+    columns of asset_prices. Returns the value, HHI and rotation arrays of every model and,
+    if daily is set, the daily mark-to-market value between the first and last dates.
+    '''
+    dates = pd.DatetimeIndex(dates)
+    prices_at_dates = asset_prices.reindex(dates).values
+    period_returns = compute_period_returns(weights, prices_at_dates)
+    values = compute_values(period_returns, start_value=start_value)
+    performance = {
+        'values': values,
+        'hhi': compute_hhi(weights),
+        'rotation': compute_rotation(weights),
+    }
+
+    if daily:
+        daily_prices = asset_prices.loc[dates[0]:dates[-1]]
+        rebalance_positions = daily_prices.index.get_indexer(dates)
+        performance['daily_index'] = daily_prices.index
+        performance['daily_values'] = compute_daily_values(weights, values, daily_prices.values, rebalance_positions)
+
+    return performance
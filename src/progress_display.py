@@ -96,6 +96,17 @@ class HackerProgressDisplay:
         print(f"\r{Fore.GREEN}[{progress:6.1%}] {Fore.WHITE}{bar} {Fore.GREEN}│ "
               f"{Fore.BLUE}T: {elapsed_str} │ ETA: {eta_str} │ {status}", end='', flush=True)
               
+    def on_event(self, event):
+        """Tracer listener, phases and finished cells drive the display"""
+        if event['type'] == 'phase_start':
+            self.start_phase(event['name'], event['total_steps'])
+        elif event['category'] == 'cell':
+            self.update_progress(current_date=event['attrs'].get('date'),
+                                 model_name=event['attrs'].get('model'),
+                                 sub_task=event['name'])
+        elif event['category'] == 'phase':
+            self.complete_phase()
+
     def complete_phase(self):
         """Complete current phase"""
         elapsed = time.time() - self.start_time if self.start_time else 0
@@ -120,7 +131,9 @@ class HackerProgressDisplay:
         print(f"{Fore.CYAN}├─ 📈 Annualized Return: {Fore.GREEN}{metrics.get('return', 'N/A')}")
         print(f"{Fore.CYAN}├─ ⚠️  CVaR (Ex-post): {Fore.YELLOW}{metrics.get('cvar', 'N/A')}")
         print(f"{Fore.CYAN}├─ 🎯 Mean HHI: {Fore.BLUE}{metrics.get('hhi', 'N/A')}")
-        print(f"{Fore.CYAN}└─ 🔄 Mean Rotation: {Fore.WHITE}{metrics.get('rotation', 'N/A')}")
+        print(f"{Fore.CYAN}├─ 🔄 Mean Rotation: {Fore.WHITE}{metrics.get('rotation', 'N/A')}")
+        print(f"{Fore.CYAN}├─ 📉 Max Drawdown: {Fore.RED}{metrics.get('max_drawdown', 'N/A')}")
+        print(f"{Fore.CYAN}└─ 🧭 Sortino: {Fore.WHITE}{metrics.get('sortino', 'N/A')}")
         
     def print_visualization_status(self, save_path):
         """Print visualization completion status"""
@@ -0,0 +1,174 @@
+'''
+Out-of-sample robustness of the backtests: the fixed rebalance portfolios of every model are
+backtested over many price histories resampled with a stationary block bootstrap, giving a
+distribution of each metric instead of the single realized path.
+
+Every model is backtested on the same resampled histories, so models can be compared path by path.
+'''
+# Third party imports
+import numpy as np
+import pandas as pd
+
+# Local application imports
+from src.executor import cell_seed, run_cells
+from src.performance import compute_values
+
+METRICS = ('annualized_return', 'cvar_expost')
+
+
+def stationary_bootstrap_indices(n_days, n_paths, mean_block, rng, length=None):
+    '''
+    Returns (n_paths, length) indices of a stationary block bootstrap (Politis & Romano, 1994)
+    of n_days days, length defaulting to n_days. Blocks start at a uniform day, wrap around the
+    end and have geometric lengths of mean mean_block.
+    '''
+    length = n_days if length is None else length
+    days = np.arange(length)
+    new_block = rng.random((n_paths, length)) < 1 / max(mean_block, 1)
+    new_block[:, 0] = True
+    starts = rng.integers(n_days, size=(n_paths, length))
+    # day each block started on and the day it starts from, carried forward over the block
+    block_day = np.maximum.accumulate(np.where(new_block, days, 0), axis=1)
+    block_start = np.take_along_axis(starts, block_day, axis=1)
+    return (block_start + days - block_day) % n_days
+
+
+def bootstrap_period_returns(log_returns, indices, positions):
+    '''
+    Asset returns between consecutive rebalance positions of the (paths, days) resampled histories,
+    as a (paths, dates - 1, assets) array. log_returns holds the daily log returns that follow
+    each rebalance position, so positions[-1] equals its length.
+
+    Resampled days come in runs of consecutive original days, so each run is summed as a
+    difference of cumulative log returns instead of gathering every (path, day, asset) value.
+    '''
+    n_paths, n_days = indices.shape
+    cumulative = np.vstack([np.zeros((1, log_returns.shape[1])), np.cumsum(log_returns, axis=0)])
+
+    # runs break on new blocks, on wrap-arounds and on every rebalance position
+    breaks = np.ones((n_paths, n_days), dtype=bool)
+    breaks[:, 1:] = np.diff(indices, axis=1) != 1
+    breaks[:, positions[:-1]] = True
+    path, day = np.nonzero(breaks)
+    ends = np.append(day[1:], n_days)
+    ends[np.append(path[1:] != path[:-1], True)] = n_days
+    first = indices[path, day]
+    run_sums = cumulative[first + ends - day] - cumulative[first]
+
+    # runs are sorted by path then day and every period starts one, so periods are contiguous runs
+    period = np.searchsorted(positions, day, side='right') - 1
+    period_starts = np.flatnonzero(np.append(True, (path[1:] != path[:-1]) | (period[1:] != period[:-1])))
+    period_sums = np.add.reduceat(run_sums, period_starts, axis=0)
+    return np.expm1(period_sums.reshape(n_paths, len(positions) - 1, -1))
+
+
+def path_metrics(weights, period_returns, years, alpha=0.95):
+    '''
+    Vectorized backtest of the (models, dates, assets) weights over every path, returning the
+    (paths, models) annualized return and ex post CVaR, computed as compute_annualized_return
+    and compute_cvar do on a single path.
+    '''
+    portfolio_returns = np.einsum('mtn,ptn->pmt', weights[:, :-1], period_returns)
+    values = compute_values(portfolio_returns)
+    total_return = values[..., -1] / values[..., 0] - 1
+    annualized_return = ((1 + total_return)**(1 / years) - 1) * 100
+
+    var = np.percentile(portfolio_returns, (1 - alpha) * 100, axis=-1, keepdims=True)
+    tail = portfolio_returns <= var
+    cvar = -100 * (portfolio_returns * tail).sum(axis=-1) / tail.sum(axis=-1)
+    return {'annualized_return': annualized_return, 'cvar_expost': cvar}
+
+
+def _bootstrap_cell(log_returns, positions, weights, years, n_paths, mean_block, seed):
+    rng = np.random.default_rng(seed)
+    indices = stationary_bootstrap_indices(len(log_returns), n_paths, mean_block, rng)
+    return path_metrics(weights, bootstrap_period_returns(log_returns, indices, positions), years)
+
+
+class BlockBootstrap():
+    """
+    Backtests fixed rebalance portfolios over n_paths bootstrapped price histories.
+
+    The daily log returns between the first and last rebalance dates are resampled in blocks
+    of mean_block days on average, which keeps their short-range dependence, and every path
+    keeps the calendar of the original history. Paths are drawn in chunks of chunk_size, each
+    one an executor cell seeded from seed and its position, so the same paths are drawn
+    whatever the executor or the number of jobs.
+    """
+    def __init__(self, asset_prices, n_paths=500, mean_block=30, chunk_size=50, seed=42):
+        self.asset_prices = asset_prices
+        self.n_paths = n_paths
+        self.mean_block = mean_block
+        self.chunk_size = chunk_size
+        self.seed = seed
+
+    def run(self, historical_portfolios, executor, tracer=None):
+        '''
+        Returns one row per path and model with the metrics of the bootstrapped backtest.
+        '''
+        model_names = list(historical_portfolios)
+        dates = pd.DatetimeIndex(historical_portfolios[model_names[0]].index)
+        weights = np.stack([historical_portfolios[name][self.asset_prices.columns].values.astype(float) / 100
+                            for name in model_names])
+        prices = self.asset_prices.loc[dates[0]:dates[-1]]
+        log_returns = np.diff(np.log(prices.values), axis=0)
+        positions = prices.index.get_indexer(dates)
+        years = (dates[-1] - dates[0]).days / 365.25
+
+        cells = []
+        for chunk, first_path in enumerate(range(0, self.n_paths, self.chunk_size)):
+            n_paths = min(self.chunk_size, self.n_paths - first_path)
+            label = f"paths {first_path}-{first_path + n_paths - 1}"
+            cells.append(((None, label, first_path), (log_returns, positions, weights, years, n_paths,
+                                                      self.mean_block, cell_seed(self.seed, chunk, 0))))
+
+        phase = tracer.start_phase("BOOTSTRAP BACKTESTS", len(cells)) if tracer is not None else None
+        results = run_cells(executor, _bootstrap_cell, cells, tracer=tracer, name="Bootstrap backtests")
+        if phase is not None:
+            phase.end()
+
+        frames = []
+        for key, _ in cells:
+            first_path = key[2]
+            metrics = results[key]
+            n_paths = len(metrics['annualized_return'])
+            for i, name in enumerate(model_names):
+                frame = pd.DataFrame({metric: metrics[metric][:, i] for metric in METRICS})
+                frame.insert(0, 'model', name)
+                frame.insert(0, 'path', np.arange(first_path, first_path + n_paths))
+                frames.append(frame)
+        return pd.concat(frames, ignore_index=True).sort_values(['model', 'path'], ignore_index=True)
+
+
+def summarize(distributions, confidence=0.95):
+    '''
+    Mean, standard deviation and percentile confidence interval of every metric for each model.
+    '''
+    tail = (1 - confidence) / 2 * 100
+    rows = []
+    for model_name, paths in distributions.groupby('model', sort=False):
+        for metric in METRICS:
+            values = paths[metric].values
+            rows.append({'model': model_name, 'metric': metric, 'mean': values.mean(), 'std': values.std(ddof=1),
+                         'ci_low': np.percentile(values, tail), 'ci_high': np.percentile(values, 100 - tail)})
+    return pd.DataFrame(rows)
+
+
+def compare_models(distributions, baseline, confidence=0.95):
+    '''
+    Path by path difference of every model against the baseline model: mean difference, its
+    percentile confidence interval and the share of paths where the model scores higher.
+    '''
+    tail = (1 - confidence) / 2 * 100
+    table = distributions.pivot(index='path', columns='model', values=list(METRICS))
+    rows = []
+    for model_name in distributions['model'].unique():
+        if model_name == baseline:
+            continue
+        for metric in METRICS:
+            difference = (table[(metric, model_name)] - table[(metric, baseline)]).values
+            rows.append({'model': model_name, 'baseline': baseline, 'metric': metric,
+                         'mean_difference': difference.mean(),
+                         'ci_low': np.percentile(difference, tail), 'ci_high': np.percentile(difference, 100 - tail),
+                         'share_higher': (difference > 0).mean()})
+    return pd.DataFrame(rows)
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+
+class SampleCache():
+    """
+    Content-addressed on-disk store of generated samples.
+
+    Each entry is a .npy file named after the hash of everything that produced it,
+    loaded memory-mapped. Reads refresh the entry's modification time and the least
+    recently used entries are evicted once the store grows beyond max_bytes.
+    """
+    def __init__(self, cache_dir, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, **fields):
+        '''
+        Hashes the fields that identify an entry, e.g. generator name, params, window, data fingerprint and seed.
+        '''
+        payload = json.dumps(fields, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            sample = np.load(path, mmap_mode='r')
+        except (FileNotFoundError, ValueError):
+            return None
+        # mark the entry as recently used
+        os.utime(path)
+        return sample
+
+    def put(self, key, sample):
+        path = self._path(key)
+        # write to a temporary file first so concurrent readers never see a partial entry
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(sample))
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def _evict(self):
+        evict_lru(self.cache_dir, '.npy', self.max_bytes)
+
+
+def evict_lru(cache_dir, suffix, max_bytes):
+    '''
+    Removes the least recently modified files ending in suffix until the ones left fit in max_bytes.
+    '''
+    if max_bytes is None:
+        return
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(suffix):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_bytes -= size
+
+
+def data_fingerprint(*frames):
+    '''
+    Hashes the values, index and columns of the given dataframes, skipping None.
+    '''
+    digest = hashlib.sha256()
+    for frame in frames:
+        if frame is None:
+            continue
+        digest.update(pd.util.hash_pandas_object(frame, index=True).values.tobytes())
+        digest.update(json.dumps(list(map(str, frame.columns))).encode())
+    return digest.hexdigest()
@@ -0,0 +1,141 @@
+'''
+Compresses a weighted sample of J scenarios into K weighted representatives before the
+Uryasev optimization, whose LP grows with the number of scenarios.
+
+The representatives carry their probability through the density argument of the optimizer,
+and cvar_error measures how well the reduced sample keeps the tail of the full one.
+'''
+# Third party imports
+import numpy as np
+from scipy import sparse
+
+REDUCTION_METHODS = ('kmeans', 'forward')
+
+
+def reduce_scenarios(sample, density=None, n_scenarios=2000, method='kmeans', chunk_size=2000, seed=None, alpha=0.95):
+    '''
+    Returns the (K, n) representatives of the (J, n) sample and their (K,) probabilities.
+
+    kmeans clusters the scenarios with a mini-batch k-means, fed chunk_size scenarios at a
+    time and weighted by density, and represents each cluster by its weighted mean. forward
+    runs the fast forward selection of Heitsch & Roemisch on chunks of chunk_size scenarios
+    and moves the probability of every dropped scenario to its closest kept one. Its cost is
+    quadratic in chunk_size. The chunks follow the tail severity of the scenarios, so tail
+    scenarios are only merged with each other, and each chunk keeps a share of the n_scenarios
+    proportional to its probability plus its probability beyond alpha.
+    Samples with no more than n_scenarios scenarios are returned unchanged.
+    '''
+    sample = np.asarray(sample, dtype=float)
+    density = np.full(len(sample), 1 / len(sample)) if density is None else np.asarray(density, dtype=float)
+    if len(sample) <= n_scenarios:
+        return sample, density
+    if method == 'kmeans':
+        return _kmeans_reduction(sample, density, n_scenarios, chunk_size, seed)
+    if method == 'forward':
+        return _chunked_forward_selection(sample, density, n_scenarios, chunk_size, alpha)
+    raise ValueError(f"Unknown scenario reduction method: {method}, expected one of {REDUCTION_METHODS}")
+
+
+def _kmeans_reduction(sample, density, n_scenarios, chunk_size, seed):
+    from sklearn.cluster import MiniBatchKMeans
+
+    # k-means++ seeding and a long convergence tail cost more than they gain on a 100x reduction
+    kmeans = MiniBatchKMeans(n_clusters=n_scenarios, batch_size=min(chunk_size, len(sample)), init='random',
+                             n_init=1, max_no_improvement=3, random_state=seed)
+    labels = kmeans.fit_predict(sample, sample_weight=density)
+
+    # exact weighted means of the final clusters, instead of the running mini-batch centers
+    membership = sparse.csr_matrix((density, (labels, np.arange(len(sample)))), shape=(n_scenarios, len(sample)))
+    probabilities = np.asarray(membership.sum(axis=1)).ravel()
+    kept = probabilities > 0
+    representatives = (membership @ sample)[kept] / probabilities[kept, np.newaxis]
+    return representatives, probabilities[kept]
+
+
+def _chunked_forward_selection(sample, density, n_scenarios, chunk_size, alpha):
+    # chunks of scenarios of similar severity, so tail scenarios are not moved onto central ones
+    severity = _tail_severity(sample, density)
+    order = np.argsort(severity, kind='stable')
+    n_chunks = int(np.ceil(len(sample) / chunk_size))
+    bounds = np.linspace(0, len(sample), n_chunks + 1).astype(int)
+
+    # each chunk keeps a share of the representatives proportional to its probability plus its tail probability
+    mass = np.where(severity[order] > alpha, 2, 1) * density[order]
+    chunk_mass = np.add.reduceat(mass, bounds[:-1])
+    shares = np.diff(np.round(np.concatenate(([0], np.cumsum(chunk_mass))) / chunk_mass.sum() * n_scenarios).astype(int))
+    representatives, probabilities = [], []
+    for start, end, n_kept in zip(bounds[:-1], bounds[1:], shares):
+        chunk = order[start:end]
+        if n_kept == 0:
+            # too little probability for a representative of its own, kept whole by the closest one
+            n_kept = 1
+        chunk_representatives, chunk_probabilities = forward_selection(sample[chunk], density[chunk], n_kept)
+        representatives.append(chunk_representatives)
+        probabilities.append(chunk_probabilities)
+    return np.vstack(representatives), np.concatenate(probabilities)
+
+
+def _tail_severity(sample, density):
+    '''
+    Highest probability rank of each scenario's loss over the test portfolios of cvar_error:
+    a scenario among the worst 1 - alpha of any of them has a severity above alpha.
+    '''
+    losses = -sample @ _test_portfolios(sample.shape[1])
+    order = np.argsort(losses, axis=0)
+    ranks = np.empty_like(losses)
+    np.put_along_axis(ranks, order, np.cumsum(density[order], axis=0) / density.sum(), axis=0)
+    return ranks.max(axis=1)
+
+
+def forward_selection(sample, density, n_scenarios):
+    '''
+    Fast forward selection: greedily keeps the scenario that most reduces the probability
+    weighted distance of the dropped scenarios to their closest kept one.
+    '''
+    squared = (sample**2).sum(axis=1)
+    pairwise = np.sqrt(np.maximum(squared[:, np.newaxis] + squared[np.newaxis] - 2 * sample @ sample.T, 0))
+    distances = pairwise.copy()
+    selected = np.zeros(len(sample), dtype=bool)
+    for _ in range(min(n_scenarios, len(sample))):
+        # cost of keeping each candidate u: sum of p_j * distance(j, u) over the dropped j
+        costs = density[~selected] @ distances[~selected]
+        costs[selected] = np.inf
+        chosen = np.argmin(costs)
+        selected[chosen] = True
+        # distances now are to the closest of the candidate and the kept scenarios
+        np.minimum(distances, distances[:, [chosen]], out=distances)
+
+    kept = np.flatnonzero(selected)
+    closest = kept[np.argmin(pairwise[:, kept], axis=1)]
+    probabilities = np.bincount(closest, weights=density, minlength=len(sample))[kept]
+    return sample[kept], probabilities
+
+
+def weighted_cvar(losses, density, alpha=0.95):
+    '''
+    CVaR at alpha of every column of the (J, portfolios) losses under the scenario probabilities.
+    '''
+    order = np.argsort(losses, axis=0)
+    sorted_losses = np.take_along_axis(losses, order, axis=0)
+    probabilities = density[order] / density.sum()
+    cumulative = np.cumsum(probabilities, axis=0)
+    var_index = np.argmax(cumulative >= alpha, axis=0)
+    var = np.take_along_axis(sorted_losses, var_index[np.newaxis], axis=0)[0]
+    return var + (probabilities * np.maximum(sorted_losses - var, 0)).sum(axis=0) / (1 - alpha)
+
+
+def cvar_error(sample, density, reduced_sample, reduced_density, alpha=0.95):
+    '''
+    Largest absolute CVaR difference between the full and the reduced samples over a set of
+    test portfolios: the equal weight portfolio and every single asset portfolio.
+    '''
+    density = np.full(len(sample), 1 / len(sample)) if density is None else np.asarray(density, dtype=float)
+    portfolios = _test_portfolios(sample.shape[1])
+    full = weighted_cvar(-np.asarray(sample) @ portfolios, density, alpha)
+    reduced = weighted_cvar(-np.asarray(reduced_sample) @ portfolios, np.asarray(reduced_density), alpha)
+    return np.abs(full - reduced).max()
+
+
+def _test_portfolios(n):
+    # the equal weight portfolio and every single asset portfolio, one per column
+    return np.hstack([np.full((n, 1), 1 / n), np.identity(n)])
@@ -0,0 +1,191 @@
+'''
+Runs a grid of backtest configs, computing each distinct upstream stage only once.
+
+Usage: python -m src.sweep --grid '{"cvar": [0.01, 0.05, 0.1], "sample_size": [500, 1000]}'
+           [--config ./config.json] [--output ./sweep_results.csv]
+'''
+# Standard library imports
+import argparse
+import copy
+import itertools
+import json
+
+# Third party imports
+import pandas as pd
+
+# Local application imports
+from src.backtester import Backtester, _optimize_batch_cell, _optimize_cell
+from src.executor import get_executor, run_cells
+from src.utils import MarketData
+
+# keys that only affect how or where a run executes, never its results
+RUN_KEYS = ('executor', 'n_jobs', 'create_visualizations', 'plot_3d_points', 'read_samples', 'read_backtest',
+            'samples_cache_path', 'samples_cache_max_mb', 'preprocessing_cache_path', 'preprocessing_cache_max_mb',
+            'data_cache_dir', 'spill_dir', 'trace', 'trace_memory', 'trace_path', 'generate_multiple_backstests',
+            'alpha_range', 'cvar_range', 'frontier_path', 'stream_samples', 'batch_optimization', 'batch_mode',
+            'robustness', 'bootstrap_paths', 'bootstrap_block_days', 'bootstrap_chunk_size', 'bootstrap_confidence',
+            'robustness_path')
+DENSITY_KEYS = ('density_kernel', 'density_bandwidth', 'density_top_k')
+REDUCTION_KEYS = ('scenario_reduction', 'reduced_scenarios', 'reduction_chunk_size')
+OPTIMIZATION_KEYS = ('alpha', 'cvar', 'bounds', 'turnover_penalty', 'max_turnover', 'min_lot')
+BACKTEST_KEYS = ('daily_mark_to_market', 'risk_window', 'risk_step', 'transaction_cost_bps')
+
+# keys each stage does not depend on, any other key is assumed to change the stage
+STAGE_IGNORED_KEYS = {
+    'data': RUN_KEYS + DENSITY_KEYS + REDUCTION_KEYS + OPTIMIZATION_KEYS + BACKTEST_KEYS + ('model_names', 'generator_params', 'sample_size', 'seed'),
+    'samples': RUN_KEYS + DENSITY_KEYS + REDUCTION_KEYS + OPTIMIZATION_KEYS + BACKTEST_KEYS,
+    'problems': RUN_KEYS + OPTIMIZATION_KEYS + BACKTEST_KEYS,
+    'portfolios': RUN_KEYS + BACKTEST_KEYS,
+}
+
+
+def stage_key(config, stage):
+    '''
+    Identifies the result of a stage by the config keys it depends on. Reduced problems also
+    depend on alpha, which shares out the representatives and measures the reduction error.
+    '''
+    ignored = STAGE_IGNORED_KEYS[stage]
+    if stage == 'problems' and config.get('scenario_reduction') is not None:
+        ignored = tuple(k for k in ignored if k != 'alpha')
+    relevant = {k: v for k, v in config.items() if k not in ignored}
+    return json.dumps(relevant, sort_keys=True, default=str)
+
+
+def group_by(items, key):
+    groups = {}
+    for item in items:
+        groups.setdefault(key(item), []).append(item)
+    return groups
+
+
+class Sweep():
+    """
+    Cartesian grid of configs over a base config, run stage by stage.
+
+    Points sharing the data, the samples (same models, sample_size, lookback, seed, ...) or the
+    optimization problems (same density settings) reuse them, so a grid over alpha and cvar
+    generates its samples once. The optimization cells of every point of a sample group are
+    fanned out on a single executor, and the backtest and metrics of each point follow.
+    """
+    def __init__(self, base_config, grid):
+        self.base_config = base_config
+        self.grid = grid
+        self.points = [dict(base_config, **dict(zip(grid.keys(), values))) for values in itertools.product(*grid.values())]
+        self.stage_counts = {}
+        self.backtests = {}
+
+    def run(self):
+        '''
+        Runs every point of the grid and returns one row per point and model with its metrics.
+        '''
+        indexed_points = list(enumerate(self.points))
+        self.stage_counts = {stage: len(group_by(self.points, lambda c: stage_key(c, stage))) for stage in STAGE_IGNORED_KEYS}
+
+        executor = get_executor(backend=self.base_config.get('executor', 'serial'), n_jobs=self.base_config.get('n_jobs', 1))
+        with executor:
+            for data_points in group_by(indexed_points, lambda p: stage_key(p[1], 'data')).values():
+                market_data = MarketData(data_points[0][1])
+                for sample_points in group_by(data_points, lambda p: stage_key(p[1], 'samples')).values():
+                    self._run_sample_group(executor, market_data, sample_points)
+
+        rows = []
+        for index, config in indexed_points:
+            for model_name, results in self.backtests[index].items():
+                row = {name: config[name] for name in self.grid}
+                row.update(model=model_name,
+                           annualized_return=results['annualized_return'],
+                           cvar_expost=results['cvar_expost'],
+                           mean_hhi=results['mean_hhi'],
+                           mean_rotation=results['mean_rotation'],
+                           max_drawdown=results['max_drawdown'],
+                           daily_cvar=results['daily_cvar'],
+                           sortino=results['sortino'],
+                           turnover_cost=results['turnover_cost'],
+                           tracking_error=results['tracking_error'],
+                           reduction_cvar_error=results.get('reduction_cvar_error'))
+                rows.append(row)
+        return pd.DataFrame(rows)
+
+    def _run_sample_group(self, executor, market_data, sample_points):
+        backtester = Backtester(asset_prices=market_data.asset_prices, asset_returns=market_data.asset_returns,
+                                config=sample_points[0][1], rebalance_dates=market_data.rebalance_dates,
+                                features=market_data.features)
+        samples = backtester.generate_samples()
+        model_names = [generator.name for generator in backtester.generators]
+
+        # scenario densities and reductions only depend on the density and reduction settings of each point
+        cells = []
+        # turnover aware points solve the dates of a model in order, in one cell per model
+        path_cells = []
+        growth = backtester._rebalance_growth(backtester.rebalance_dates)
+        portfolio_points = {}
+        # reduction errors of the problems each portfolio group was optimized on
+        portfolio_errors = {}
+        for problem_points in group_by(sample_points, lambda p: stage_key(p[1], 'problems')).values():
+            problem_backtester = self._with_config(backtester, problem_points[0][1])
+            problems = {(rebalance_date, model_name): problem_backtester._prepare_sample(samples[rebalance_date][model_name], rebalance_date, model_name)
+                        for rebalance_date in backtester.rebalance_dates for model_name in model_names}
+
+            for portfolio_key, points in group_by(problem_points, lambda p: stage_key(p[1], 'portfolios')).items():
+                portfolio_points[portfolio_key] = points
+                portfolio_errors[portfolio_key] = problem_backtester.reduction_errors
+                optimization = self._with_config(backtester, points[0][1])._optimization()
+                if optimization.tracks_turnover:
+                    for model_name in model_names:
+                        model_problems = [problems[(rebalance_date, model_name)] for rebalance_date in backtester.rebalance_dates]
+                        path_cells.append(((None, model_name, portfolio_key), (optimization, model_problems,
+                                                                               backtester.rebalance_dates, 'sequential', growth)))
+                    continue
+                for (rebalance_date, model_name), (sample_assets, density) in problems.items():
+                    cells.append(((rebalance_date, model_name, portfolio_key), (optimization, sample_assets, density)))
+        del samples
+
+        phase = backtester.tracer.start_phase("SWEEP OPTIMIZATION", len(cells) + len(path_cells))
+        results = run_cells(executor, _optimize_cell, cells, tracer=backtester.tracer, name="CVaR optimization")
+        path_results = run_cells(executor, _optimize_batch_cell, path_cells, tracer=backtester.tracer,
+                                 name="Turnover aware CVaR optimization")
+        phase.end()
+
+        for portfolio_key, points in portfolio_points.items():
+            portfolios = {}
+            for model_name in model_names:
+                if (None, model_name, portfolio_key) in path_results:
+                    weights = path_results[(None, model_name, portfolio_key)].values
+                else:
+                    weights = [results[(rebalance_date, model_name, portfolio_key)].values
+                               for rebalance_date in backtester.rebalance_dates]
+                portfolios[model_name] = pd.DataFrame(weights, index=backtester.rebalance_dates,
+                                                      columns=backtester.asset_returns.columns)
+            for index, config in points:
+                point_backtester = self._with_config(backtester, config, portfolio_errors[portfolio_key])
+                backtests = point_backtester.backtest_portfolios(historical_portfolios=portfolios)
+                self.backtests[index] = point_backtester.compute_metrics(backtests=backtests)
+
+    def _with_config(self, backtester, config, reduction_errors=None):
+        '''
+        Shallow copy of a backtester that shares its data and generators under another config.
+        The copy gets its own reduction errors, those of its problems when given.
+        '''
+        point_backtester = copy.copy(backtester)
+        point_backtester.config = config
+        point_backtester.reduction_errors = {} if reduction_errors is None else reduction_errors
+        point_backtester.cvar = config['cvar']
+        point_backtester.alpha = config['alpha']
+        point_backtester.bounds = config['bounds']
+        return point_backtester
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', default='./config.json')
+    parser.add_argument('--grid', required=True, help='JSON object of config key -> list of values, or a path to one')
+    parser.add_argument('--output', default='./sweep_results.csv')
+    args = parser.parse_args()
+
+    config = json.load(open(args.config))
+    grid = json.loads(args.grid) if args.grid.lstrip().startswith('{') else json.load(open(args.grid))
+    sweep = Sweep(config, grid)
+    table = sweep.run()
+    table.to_csv(args.output, index=False)
+    print(f"{len(sweep.points)} points, stages run: {sweep.stage_counts}")
+    print(f"Sweep results saved to: {args.output}")
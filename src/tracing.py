@@ -0,0 +1,202 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class Span():
+    """
+    A timed section of a run. Ending it emits a span event with its wall time, the process
+    CPU time spent meanwhile and, when the tracer traces memory, the peak traced memory
+    allocated above the level it started at.
+    """
+    def __init__(self, tracer, name, category, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.attrs = attrs
+        self.peak = 0
+
+    def start(self):
+        if self.tracer.trace_memory:
+            _push_memory(self)
+        self.start_time = time.time()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        return self
+
+    def end(self):
+        wall = time.perf_counter() - self.start_wall
+        cpu = time.process_time() - self.start_cpu
+        peak_memory = _pop_memory(self) if self.tracer.trace_memory else None
+        self.tracer.emit({'type': 'span', 'name': self.name, 'category': self.category,
+                          'start': self.start_time, 'wall': wall, 'cpu': cpu, 'peak_memory': peak_memory,
+                          'pid': os.getpid(), 'tid': threading.get_ident(), 'attrs': self.attrs})
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.end()
+        return False
+
+
+class _NullSpan():
+    def start(self):
+        return self
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer():
+    """
+    Collects the span events of a run and forwards every event to its listeners.
+
+    Spans come in three categories: 'phase' for the stages of a backtest, 'cell' for each
+    (date, model) cell and 'step' for the sub-steps inside generators and optimizers.
+    Phases and cells are always emitted, since they drive the progress display, while step
+    spans are only measured when the tracer is enabled. Events are only kept when enabled.
+    """
+    def __init__(self, enabled=False, trace_memory=False):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.events = []
+        self.listeners = []
+
+    def __getstate__(self):
+        # tracers shipped to worker processes with a backtester don't carry the run's events
+        state = self.__dict__.copy()
+        state.update(events=[], listeners=[])
+        return state
+
+    def settings(self):
+        return {'enabled': self.enabled, 'trace_memory': self.trace_memory}
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def span(self, name, category='step', **attrs):
+        if category == 'step' and not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, category, attrs)
+
+    def start_phase(self, name, total_steps):
+        '''
+        Starts a phase of total_steps cells, ended by calling end() on the returned span.
+        '''
+        self.emit({'type': 'phase_start', 'name': name, 'total_steps': total_steps, 'start': time.time()})
+        return self.span(name, category='phase', total_steps=total_steps).start()
+
+    def emit(self, event):
+        if self.enabled:
+            self.events.append(event)
+        for listener in self.listeners:
+            listener(event)
+
+    def replay(self, events):
+        '''
+        Emits the events recorded by a cell that may have run in another process.
+        '''
+        for event in events:
+            self.emit(event)
+
+    @contextmanager
+    def activate(self):
+        '''
+        Makes this tracer the one module level span() calls record to on this thread.
+        '''
+        previous = getattr(_local, 'tracer', None)
+        _local.tracer = self
+        try:
+            yield self
+        finally:
+            _local.tracer = previous
+
+    def export(self, path):
+        '''
+        Writes the kept events as Chrome trace format if path ends with .json, else as JSON lines.
+        '''
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            if path.endswith('.json'):
+                json.dump(self.to_chrome_trace(), f, default=str)
+            else:
+                for event in self.events:
+                    f.write(json.dumps(event, default=str) + '\n')
+
+    def to_chrome_trace(self):
+        trace_events = []
+        for event in self.events:
+            if event['type'] != 'span':
+                continue
+            args = dict(event['attrs'], cpu_s=event['cpu'])
+            if event['peak_memory'] is not None:
+                args['peak_memory_bytes'] = event['peak_memory']
+            trace_events.append({'name': event['name'], 'cat': event['category'], 'ph': 'X',
+                                 'ts': event['start'] * 1e6, 'dur': event['wall'] * 1e6,
+                                 'pid': event['pid'], 'tid': event['tid'], 'args': args})
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+
+def span(name, **attrs):
+    '''
+    Step span on the tracer active on this thread, a no-op when there is none or it is disabled.
+    '''
+    tracer = getattr(_local, 'tracer', None)
+    if tracer is None or not tracer.enabled:
+        return _NULL_SPAN
+    return Span(tracer, name, 'step', attrs)
+
+
+def _push_memory(span):
+    # tracemalloc has a single peak, so it is reset per span and handed back to the enclosing spans
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    stack = _local.__dict__.setdefault('memory_stack', [])
+    current, peak = tracemalloc.get_traced_memory()
+    if stack:
+        stack[-1].peak = max(stack[-1].peak, peak)
+    tracemalloc.reset_peak()
+    span.base_memory = current
+    span.peak = current
+    stack.append(span)
+
+
+def _pop_memory(span):
+    stack = _local.__dict__.setdefault('memory_stack', [])
+    span.peak = max(span.peak, tracemalloc.get_traced_memory()[1])
+    if span in stack:
+        stack.remove(span)
+    if stack:
+        stack[-1].peak = max(stack[-1].peak, span.peak)
+    return span.peak - span.base_memory
+
+
+def traced_cell(fn, settings, name, key, args):
+    '''
+    Runs a (date, model) cell under its own tracer and returns its result with the events it
+    recorded, so cells running in worker processes can be replayed on the calling tracer.
+    '''
+    tracer = Tracer(**settings)
+    events = []
+    tracer.subscribe(events.append)
+    rebalance_date, model_name = key[:2]
+    with tracer.activate(), tracer.span(name, category='cell', date=rebalance_date, model=model_name):
+        result = fn(*args)
+    return result, events
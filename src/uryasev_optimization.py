@@ -1,85 +1,367 @@
+import copy
+
 import numpy as np
+from scipy import sparse
 from scipy.optimize import linprog
 import pandas as pd
 
+from src.scenario_reduction import weighted_cvar
+from src.tracing import span
+
+# Try to import highspy for warm-started re-solves, fallback to scipy's linprog if not available
+try:
+    import highspy
+    HAS_HIGHSPY = True
+except ImportError:
+    HAS_HIGHSPY = False
+
 
 
 class UryasevOptimization():
     """
     Represents an Uryasev & Rockafeller optimization.
+
+    The budget restriction is sum(w) <= 1 and the rest of the portfolio is held in cash, so
+    portfolios are returned as they were solved, in percent, and may sum to less than 100.
+    Weights under 1% are only dropped when the portfolio without them still meets the CVaR
+    (and turnover) restrictions; otherwise the problem is solved again without those assets.
+    Given the previous weights, the problem can also account for turnover: turnover_penalty
+    is subtracted from the expected return per unit of weight bought or sold, and max_turnover
+    caps the two-way turnover. With min_lot, every weight is either 0 or at least min_lot,
+    which makes the problem a mixed integer LP solved by HiGHS' branch and bound.
     """
-    def __init__(self, alpha, cvar, bounds):
+    def __init__(self, alpha, cvar, bounds, turnover_penalty=0.0, max_turnover=None, min_lot=None):
         self.alpha = alpha
         self.cvar = cvar
         self.bounds = bounds
-    
-    def get_optimal_portfolio(self, sample, density=None):
+        self.turnover_penalty = turnover_penalty or 0.0
+        self.max_turnover = max_turnover
+        self.min_lot = min_lot
+
+    @property
+    def tracks_turnover(self):
+        '''
+        Whether portfolios depend on the previous ones, so dates must be solved in order.
+        '''
+        return self.turnover_penalty > 0 or self.max_turnover is not None
+
+    def get_optimal_portfolio(self, sample, density=None, previous=None, excluded=None):
         '''
         Generates and resolves Uryasev's optimization problem.
+        previous are the fractional weights held before rebalancing, None for a first investment,
+        and excluded a boolean mask of assets whose weight is fixed to zero.
         '''
-        # define the probabilities for each window, all equal in this simple model
-        if density is None:
-                density = np.ones(len(sample))/len(sample)
-        # our expected return will be the mean of the distribution
-        mu = sample.T.dot(density)
-        # start building the matrix for the linear optimization
-        J = sample.shape[0]
         n = sample.shape[1]
-        A = np.zeros((1 + J + J + 1 , 1 + n + J))
-        b = np.zeros((1 + J + J + 1))
-        i = 0
-        c = np.zeros(1 + n + J)
-        v = [(0, None) for x in range((1 + n + J))]
-        
-        # build bounds
-        for i in range(n):
-                v[1 + i] = self.bounds
-        # build objetive function
-        for i in range(n):
-                c[1 + i] = - mu[i]   
-        # build restrictions
-        for i in range(np.size(A, axis=0)):
-                for k in range(np.size(A, axis=1)):
-                        # cvar restriction
-                        if i==0:
-                                b[i] = self.cvar
-                                if k==0:
-                                        A[i, k] = 1
-                                elif k in range(1 + n, 1 + n + J):
-                                        A[i, k] = (1 - self.alpha)**-1*density[k -(1 + n)]
-                        # select samples under threshold
-                        elif i in range(1, 1+J):
-                                b[i] = 0
-                                if k == 0:
-                                        A[i,k] = -1
-                                elif k in range(1, 1 + n):
-                                        A[i,k] = -sample[i - 1, k - 1]
-                                elif k in range(1 + n, 1 + n + J) and (i - 1) == (k - (1 + n)):
-                                        A[i,k] = -1
-                        # z non-negativity
-                        elif i in range(1 + J, 1 + J + J):
-                                b[i] = 0
-                                if k in range(1 + n, 1 + n + J) and (i-(1 + J))==(k - (1 + n)):
-                                        A[i,k] = -1
-                        # 100% max investment (non-leveraged fund)
-                        elif i in range(1 + J + J, 1 + J + J + 1):
-                                b[i] = 1
-                                if k in range(1, 1 + n):
-                                        A[i,k] = 1
+        with span('lp.build', scenarios=len(sample)):
+            c, A, b, v = self.build_problem(sample, density, previous)
+        if excluded is not None:
+            v = [(0, 0) if 1 <= i <= n and excluded[i - 1] else bound for i, bound in enumerate(v)]
+
         # solve the problem
-        optimal_result = linprog(c, A_ub=A, b_ub=b, bounds=v, options={"disp": False})
-        
+        with span('lp.solve', scenarios=len(sample)):
+            optimal_result = linprog(c, A_ub=A, b_ub=b, bounds=v, method='highs', options={"disp": False},
+                                     integrality=self._integrality(len(c), n))
+
+        if not optimal_result.success and previous is not None and self.max_turnover is not None:
+            # the cvar restriction may not be reachable within the turnover cap
+            print(f"Optimization failed within max_turnover={self.max_turnover}, solving without the cap")
+            relaxed = copy.copy(self)
+            relaxed.max_turnover = None
+            return relaxed.get_optimal_portfolio(sample, density, previous, excluded)
+
         # Debug: Check if CVaR constraint is binding
         if not optimal_result.success:
             print(f"Optimization failed: {optimal_result.message}")
-        
-        optimal_portfolio = optimal_result.x[1:n+1]
-        optimal_portfolio = pd.Series(optimal_portfolio)
-        # remove scraps
-        optimal_portfolio[optimal_portfolio<0.01] = 0
-        optimal_portfolio /= optimal_portfolio.sum()
-        optimal_portfolio *= 100
-        
-        return optimal_portfolio
-
-    
+
+        weights = optimal_result.x[1:n+1]
+        scraps = self._scraps(weights)
+        if not scraps.any():
+            return self._as_percent(weights)
+        if self.is_feasible(np.where(scraps, 0, weights), sample, density, previous):
+            return self._as_percent(np.where(scraps, 0, weights))
+        if optimal_result.success:
+            # dropping the scraps breaks a restriction, so the problem is solved without those assets
+            excluded = scraps if excluded is None else excluded | scraps
+            return self.get_optimal_portfolio(sample, density, previous, excluded=excluded)
+        return self._as_percent(weights)
+
+    def get_optimal_portfolios(self, problems, index=None, mode='sequential', batch_size=None, growth=None):
+        '''
+        Resolves Uryasev's problem for a list of (sample, density) pairs, e.g. every rebalance date of a model.
+
+        When the problem tracks turnover, the problems are solved in order and each one starts
+        from the previous portfolio, drifted by growth, the per asset price ratio since the
+        previous problem (no drift when growth is None).
+
+        With mode='block' the independent problems are stacked into one block-diagonal LP and
+        solved with a single linprog call, batch_size problems at a time (all of them by default).
+        HiGHS' simplex scales worse than linearly with the stacked size, so this only pays off
+        for very small samples; mode='sequential' solves them one after another.
+        Returns a dataframe of weights with one row per problem, indexed by index.
+        '''
+        if mode == 'sequential':
+            portfolios = []
+            for k, (sample, density) in enumerate(problems):
+                previous = None
+                if self.tracks_turnover and portfolios:
+                    previous = drift_weights(portfolios[-1] / 100, None if growth is None else growth[k])
+                portfolios.append(self.get_optimal_portfolio(sample, density, previous).values)
+            return pd.DataFrame(portfolios, index=index)
+        if mode != 'block':
+            raise ValueError(f"Unknown batch mode: {mode}")
+        if self.tracks_turnover:
+            raise ValueError("Turnover aware problems depend on each other, use mode='sequential'")
+
+        batch_size = batch_size or len(problems)
+        portfolios = []
+        for batch_start in range(0, len(problems), batch_size):
+            batch = problems[batch_start:batch_start + batch_size]
+            blocks = [self.build_problem(sample, density) for sample, density in batch]
+            c = np.concatenate([block[0] for block in blocks])
+            A = sparse.block_diag([block[1] for block in blocks], format='csr')
+            b = np.concatenate([block[2] for block in blocks])
+            v = [bound for block in blocks for bound in block[3]]
+            integrality = None
+            if self.min_lot is not None:
+                integrality = np.concatenate([self._integrality(len(block[0]), sample.shape[1])
+                                              for (sample, _), block in zip(batch, blocks)])
+
+            optimal_result = linprog(c, A_ub=A, b_ub=b, bounds=v, method='highs', options={"disp": False},
+                                     integrality=integrality)
+            if not optimal_result.success:
+                print(f"Optimization failed: {optimal_result.message}")
+
+            # each block is laid out as [threshold, n weights, J shortfalls]
+            offset = 0
+            for (sample, density), block in zip(batch, blocks):
+                n = sample.shape[1]
+                portfolios.append(self._clean_portfolio(optimal_result.x[offset + 1:offset + n + 1], sample, density).values)
+                offset += len(block[0])
+
+        return pd.DataFrame(portfolios, index=index)
+
+    def get_frontier(self, sample, density=None, alpha_range=None, cvar_range=None):
+        '''
+        Resolves Uryasev's problem for every (alpha, cvar) pair of the grid.
+
+        The linear program is built once and each grid point only changes the
+        threshold coefficient and the right hand side of the cvar restriction,
+        so with highspy installed every solve is warm started from the previous
+        basis. Returns one row per grid point with the alpha, the cvar and the
+        weights of the n assets.
+        '''
+        alpha_range = [self.alpha] if alpha_range is None else alpha_range
+        cvar_range = [self.cvar] if cvar_range is None else cvar_range
+        n = sample.shape[1]
+        c, A, b, v = self.build_problem(sample, density)
+
+        integrality = self._integrality(len(c), n)
+        if HAS_HIGHSPY:
+            solve = self._highs_solver(c, A, b, v, integrality)
+        else:
+            solve = self._linprog_solver(c, A, b, v, integrality)
+
+        rows = []
+        for alpha in alpha_range:
+            for cvar in cvar_range:
+                success, x = solve(alpha, cvar)
+                if not success:
+                    print(f"Optimization failed for alpha={alpha}, cvar={cvar}")
+                    continue
+                portfolio = self._clean_portfolio(x[1:n+1], sample, density, alpha=alpha, cvar=cvar)
+                rows.append([alpha, cvar] + portfolio.tolist())
+
+        return pd.DataFrame(rows, columns=['alpha', 'cvar'] + list(range(n)))
+
+    def build_problem(self, sample, density=None, previous=None):
+        '''
+        Builds the linear program of Uryasev's problem as a sparse system.
+
+        Variables are ordered as [VaR threshold, n weights, J shortfalls]. The
+        cvar restriction is scaled by (1 - alpha), so alpha only enters through
+        the threshold coefficient A[0, 0] and the right hand side b[0]. The
+        z >= 0 restrictions are expressed as variable bounds instead of rows, so
+        the system has J + 2 rows and J*(n + 2) + n + 1 non-zeros.
+
+        Given previous weights and a problem that tracks turnover, n buys and n sells
+        follow, bounded below by the weight changes: w - buy <= previous and
+        -w - sell <= -previous, plus the turnover cap sum(buy + sell) <= max_turnover.
+        With min_lot, n binary lot indicators come last, with w <= upper * lot and
+        min_lot * lot <= w.
+        '''
+        # define the probabilities for each window, all equal in this simple model
+        if density is None:
+                density = np.ones(len(sample))/len(sample)
+        sample = np.asarray(sample, dtype=float)
+        density = np.asarray(density, dtype=float)
+        J, n = sample.shape
+
+        # our expected return will be the mean of the distribution, maximized
+        c = np.zeros(1 + n + J)
+        c[1:1 + n] = -sample.T.dot(density)
+
+        # cvar restriction: (1 - alpha) * threshold + sum(p_j * z_j) <= (1 - alpha) * cvar
+        cvar_row = sparse.csr_matrix(np.concatenate(([1 - self.alpha], np.zeros(n), density)))
+        # select samples under threshold: -threshold - r_j.w - z_j <= 0
+        shortfall_rows = sparse.hstack([
+                sparse.csr_matrix(-np.ones((J, 1))),
+                sparse.csr_matrix(-sample),
+                -sparse.identity(J, format='csr'),
+        ])
+        # 100% max investment (non-leveraged fund)
+        budget_row = sparse.csr_matrix(np.concatenate(([0.0], np.ones(n), np.zeros(J))))
+
+        A = sparse.vstack([cvar_row, shortfall_rows, budget_row], format='csr')
+        b = np.zeros(J + 2)
+        b[0] = (1 - self.alpha) * self.cvar
+        b[-1] = 1
+
+        v = [(0, None)] + [tuple(self.bounds)] * n + [(0, None)] * J
+
+        turnover = previous is not None and self.tracks_turnover
+        lots = self.min_lot is not None
+        if not (turnover or lots):
+            return c, A, b, v
+
+        # extra variables are appended as new columns, so the first row still starts with the threshold
+        n_extra = (2 * n if turnover else 0) + (n if lots else 0)
+        base = A.shape[1]
+        A = sparse.hstack([A, sparse.csr_matrix((A.shape[0], n_extra))], format='csr')
+        c = np.concatenate([c, np.zeros(n_extra)])
+        identity = sparse.identity(n, format='csr')
+        rows, rhs = [A], [b]
+        if turnover:
+            previous = np.asarray(previous, dtype=float)
+            buys, sells = base, base + n
+            c[buys:sells + n] = self.turnover_penalty
+            rows.append(self._place(n, base + n_extra, [(1, identity), (buys, -identity)]))
+            rows.append(self._place(n, base + n_extra, [(1, -identity), (sells, -identity)]))
+            rhs += [previous, -previous]
+            if self.max_turnover is not None:
+                cap_row = np.zeros((1, base + n_extra))
+                cap_row[0, buys:sells + n] = 1
+                rows.append(sparse.csr_matrix(cap_row))
+                rhs.append([self.max_turnover])
+            v = v + [(0, None)] * (2 * n)
+        if lots:
+            lot_indicators = base + n_extra - n
+            rows.append(self._place(n, base + n_extra, [(1, identity), (lot_indicators, -self.bounds[1] * identity)]))
+            rows.append(self._place(n, base + n_extra, [(1, -identity), (lot_indicators, self.min_lot * identity)]))
+            rhs += [np.zeros(n), np.zeros(n)]
+            v = v + [(0, 1)] * n
+
+        return c, sparse.vstack(rows, format='csr'), np.concatenate(rhs), v
+
+    def _place(self, n_rows, n_cols, blocks):
+        '''
+        Sparse (n_rows, n_cols) rows holding each (first column, block) of blocks at its column.
+        '''
+        rows = sparse.lil_matrix((n_rows, n_cols))
+        for column, block in blocks:
+            rows[:, column:column + block.shape[1]] = block
+        return rows.tocsr()
+
+    def _integrality(self, n_vars, n):
+        # the lot indicators are the last n variables
+        if self.min_lot is None:
+            return None
+        integrality = np.zeros(n_vars)
+        integrality[-n:] = 1
+        return integrality
+
+    def is_feasible(self, weights, sample, density=None, previous=None, alpha=None, cvar=None, tolerance=1e-7):
+        '''
+        Whether fractional weights meet the budget, the CVaR restriction on the scenarios and,
+        given previous weights, the turnover cap.
+        '''
+        alpha = self.alpha if alpha is None else alpha
+        cvar = self.cvar if cvar is None else cvar
+        sample = np.asarray(sample, dtype=float)
+        density = np.full(len(sample), 1 / len(sample)) if density is None else np.asarray(density, dtype=float)
+        if weights.sum() > 1 + tolerance:
+            return False
+        if weighted_cvar(-(sample @ weights)[:, np.newaxis], density, alpha)[0] > cvar + tolerance:
+            return False
+        if previous is not None and self.max_turnover is not None and self.tracks_turnover:
+            return np.abs(weights - previous).sum() <= self.max_turnover + tolerance
+        return True
+
+    def _scraps(self, weights):
+        # with lots the solver already removed scraps and only rounding noise is left
+        return (weights > 0) & (weights < (1e-9 if self.min_lot is not None else 0.01))
+
+    def _clean_portfolio(self, weights, sample, density=None, alpha=None, cvar=None):
+        '''
+        Drops the scraps of the weights solved in a block or frontier, and when the portfolio
+        without them breaks the CVaR restriction, solves the problem again on its own, as
+        get_optimal_portfolio does, so every mode returns the same portfolio.
+        '''
+        cleaned = np.where(self._scraps(weights), 0, weights)
+        if self.is_feasible(cleaned, sample, density, alpha=alpha, cvar=cvar):
+            return self._as_percent(cleaned)
+        single = copy.copy(self)
+        single.alpha = self.alpha if alpha is None else alpha
+        single.cvar = self.cvar if cvar is None else cvar
+        return single.get_optimal_portfolio(sample, density)
+
+    def _as_percent(self, weights):
+        # solver noise may leave tiny negative weights, the rest of the portfolio is cash
+        return pd.Series(100 * np.maximum(weights, 0))
+
+    def _linprog_solver(self, c, A, b, v, integrality=None):
+        A = A.copy()
+        b = b.copy()
+
+        def solve(alpha, cvar):
+            # the threshold coefficient is the first stored value of the first row
+            A.data[A.indptr[0]] = 1 - alpha
+            b[0] = (1 - alpha) * cvar
+            result = linprog(c, A_ub=A, b_ub=b, bounds=v, method='highs', options={"disp": False},
+                             integrality=integrality)
+            return result.success, result.x
+
+        return solve
+
+    def _highs_solver(self, c, A, b, v, integrality=None):
+        lp = highspy.HighsLp()
+        lp.num_col_ = A.shape[1]
+        lp.num_row_ = A.shape[0]
+        lp.col_cost_ = c
+        lp.col_lower_ = np.array([low for low, _ in v], dtype=float)
+        lp.col_upper_ = np.array([highspy.kHighsInf if up is None else up for _, up in v], dtype=float)
+        lp.row_lower_ = np.full(A.shape[0], -highspy.kHighsInf)
+        lp.row_upper_ = b
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+        lp.a_matrix_.start_ = A.indptr
+        lp.a_matrix_.index_ = A.indices
+        lp.a_matrix_.value_ = A.data
+        if integrality is not None:
+            lp.integrality_ = [highspy.HighsVarType.kInteger if integer else highspy.HighsVarType.kContinuous
+                               for integer in integrality]
+
+        highs = highspy.Highs()
+        highs.setOptionValue('output_flag', False)
+        highs.passModel(lp)
+
+        def solve(alpha, cvar):
+            # the model keeps its basis between runs, so each solve is warm started
+            highs.changeCoeff(0, 0, 1 - alpha)
+            highs.changeRowBounds(0, -highspy.kHighsInf, (1 - alpha) * cvar)
+            highs.run()
+            success = highs.getModelStatus() == highspy.HighsModelStatus.kOptimal
+            return success, np.asarray(highs.getSolution().col_value)
+
+        return solve
+
+
+def drift_weights(weights, growth=None):
+    '''
+    Fractional weights after each asset grew by growth, its price ratio over the period,
+    with the cash left out of the weights kept at its value.
+    '''
+    weights = np.asarray(weights, dtype=float)
+    if growth is None:
+        return weights
+    drifted = weights * growth
+    return drifted / (drifted.sum() + max(1 - weights.sum(), 0))
+
@@ -1,22 +1,123 @@
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from functools import cached_property
+
 import pandas as pd
 import numpy as np
+from scipy.spatial import cKDTree
 
 def load_data(config):
-    asset_prices = pd.read_csv(config['assets_path'], index_col=0)
-    asset_prices.index = pd.to_datetime(asset_prices.index)
-    asset_returns = asset_prices.pct_change(config['returns_timeframe'])
-
-    if config['use_features']:
-        asset_returns = asset_returns.shift(-1*config['returns_timeframe'])
-        features = pd.read_csv(config['features_path'], index_col=0)
-        features.index = pd.to_datetime(features.index)
-    else:
-        features = None
-    asset_returns = asset_returns.dropna()
+    market_data = MarketData(config)
+    return market_data.asset_prices, market_data.asset_returns, market_data.features, market_data.rebalance_dates
+
+class MarketData():
+    """
+    Input data of a backtest. Prices and features are read through the binary cache of
+    read_dated_csv and everything derived from them is only computed when first accessed.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.cache_dir = config.get('data_cache_dir', './cache/data')
+
+    @cached_property
+    def asset_prices(self):
+        return read_dated_csv(self.config['assets_path'], cache_dir=self.cache_dir)
+
+    @cached_property
+    def features(self):
+        if not self.config['use_features']:
+            return None
+        return read_dated_csv(self.config['features_path'], cache_dir=self.cache_dir)
+
+    @cached_property
+    def asset_returns(self):
+        asset_returns = self.asset_prices.pct_change(self.config['returns_timeframe'])
+        if self.config['use_features']:
+            asset_returns = asset_returns.shift(-1*self.config['returns_timeframe'])
+        return asset_returns.dropna()
+
+    @cached_property
+    def rebalance_dates(self):
+        # dates where we rebalance in backtest
+        return self.asset_prices.resample('Y').last().index[self.config['lookback_years']+1:-1]
+
+def read_dated_csv(path, cache_dir=None):
+    '''
+    Reads a csv indexed by date. With a cache_dir, the csv is parsed once and stored as a
+    float .npy of values, an int64 .npy of nanosecond dates and a json of columns; later
+    reads open the values memory-mapped. The cache is rebuilt when the source changes: a
+    new size or modification time triggers a content hash, and only a new hash rebuilds it.
+    '''
+    if cache_dir is None:
+        return _parse_dated_csv(path)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(path))[0]
+    prefix = os.path.join(cache_dir, f"{name}_{hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:12]}")
+    meta_path = f"{prefix}.json"
+    stat = os.stat(path)
+
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if (meta['mtime_ns'], meta['size']) != (stat.st_mtime_ns, stat.st_size):
+            if meta['sha256'] == _file_sha256(path):
+                # touched but unchanged, remember the new modification time
+                meta.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+                _write_json(meta_path, meta)
+            else:
+                meta = None
+
+    if meta is None:
+        data = _parse_dated_csv(path)
+        # written aside and moved in place, so readers holding a memory map keep the previous file
+        _save_npy(f"{prefix}_values.npy", np.ascontiguousarray(data.values, dtype=float))
+        _save_npy(f"{prefix}_index.npy", data.index.values.astype('datetime64[ns]').astype(np.int64))
+        meta = {'columns': data.columns.tolist(), 'index_name': data.index.name,
+                'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': _file_sha256(path)}
+        _write_json(meta_path, meta)
+
+    values = np.load(f"{prefix}_values.npy", mmap_mode='r')
+    index = pd.DatetimeIndex(np.load(f"{prefix}_index.npy").astype('datetime64[ns]'), name=meta['index_name'])
+    return pd.DataFrame(values, index=index, columns=meta['columns'], copy=False)
 
-    # dates where we rebalance in backtest
-    rebalance_dates = asset_prices.resample('Y').last().index[config['lookback_years']+1:-1]
-    return asset_prices, asset_returns, features, rebalance_dates
+def _parse_dated_csv(path):
+    data = pd.read_csv(path, index_col=0)
+    data.index = pd.to_datetime(data.index)
+    return data
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _write_json(path, content):
+    with _replaced(path, 'w') as f:
+        json.dump(content, f)
+
+def _save_npy(path, array):
+    with _replaced(path, 'wb') as f:
+        np.save(f, array)
+
+@contextmanager
+def _replaced(path, mode):
+    '''
+    File opened under a temporary name in the directory of path, which replaces path once written.
+    '''
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
 
 def zscore_euclidean(spot_feature, sampled_features):
     mu = sampled_features.mean()
@@ -26,5 +127,57 @@ def zscore_euclidean(spot_feature, sampled_features):
     distance = np.sqrt(((zscore - spot_zscore)**2).sum(axis=1))
     return distance
 
+def feature_density(sampled_features, spot_features, kernel='inverse', bandwidth=1.0, top_k=None):
+    '''
+    Weights each sampled scenario by the similarity of its features to the spot features.
+
+    sampled_features is a (J, f) array and spot_features a (f,) array or a (D, f) array of
+    several spot dates, giving (J,) or (D, J) densities that sum to one per spot. Kernels:
+        'inverse': 1 / distance on z-scored features (the original zscore_euclidean weighting).
+        'gaussian': exp(-distance^2 / (2 * bandwidth^2)) on z-scored features, computed relative
+            to the nearest scenario so spots far from every scenario don't underflow to zero.
+        'mahalanobis': 1 / Mahalanobis distance, with the inverse covariance of the sample.
+    With top_k, only the k nearest scenarios of each spot keep a weight, found with a KD-tree.
+    Exact matches get a tiny floor distance instead of dividing by zero.
+    '''
+    sampled_features = np.asarray(sampled_features, dtype=float)
+    spot_features = np.asarray(spot_features, dtype=float)
+    single_spot = spot_features.ndim == 1
+    spot_features = np.atleast_2d(spot_features)
+
+    # map the features to a space where the distance is euclidean
+    mu = sampled_features.mean(axis=0)
+    if kernel == 'mahalanobis':
+        # x @ transform has the norm of the Mahalanobis distance under the pseudo-inverse covariance,
+        # directions without variance (e.g. collinear features) are dropped as pinv does
+        eigenvalues, eigenvectors = np.linalg.eigh(np.atleast_2d(np.cov(sampled_features, rowvar=False)))
+        eigenvalues = np.clip(eigenvalues, 0, None)
+        kept = eigenvalues > 1e-15 * eigenvalues.max()
+        transform = eigenvectors * np.where(kept, 1 / np.sqrt(np.where(kept, eigenvalues, 1)), 0)
+    elif kernel in ('inverse', 'gaussian'):
+        sigma = sampled_features.std(axis=0, ddof=1)
+        transform = np.diag(1 / np.where(sigma > 0, sigma, 1))
+    else:
+        raise ValueError(f"Unknown density kernel: {kernel}")
+    points = (sampled_features - mu) @ transform
+    spots = (spot_features - mu) @ transform
+
+    if top_k is not None and top_k < len(points):
+        distances = np.full((len(spots), len(points)), np.inf)
+        neighbour_distances, neighbours = cKDTree(points).query(spots, k=top_k)
+        np.put_along_axis(distances, neighbours.reshape(len(spots), -1), neighbour_distances.reshape(len(spots), -1), axis=1)
+    else:
+        squared = (spots**2).sum(axis=1)[:, None] + (points**2).sum(axis=1)[None, :] - 2 * spots @ points.T
+        distances = np.sqrt(np.maximum(squared, 0))
+
+    if kernel == 'gaussian':
+        # the shift cancels in the normalization, as in a log-sum-exp
+        squared_distances = distances**2
+        weights = np.exp(-(squared_distances - squared_distances.min(axis=1, keepdims=True)) / (2 * bandwidth**2))
+    else:
+        weights = 1 / np.maximum(distances, 1e-12)
+    density = weights / weights.sum(axis=1, keepdims=True)
+    return density[0] if single_spot else density
+
 def save_file(matrix, path):
     np.savetxt(path, matrix, delimiter=",")
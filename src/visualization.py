@@ -1,231 +1,404 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import pandas as pd
 import numpy as np
 from datetime import datetime
 
+from src.executor import get_executor, run_cells
+
+CHART_FORMATS = ('png', 'svg', 'pdf', 'html')
+
+
+def draw_portfolio_allocations(fig, portfolios, model_name):
+    """
+    Stacked area chart of the portfolio allocations over time
+    """
+    ax = fig.subplots()
+    ax.stackplot(portfolios.index,
+                 *[portfolios[col]/100 for col in portfolios.columns],
+                 labels=portfolios.columns,
+                 alpha=0.7)
+
+    ax.set_title(f'Portfolio Allocations Over Time - {model_name}', fontsize=16, fontweight='bold')
+    ax.set_xlabel('Date', fontsize=12)
+    ax.set_ylabel('Portfolio Weight', fontsize=12)
+    ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+    ax.grid(True, alpha=0.3)
+    ax.tick_params(axis='x', rotation=45)
+    fig.tight_layout()
+
+
+def draw_cumulative_returns(fig, return_series):
+    """
+    Cumulative returns of every model
+    """
+    ax = fig.subplots()
+    for model_name, returns_series in return_series.items():
+        ax.plot(returns_series.index, returns_series.values,
+                linewidth=2, label=f'{model_name} Portfolio')
+
+    ax.set_title('Cumulative Portfolio Returns Comparison', fontsize=16, fontweight='bold')
+    ax.set_xlabel('Date', fontsize=12)
+    ax.set_ylabel('Cumulative Return (%)', fontsize=12)
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+    ax.tick_params(axis='x', rotation=45)
+    fig.tight_layout()
+
+
+# (metric, title, axis label, color, value format) of each panel of the risk metrics comparison
+RISK_PANELS = [
+    ('annualized_return', 'Annualized Returns (%)', 'Return (%)', 'skyblue', '{:.1f}%'),
+    ('cvar_expost', 'CVaR Ex-post (%)', 'CVaR (%)', 'salmon', '{:.1f}%'),
+    ('mean_hhi', 'Mean HHI (Diversification)', 'HHI (0=concentrated, 1=diversified)', 'lightgreen', '{:.3f}'),
+    ('mean_rotation', 'Mean Portfolio Rotation', 'Rotation', 'gold', '{:.1f}'),
+    ('max_drawdown', 'Max Daily Drawdown (%)', 'Drawdown (%)', 'indianred', '{:.1f}%'),
+    ('sortino', 'Sortino Ratio (daily)', 'Sortino', 'mediumpurple', '{:.2f}'),
+    ('turnover_cost', 'Turnover Cost (% per year)', 'Cost (%)', 'orange', '{:.2f}%'),
+    ('tracking_error', 'Tracking Error vs Equal Weight (%)', 'Tracking Error (%)', 'teal', '{:.1f}%'),
+]
+
+
+def draw_risk_metrics(fig, metrics):
+    """
+    Bar charts comparing the risk metrics of every model, given a dict of model -> metrics
+    """
+    models = list(metrics.keys())
+    axes = fig.subplots(2, len(RISK_PANELS) // 2).flatten()
+    for ax, (metric, title, label, color, value_format) in zip(axes, RISK_PANELS):
+        values = [metrics[model][metric] for model in models]
+        bars = ax.bar(models, values, color=color, alpha=0.7)
+        ax.set_title(title, fontweight='bold')
+        ax.set_ylabel(label)
+        for i, bar in enumerate(bars):
+            height = bar.get_height()
+            ax.text(bar.get_x() + bar.get_width()/2., height + height*0.01,
+                    value_format.format(values[i]), ha='center', va='bottom')
+
+    fig.suptitle('Portfolio Performance Metrics Comparison', fontsize=16, fontweight='bold')
+    fig.tight_layout()
+
+
+def draw_daily_risk(fig, drawdowns, rolling_cvar):
+    """
+    Daily drawdowns and rolling CVaR of every model, given dicts of model -> series
+    """
+    drawdown_ax, cvar_ax = fig.subplots(2, 1, sharex=True)
+    for model_name, serie in drawdowns.items():
+        drawdown_ax.plot(serie.index, serie.values, linewidth=1, label=f'{model_name} Portfolio')
+        drawdown_ax.fill_between(serie.index, serie.values, 0, alpha=0.15)
+    for model_name, serie in rolling_cvar.items():
+        cvar_ax.plot(serie.index, serie.values, linewidth=1.5, label=f'{model_name} Portfolio')
+
+    drawdown_ax.set_title('Daily Drawdown (%)', fontweight='bold')
+    drawdown_ax.set_ylabel('Drawdown (%)')
+    cvar_ax.set_title('Rolling Daily CVaR (%)', fontweight='bold')
+    cvar_ax.set_ylabel('CVaR (%)')
+    cvar_ax.set_xlabel('Date', fontsize=12)
+    for ax in (drawdown_ax, cvar_ax):
+        ax.legend()
+        ax.grid(True, alpha=0.3)
+    cvar_ax.tick_params(axis='x', rotation=45)
+    fig.suptitle('Daily Risk', fontsize=16, fontweight='bold')
+    fig.tight_layout()
+
+
+def draw_allocation_heatmap(fig, portfolios, model_name):
+    """
+    Heatmap of the asset allocations over time
+    """
+    ax = fig.subplots()
+    data = portfolios.T.values.astype(float)
+    im = ax.imshow(data, cmap='YlOrRd', aspect='auto')
+
+    cbar = fig.colorbar(im, ax=ax)
+    cbar.set_label('Allocation (%)', rotation=270, labelpad=15)
+
+    ax.set_xticks(range(len(portfolios.index)))
+    ax.set_xticklabels([d.strftime('%Y-%m') for d in portfolios.index], rotation=45)
+    ax.set_yticks(range(len(portfolios.columns)))
+    ax.set_yticklabels(portfolios.columns)
+
+    # Add text annotations
+    for i in range(len(portfolios.columns)):
+        for j in range(len(portfolios.index)):
+            ax.text(j, i, f'{data[i, j]:.1f}', ha="center", va="center", color="black", fontsize=8)
+
+    ax.set_title(f'Asset Allocation Heatmap - {model_name}', fontsize=16, fontweight='bold')
+    ax.set_xlabel('Rebalance Date', fontsize=12)
+    ax.set_ylabel('Asset', fontsize=12)
+    fig.tight_layout()
+
+
+def draw_equal_weight_comparison(fig, return_series, n_assets):
+    """
+    Portfolio performance against the equal weight baseline
+    """
+    ax = fig.subplots()
+    for model_name, returns_series in return_series.items():
+        ax.plot(returns_series.index, returns_series.values,
+                linewidth=2, label=f'{model_name} Portfolio')
+
+    equal_weight = 100 / n_assets
+    ax.axhline(y=100, color='black', linestyle='--', alpha=0.5,
+               label=f'Equal Weight Baseline ({equal_weight:.0f}% each)')
+
+    ax.set_title('Portfolio Performance vs Equal Weight Baseline', fontsize=16, fontweight='bold')
+    ax.set_xlabel('Date', fontsize=12)
+    ax.set_ylabel('Cumulative Return (%)', fontsize=12)
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+    ax.tick_params(axis='x', rotation=45)
+    fig.tight_layout()
+
+
+def plotly_portfolio_allocations(portfolios, model_name):
+    import plotly.graph_objects as go
+    figure = go.Figure([go.Scatter(x=portfolios.index, y=portfolios[col]/100, name=str(col), stackgroup='weights')
+                        for col in portfolios.columns])
+    figure.update_layout(title=f'Portfolio Allocations Over Time - {model_name}',
+                         xaxis_title='Date', yaxis_title='Portfolio Weight')
+    return figure
+
+
+def plotly_cumulative_returns(return_series):
+    import plotly.graph_objects as go
+    figure = go.Figure([go.Scatter(x=serie.index, y=serie.values, name=f'{model_name} Portfolio')
+                        for model_name, serie in return_series.items()])
+    figure.update_layout(title='Cumulative Portfolio Returns Comparison',
+                         xaxis_title='Date', yaxis_title='Cumulative Return (%)')
+    return figure
+
+
+def plotly_risk_metrics(metrics):
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    models = list(metrics.keys())
+    cols = len(RISK_PANELS) // 2
+    figure = make_subplots(rows=2, cols=cols, subplot_titles=[panel[1] for panel in RISK_PANELS])
+    for i, (metric, title, label, color, value_format) in enumerate(RISK_PANELS):
+        values = [metrics[model][metric] for model in models]
+        figure.add_trace(go.Bar(x=models, y=values, marker_color=color, opacity=0.7, showlegend=False,
+                                text=[value_format.format(value) for value in values]),
+                         row=i // cols + 1, col=i % cols + 1)
+    figure.update_layout(title='Portfolio Performance Metrics Comparison')
+    return figure
+
+
+def plotly_daily_risk(drawdowns, rolling_cvar):
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    figure = make_subplots(rows=2, cols=1, shared_xaxes=True,
+                           subplot_titles=['Daily Drawdown (%)', 'Rolling Daily CVaR (%)'])
+    for row, series in ((1, drawdowns), (2, rolling_cvar)):
+        for model_name, serie in series.items():
+            figure.add_trace(go.Scatter(x=serie.index, y=serie.values, name=f'{model_name} Portfolio',
+                                        legendgroup=model_name, showlegend=row == 1), row=row, col=1)
+    figure.update_layout(title='Daily Risk')
+    return figure
+
+
+def plotly_allocation_heatmap(portfolios, model_name):
+    import plotly.graph_objects as go
+    data = portfolios.T.values.astype(float)
+    figure = go.Figure(go.Heatmap(z=data, x=[d.strftime('%Y-%m') for d in portfolios.index],
+                                  y=[str(col) for col in portfolios.columns], colorscale='YlOrRd',
+                                  text=np.round(data, 1), texttemplate='%{text}',
+                                  colorbar={'title': 'Allocation (%)'}))
+    figure.update_layout(title=f'Asset Allocation Heatmap - {model_name}',
+                         xaxis_title='Rebalance Date', yaxis_title='Asset')
+    return figure
+
+
+def plotly_equal_weight_comparison(return_series, n_assets):
+    figure = plotly_cumulative_returns(return_series)
+    figure.add_hline(y=100, line_dash='dash', line_color='black', opacity=0.5,
+                     annotation_text=f'Equal Weight Baseline ({100 / n_assets:.0f}% each)')
+    figure.update_layout(title='Portfolio Performance vs Equal Weight Baseline')
+    return figure
+
+
+# chart kind -> (matplotlib drawing, figure size, plotly figure)
+CHARTS = {
+    'portfolio_allocations': (draw_portfolio_allocations, (14, 8), plotly_portfolio_allocations),
+    'cumulative_returns': (draw_cumulative_returns, (12, 8), plotly_cumulative_returns),
+    'risk_metrics': (draw_risk_metrics, (24, 10), plotly_risk_metrics),
+    'daily_risk': (draw_daily_risk, (14, 10), plotly_daily_risk),
+    'allocation_heatmap': (draw_allocation_heatmap, (12, 8), plotly_allocation_heatmap),
+    'equal_weight_comparison': (draw_equal_weight_comparison, (12, 8), plotly_equal_weight_comparison),
+}
+
+
+def render_chart(kind, kwargs, path, fmt='png', dpi=300):
+    '''
+    Renders a chart to path without the pyplot state machine, so charts can be rendered in
+    worker processes or a background thread. html charts are interactive plotly pages that
+    load plotly.js from its CDN.
+    '''
+    draw, figsize, plotly_figure = CHARTS[kind]
+    if fmt == 'html':
+        plotly_figure(**kwargs).write_html(path, include_plotlyjs='cdn')
+    else:
+        # a bare Figure renders through Agg for raster formats and the vector backends otherwise
+        fig = Figure(figsize=figsize)
+        draw(fig, **kwargs)
+        fig.savefig(path, format=fmt, dpi=dpi, bbox_inches='tight')
+    return path
+
+
 class PortfolioVisualizer:
     """
     Creates visualizations for portfolio optimization results
     """
-    
+
     def __init__(self, backtests, asset_names):
         self.backtests = backtests
         self.asset_names = asset_names
-        
+
     def plot_portfolio_allocations(self, model_name, save_path=None):
         """
         Create a stacked area chart showing portfolio allocations over time
         """
-        portfolios = self.backtests[model_name]['portfolios']
-        
-        plt.figure(figsize=(14, 8))
-        
-        # Create stacked area plot
-        plt.stackplot(portfolios.index, 
-                     *[portfolios[col]/100 for col in portfolios.columns], 
-                     labels=portfolios.columns,
-                     alpha=0.7)
-        
-        plt.title(f'Portfolio Allocations Over Time - {model_name}', fontsize=16, fontweight='bold')
-        plt.xlabel('Date', fontsize=12)
-        plt.ylabel('Portfolio Weight', fontsize=12)
-        plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-        plt.grid(True, alpha=0.3)
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        if save_path:
-            plt.savefig(f'{save_path}/portfolio_allocations_{model_name}.png', dpi=300, bbox_inches='tight')
-        else:
-            plt.show()
-        plt.close()
-    
+        fig = plt.figure(figsize=(14, 8))
+        draw_portfolio_allocations(fig, self.backtests[model_name]['portfolios'], model_name)
+        self._show_or_save(fig, save_path, f'portfolio_allocations_{model_name}.png')
+
     def plot_cumulative_returns(self, save_path=None):
         """
         Plot cumulative returns for all models
         """
-        plt.figure(figsize=(12, 8))
-        
-        for model_name in self.backtests.keys():
-            returns_series = self.backtests[model_name]['total_return_serie']
-            plt.plot(returns_series.index, returns_series.values, 
-                    linewidth=2, label=f'{model_name} Portfolio')
-        
-        plt.title('Cumulative Portfolio Returns Comparison', fontsize=16, fontweight='bold')
-        plt.xlabel('Date', fontsize=12)
-        plt.ylabel('Cumulative Return (%)', fontsize=12)
-        plt.legend()
-        plt.grid(True, alpha=0.3)
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        if save_path:
-            plt.savefig(f'{save_path}/cumulative_returns.png', dpi=300, bbox_inches='tight')
-        else:
-            plt.show()
-        plt.close()
-    
+        fig = plt.figure(figsize=(12, 8))
+        draw_cumulative_returns(fig, self._return_series())
+        self._show_or_save(fig, save_path, 'cumulative_returns.png')
+
     def plot_risk_metrics_comparison(self, save_path=None):
         """
         Create bar charts comparing risk metrics across models
         """
-        models = list(self.backtests.keys())
-        
-        # Extract metrics
-        returns = [self.backtests[model]['annualized_return'] for model in models]
-        cvars = [self.backtests[model]['cvar_expost'] for model in models]
-        hhis = [self.backtests[model]['mean_hhi'] for model in models]
-        rotations = [self.backtests[model]['mean_rotation'] for model in models]
-        
-        fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(15, 10))
-        
-        # Annualized Returns
-        bars1 = ax1.bar(models, returns, color='skyblue', alpha=0.7)
-        ax1.set_title('Annualized Returns (%)', fontweight='bold')
-        ax1.set_ylabel('Return (%)')
-        for i, bar in enumerate(bars1):
-            height = bar.get_height()
-            ax1.text(bar.get_x() + bar.get_width()/2., height + height*0.01,
-                    f'{returns[i]:.1f}%', ha='center', va='bottom')
-        
-        # CVaR
-        bars2 = ax2.bar(models, cvars, color='salmon', alpha=0.7)
-        ax2.set_title('CVaR Ex-post (%)', fontweight='bold')
-        ax2.set_ylabel('CVaR (%)')
-        for i, bar in enumerate(bars2):
-            height = bar.get_height()
-            ax2.text(bar.get_x() + bar.get_width()/2., height + height*0.01,
-                    f'{cvars[i]:.1f}%', ha='center', va='bottom')
-        
-        # HHI (Diversification)
-        bars3 = ax3.bar(models, hhis, color='lightgreen', alpha=0.7)
-        ax3.set_title('Mean HHI (Diversification)', fontweight='bold')
-        ax3.set_ylabel('HHI (0=concentrated, 1=diversified)')
-        for i, bar in enumerate(bars3):
-            height = bar.get_height()
-            ax3.text(bar.get_x() + bar.get_width()/2., height + height*0.01,
-                    f'{hhis[i]:.3f}', ha='center', va='bottom')
-        
-        # Portfolio Rotation
-        bars4 = ax4.bar(models, rotations, color='gold', alpha=0.7)
-        ax4.set_title('Mean Portfolio Rotation', fontweight='bold')
-        ax4.set_ylabel('Rotation')
-        for i, bar in enumerate(bars4):
-            height = bar.get_height()
-            ax4.text(bar.get_x() + bar.get_width()/2., height + height*0.01,
-                    f'{rotations[i]:.1f}', ha='center', va='bottom')
-        
-        plt.suptitle('Portfolio Performance Metrics Comparison', fontsize=16, fontweight='bold')
-        plt.tight_layout()
-        
-        if save_path:
-            plt.savefig(f'{save_path}/risk_metrics_comparison.png', dpi=300, bbox_inches='tight')
-        else:
-            plt.show()
-        plt.close()
-    
+        fig = plt.figure(figsize=(24, 10))
+        draw_risk_metrics(fig, self._metrics())
+        self._show_or_save(fig, save_path, 'risk_metrics_comparison.png')
+
+    def plot_daily_risk(self, save_path=None):
+        """
+        Plot the daily drawdowns and rolling CVaR of all models
+        """
+        fig = plt.figure(figsize=(14, 10))
+        draw_daily_risk(fig, **self._daily_risk_series())
+        self._show_or_save(fig, save_path, 'daily_risk.png')
+
     def plot_allocation_heatmap(self, model_name, save_path=None):
         """
         Create a heatmap showing asset allocations over time using matplotlib
         """
-        portfolios = self.backtests[model_name]['portfolios']
-        
-        fig, ax = plt.subplots(figsize=(12, 8))
-        
-        # Create heatmap using matplotlib imshow
-        data = portfolios.T.values
-        im = ax.imshow(data, cmap='YlOrRd', aspect='auto')
-        
-        # Add colorbar
-        cbar = plt.colorbar(im)
-        cbar.set_label('Allocation (%)', rotation=270, labelpad=15)
-        
-        # Set ticks and labels
-        ax.set_xticks(range(len(portfolios.index)))
-        ax.set_xticklabels([d.strftime('%Y-%m') for d in portfolios.index], rotation=45)
-        ax.set_yticks(range(len(portfolios.columns)))
-        ax.set_yticklabels(portfolios.columns)
-        
-        # Add text annotations
-        for i in range(len(portfolios.columns)):
-            for j in range(len(portfolios.index)):
-                text = ax.text(j, i, f'{data[i, j]:.1f}', 
-                             ha="center", va="center", color="black", fontsize=8)
-        
-        plt.title(f'Asset Allocation Heatmap - {model_name}', fontsize=16, fontweight='bold')
-        plt.xlabel('Rebalance Date', fontsize=12)
-        plt.ylabel('Asset', fontsize=12)
-        plt.tight_layout()
-        
-        if save_path:
-            plt.savefig(f'{save_path}/allocation_heatmap_{model_name}.png', dpi=300, bbox_inches='tight')
-        else:
-            plt.show()
-        plt.close()
-    
+        fig = plt.figure(figsize=(12, 8))
+        draw_allocation_heatmap(fig, self.backtests[model_name]['portfolios'], model_name)
+        self._show_or_save(fig, save_path, f'allocation_heatmap_{model_name}.png')
+
     def plot_equal_weight_comparison(self, save_path=None):
         """
         Compare actual portfolio vs equal weight benchmark
         """
-        plt.figure(figsize=(12, 8))
-        
-        for model_name in self.backtests.keys():
-            returns_series = self.backtests[model_name]['total_return_serie']
-            plt.plot(returns_series.index, returns_series.values, 
-                    linewidth=2, label=f'{model_name} Portfolio')
-        
-        # Add equal weight benchmark (if we calculate it)
-        # For now, just add a horizontal line at equal weight level
-        equal_weight = 100 / len(self.asset_names)
-        plt.axhline(y=100, color='black', linestyle='--', alpha=0.5, 
-                   label=f'Equal Weight Baseline (10% each)')
-        
-        plt.title('Portfolio Performance vs Equal Weight Baseline', fontsize=16, fontweight='bold')
-        plt.xlabel('Date', fontsize=12)
-        plt.ylabel('Cumulative Return (%)', fontsize=12)
-        plt.legend()
-        plt.grid(True, alpha=0.3)
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        if save_path:
-            plt.savefig(f'{save_path}/equal_weight_comparison.png', dpi=300, bbox_inches='tight')
-        else:
-            plt.show()
-        plt.close()
-    
+        fig = plt.figure(figsize=(12, 8))
+        draw_equal_weight_comparison(fig, self._return_series(), len(self.asset_names))
+        self._show_or_save(fig, save_path, 'equal_weight_comparison.png')
+
     def create_summary_dashboard(self, save_path=None):
         """
         Create a comprehensive dashboard with all key visualizations
         """
         print("Creating Portfolio Analysis Dashboard...")
         print("=" * 50)
-        
+
         # Create plots directory if specified
         if save_path:
-            import os
             os.makedirs(save_path, exist_ok=True)
-        
+
         # 1. Risk metrics comparison
         print("📊 Risk Metrics Comparison")
         self.plot_risk_metrics_comparison(save_path)
-        
+
         # 2. Cumulative returns
         print("📈 Cumulative Returns")
         self.plot_cumulative_returns(save_path)
-        
+
+        print("📉 Daily Risk")
+        self.plot_daily_risk(save_path)
+
         # 3. Portfolio allocations for each model
         for model_name in self.backtests.keys():
             print(f"🎯 Portfolio Allocations - {model_name}")
             self.plot_portfolio_allocations(model_name, save_path)
-            
+
             print(f"🔥 Allocation Heatmap - {model_name}")
             self.plot_allocation_heatmap(model_name, save_path)
-        
+
         # 4. Equal weight comparison
         print("⚖️ Equal Weight Comparison")
         self.plot_equal_weight_comparison(save_path)
-        
+
         print("✅ Dashboard creation complete!")
         if save_path:
-            print(f"📁 Charts saved to: {save_path}")
\ No newline at end of file
+            print(f"📁 Charts saved to: {save_path}")
+
+    def render_dashboard(self, save_path, fmt='png', dpi=300, n_jobs=1, background=False):
+        """
+        Renders the dashboard charts to save_path in fmt, one of CHART_FORMATS, with n_jobs
+        worker processes. With background set, returns at once a future of the saved paths,
+        so the caller can keep working and wait on it later; otherwise returns the paths.
+        """
+        if fmt not in CHART_FORMATS:
+            raise ValueError(f"Unknown chart format: {fmt}, expected one of {CHART_FORMATS}")
+        os.makedirs(save_path, exist_ok=True)
+        cells = [(name, (kind, kwargs, os.path.join(save_path, f'{name}.{fmt}'), fmt, dpi))
+                 for name, kind, kwargs in self._chart_jobs()]
+
+        def render():
+            with get_executor(backend='process', n_jobs=n_jobs) as executor:
+                paths = run_cells(executor, render_chart, cells)
+            return [paths[name] for name, _ in cells]
+
+        if not background:
+            return render()
+        renderer = ThreadPoolExecutor(max_workers=1)
+        future = renderer.submit(render)
+        renderer.shutdown(wait=False)
+        return future
+
+    def _chart_jobs(self):
+        '''
+        Lists the (file name, chart kind, chart data) of every dashboard chart, in dashboard order.
+        '''
+        jobs = [('risk_metrics_comparison', 'risk_metrics', {'metrics': self._metrics()}),
+                ('cumulative_returns', 'cumulative_returns', {'return_series': self._return_series()}),
+                ('daily_risk', 'daily_risk', self._daily_risk_series())]
+        for model_name in self.backtests.keys():
+            portfolios = self.backtests[model_name]['portfolios']
+            jobs.append((f'portfolio_allocations_{model_name}', 'portfolio_allocations',
+                         {'portfolios': portfolios, 'model_name': model_name}))
+            jobs.append((f'allocation_heatmap_{model_name}', 'allocation_heatmap',
+                         {'portfolios': portfolios, 'model_name': model_name}))
+        jobs.append(('equal_weight_comparison', 'equal_weight_comparison',
+                     {'return_series': self._return_series(), 'n_assets': len(self.asset_names)}))
+        return jobs
+
+    def _return_series(self):
+        return {model_name: results['total_return_serie'] for model_name, results in self.backtests.items()}
+
+    def _daily_risk_series(self):
+        return {'drawdowns': {model_name: results['drawdown_serie'] for model_name, results in self.backtests.items()},
+                'rolling_cvar': {model_name: results['rolling_cvar_serie'] for model_name, results in self.backtests.items()}}
+
+    def _metrics(self):
+        return {model_name: {panel[0]: results[panel[0]] for panel in RISK_PANELS}
+                for model_name, results in self.backtests.items()}
+
+    def _show_or_save(self, fig, save_path, file_name):
+        if save_path:
+            fig.savefig(f'{save_path}/{file_name}', dpi=300, bbox_inches='tight')
+        else:
+            plt.show()
+        plt.close(fig)
@@ -0,0 +1,80 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+
+class WindowIndex():
+    """
+    Rolling lookback windows over the asset returns, precomputed once per backtest.
+
+    Holds the yearly anchors the windows start and end on, and the returns joined with
+    the features and forward filled once over the whole history. Windows are then taken
+    as zero-copy slices by integer position instead of boolean masks and joins per date.
+    Forward filling the whole history instead of each window only differs on the first
+    rows of a window with missing features, which now take the last value before it.
+    """
+    def __init__(self, asset_returns, features=None, lookback_years=5):
+        self.lookback_years = lookback_years
+        self.has_features = features is not None
+        self.index = asset_returns.index
+        # year-end labels, as given by resample('Y'), from the first to the last year of returns
+        self.first_year = self.index[0].year
+
+        if features is not None:
+            data = asset_returns.join(features, how='left').ffill()
+        else:
+            data = asset_returns
+        self.values = np.ascontiguousarray(data.values, dtype=float)
+        self.data = pd.DataFrame(self.values, index=data.index, columns=data.columns, copy=False)
+
+    def get_start_end_dates(self, rebalance_date):
+        '''
+        Lookback window of a rebalance date. With features, the window ends one year earlier
+        because the returns are shifted forward by the returns timeframe.
+        '''
+        if self.has_features:
+            end_date = self._year_end(rebalance_date, 2)
+        else:
+            end_date = rebalance_date
+        start_date = self._year_end(end_date, self.lookback_years + 1)
+        return start_date, end_date
+
+    def positions(self, start_date, end_date):
+        '''
+        Integer positions [start, end) of the rows between both dates, inclusive.
+        '''
+        start = self.index.searchsorted(start_date, side='left')
+        end = self.index.searchsorted(end_date, side='right')
+        return start, end
+
+    def frame(self, start_date, end_date):
+        start, end = self.positions(start_date, end_date)
+        return self.data.iloc[start:end]
+
+    def array(self, start_date, end_date):
+        start, end = self.positions(start_date, end_date)
+        return self.values[start:end]
+
+    def restrict(self, start_date, end_date):
+        '''
+        Copy holding only the rows between both dates, e.g. to ship a single window to another process.
+        '''
+        start, end = self.positions(start_date, end_date)
+        window_index = copy.copy(self)
+        window_index.index = self.index[start:end]
+        window_index.values = self.values[start:end]
+        window_index.data = self.data.iloc[start:end]
+        return window_index
+
+    def _year_end(self, date, k):
+        '''
+        k-th last year-end label of the returns up to date, i.e. resample('Y').last().index[-k].
+        '''
+        last = self.index.searchsorted(date, side='right') - 1
+        if last < 0:
+            raise IndexError(f"No returns on or before {date}")
+        year = self.index[last].year - k + 1
+        if year < self.first_year:
+            raise IndexError(f"Not enough history before {date} for a {self.lookback_years} years lookback")
+        return pd.Timestamp(year=year, month=12, day=31)
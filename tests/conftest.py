@@ -0,0 +1,42 @@
+import contextlib
+import io
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the tests import the package as src, like main.py run from the repository root
+sys.path.insert(0, ROOT)
+
+from src.backtester import Backtester  # noqa: E402
+from src.utils import load_data  # noqa: E402
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    '''
+    The repository config on the bundled data, with the fast generators, a fixed seed and every
+    cache under a temporary directory.
+    '''
+    monkeypatch.chdir(ROOT)
+    with open(os.path.join(ROOT, 'config.json')) as f:
+        config = json.load(f)
+    config.update(model_names=['historical', 'fhs'], sample_size=200, seed=5, executor='serial', n_jobs=1,
+                  create_visualizations=False, read_samples=False, read_backtest=False,
+                  data_cache_dir=str(tmp_path / 'data'), samples_cache_path=str(tmp_path / 'samples'),
+                  preprocessing_cache_path=str(tmp_path / 'preprocessing'), trace_path=str(tmp_path / 'trace.jsonl'))
+    return config
+
+
+def make_backtester(config):
+    asset_prices, asset_returns, features, rebalance_dates = load_data(config)
+    return Backtester(asset_prices=asset_prices, asset_returns=asset_returns, config=config,
+                      rebalance_dates=rebalance_dates, features=features)
+
+
+def run_backtests(config):
+    # the progress display writes to stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        return make_backtester(config).run_backtests()
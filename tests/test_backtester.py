@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_backtester, run_backtests
+from src.sample_cache import SampleCache
+
+# annualized return and ex post CVaR of the config fixture, in percent, recorded after the switch to
+# holding the unallocated budget in cash: any other change of these numbers is a regression
+BASELINE = {
+    'historical': (11.953080242252145, 9.193094624492614),
+    'fhs': (11.100771063904414, 2.4612030914718086),
+}
+
+
+def assert_same_results(left, right):
+    assert left.keys() == right.keys()
+    for model_name in left:
+        for name in ('annualized_return', 'cvar_expost', 'mean_hhi', 'mean_rotation', 'max_drawdown', 'turnover_cost'):
+            assert left[model_name][name] == pytest.approx(right[model_name][name], rel=1e-12, abs=1e-12), (model_name, name)
+        pd.testing.assert_frame_equal(pd.DataFrame(left[model_name]['portfolios']),
+                                      pd.DataFrame(right[model_name]['portfolios']))
+
+
+def test_results_match_the_baseline(config):
+    results = run_backtests(config)
+    for model_name, (annualized_return, cvar_expost) in BASELINE.items():
+        assert results[model_name]['annualized_return'] == pytest.approx(annualized_return, rel=1e-9)
+        assert results[model_name]['cvar_expost'] == pytest.approx(cvar_expost, rel=1e-9)
+
+
+def test_portfolios_hold_cash_instead_of_renormalizing(config):
+    portfolios = pd.DataFrame(run_backtests(config)['historical']['portfolios'])
+    assert (portfolios.sum(axis=1) <= 100 + 1e-7).all()
+    assert not ((portfolios > 0) & (portfolios < 1)).any().any()
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_executors_match_serial(config, executor):
+    serial = run_backtests(config)
+    parallel = run_backtests(dict(config, executor=executor, n_jobs=2))
+    assert_same_results(serial, parallel)
+
+
+@pytest.mark.parametrize('executor', ['serial', 'process'])
+def test_streaming_matches_batch(config, executor):
+    batch = run_backtests(config)
+    streamed = run_backtests(dict(config, stream_samples=True, executor=executor, n_jobs=2))
+    assert_same_results(batch, streamed)
+
+
+def test_batch_optimization_matches_sequential(config):
+    sequential = run_backtests(config)
+    block = run_backtests(dict(config, batch_optimization=True, batch_mode='block'))
+    for model_name in sequential:
+        assert block[model_name]['annualized_return'] == pytest.approx(sequential[model_name]['annualized_return'], rel=1e-6)
+
+
+def test_sample_cache_replays_samples(config):
+    config = dict(config, read_samples=True)
+    fresh = run_backtests(config)
+    entries = sorted(os.listdir(config['samples_cache_path']))
+    assert entries
+
+    backtester = make_backtester(config)
+    # every cell is a cache hit, generation would fail
+    for generator in backtester.generators:
+        generator.draw = None
+    cached = backtester.run_backtests()
+    assert sorted(os.listdir(config['samples_cache_path'])) == entries
+    assert_same_results(fresh, cached)
+
+
+def test_sample_cache_evicts_least_recently_used(tmp_path):
+    cache = SampleCache(str(tmp_path), max_bytes=3 * 8 * 1000 + 3 * 128)
+    for key in 'abcd':
+        cache.put(key, np.zeros(1000))
+        os.utime(cache._path(key), (0, ord(key)))
+    assert cache.get('a') is None
+    np.testing.assert_array_equal(cache.get('d'), np.zeros(1000))
+
+
+def test_unknown_model_names_raise(config):
+    with pytest.raises(ValueError):
+        make_backtester(dict(config, model_names=['historicl']))
+
+
+def test_unknown_generator_params_raise(config):
+    with pytest.raises(ValueError):
+        make_backtester(dict(config, generator_params={'fhs': {'decy': 0.9}}))
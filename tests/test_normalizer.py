@@ -0,0 +1,70 @@
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.generators.normalizer import Normalizer
+from src.window_index import WindowIndex
+
+
+@pytest.fixture
+def window_index():
+    rng = np.random.default_rng(0)
+    index = pd.date_range('2010-01-01', periods=12 * 365, freq='D')
+    returns = pd.DataFrame(rng.normal(size=(len(index), 2)), index=index, columns=['a', 'b'])
+    features = pd.DataFrame(rng.standard_t(3, size=(len(index), 2)), index=index, columns=['f_x', 'f_y'])
+    # repeated values and missing rows, which the rolled state has to remove one by one
+    features['f_y'] = features['f_y'].round(1)
+    features.iloc[rng.random(len(index)) < 0.01, 1] = np.nan
+    return WindowIndex(returns, features, lookback_years=5)
+
+
+def windows(window_index):
+    dates = pd.date_range('2017-12-31', '2021-12-31', freq='Y')
+    return [window_index.get_start_end_dates(date) for date in dates]
+
+
+def assert_same(left, right):
+    np.testing.assert_array_equal(left.params['knots'], right.params['knots'])
+    np.testing.assert_array_equal(left.params['counts'], right.params['counts'])
+
+
+def test_rolled_normalizer_matches_a_fresh_fit(window_index):
+    rolled, previous = None, None
+    for start_date, end_date in windows(window_index):
+        start, end = window_index.positions(start_date, end_date)
+        fresh = Normalizer(method='approx').fit(window_index.frame(start_date, end_date))
+        if rolled is None:
+            rolled = copy.deepcopy(fresh)
+        else:
+            rolled.update(added=window_index.values[previous[1]:end], removed=window_index.values[previous[0]:start])
+        previous = (start, end)
+        assert_same(rolled, fresh)
+        frame = window_index.frame(start_date, end_date)
+        np.testing.assert_array_equal(rolled.transform(frame).values, fresh.transform(frame).values)
+
+
+def test_normalizer_of_a_shipped_window_matches(window_index):
+    # process executors ship each cell a window index restricted to its own window
+    for start_date, end_date in windows(window_index):
+        restricted = window_index.restrict(start_date, end_date)
+        assert_same(Normalizer(method='approx').fit(restricted.frame(start_date, end_date)),
+                    Normalizer(method='approx').fit(window_index.frame(start_date, end_date)))
+
+
+def test_generator_normalizers_match_across_executors(window_index):
+    pytest.importorskip('torch')
+    pytest.importorskip('sdv')
+    from src.generators.gan_generator import CTGANGenerator
+
+    returns = window_index.data[['a', 'b']]
+    features = window_index.data[['f_x', 'f_y']]
+    generator = CTGANGenerator(returns, features=features, window_index=window_index, normalizer_method='approx')
+    for start_date, end_date in windows(window_index):
+        frame = window_index.frame(start_date, end_date)
+        rolled = generator._get_normalizer(frame, start_date, end_date)
+        shipped = generator.for_window(start_date, end_date)
+        shipped._rolling_normalizer = None
+        assert_same(rolled, shipped._get_normalizer(frame, start_date, end_date))
+        assert_same(rolled, Normalizer(method='approx').fit(frame))
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from src.scenario_reduction import cvar_error, forward_selection, reduce_scenarios, weighted_cvar
+from src.uryasev_optimization import UryasevOptimization
+
+
+def fat_tailed_sample(n_scenarios, n_assets=6, seed=0):
+    rng = np.random.default_rng(seed)
+    sample = 0.05 + 0.1 * rng.standard_t(4, (n_scenarios, n_assets)) + 0.05 * rng.standard_t(3, (n_scenarios, 1))
+    density = rng.random(n_scenarios)
+    return sample, density / density.sum()
+
+
+def reference_forward_selection(sample, density, n_scenarios):
+    # the textbook greedy loop, recomputing every distance to the kept set
+    distances = np.linalg.norm(sample[:, np.newaxis] - sample[np.newaxis], axis=-1)
+    kept = []
+    for _ in range(n_scenarios):
+        best, best_cost = None, np.inf
+        for candidate in range(len(sample)):
+            if candidate in kept:
+                continue
+            closest = distances[:, kept + [candidate]].min(axis=1)
+            dropped = np.setdiff1d(np.arange(len(sample)), kept + [candidate])
+            cost = density[dropped] @ closest[dropped]
+            if cost < best_cost - 1e-15:
+                best, best_cost = candidate, cost
+        kept.append(best)
+    return sorted(kept)
+
+
+def test_forward_selection_matches_reference():
+    sample, density = fat_tailed_sample(60, n_assets=3)
+    representatives, probabilities = forward_selection(sample, density, 8)
+    expected = sample[reference_forward_selection(sample, density, 8)]
+    np.testing.assert_array_equal(representatives, expected)
+    assert probabilities.sum() == pytest.approx(density.sum())
+
+
+@pytest.mark.parametrize('method', ['kmeans', 'forward'])
+def test_reduction_keeps_the_probability(method):
+    sample, density = fat_tailed_sample(3000)
+    representatives, probabilities = reduce_scenarios(sample, density, n_scenarios=150, method=method,
+                                                      chunk_size=500, seed=0)
+    assert len(representatives) == len(probabilities) <= 160
+    assert probabilities.sum() == pytest.approx(1.0)
+    assert (probabilities > 0).all()
+
+
+def test_small_samples_are_not_reduced():
+    sample, density = fat_tailed_sample(100)
+    representatives, probabilities = reduce_scenarios(sample, density, n_scenarios=100, method='forward')
+    assert representatives is sample and probabilities is density
+
+
+@pytest.mark.parametrize('method', ['kmeans', 'forward'])
+def test_reduction_keeps_the_tail(method):
+    sample, density = fat_tailed_sample(8000)
+    representatives, probabilities = reduce_scenarios(sample, density, n_scenarios=400, method=method,
+                                                      chunk_size=1000, seed=0, alpha=0.95)
+    assert cvar_error(sample, density, representatives, probabilities, alpha=0.95) < 0.06
+
+    # the portfolio optimized on the representatives, measured on every scenario
+    weights = UryasevOptimization(alpha=0.95, cvar=0.15, bounds=[0.0, 1.0]).get_optimal_portfolio(
+        representatives, probabilities).values / 100
+    assert weighted_cvar(-(sample @ weights)[:, np.newaxis], density, 0.95)[0] < 0.15 * 1.15
+
+
+def test_unknown_method_raises():
+    sample, density = fat_tailed_sample(100)
+    with pytest.raises(ValueError):
+        reduce_scenarios(sample, density, n_scenarios=10, method='medoids')
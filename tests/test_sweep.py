@@ -0,0 +1,46 @@
+import contextlib
+import io
+
+import pytest
+
+from conftest import run_backtests
+from src.sweep import Sweep, stage_key
+
+
+def run_sweep(config, grid):
+    sweep = Sweep(config, grid)
+    with contextlib.redirect_stdout(io.StringIO()):
+        table = sweep.run()
+    return sweep, table
+
+
+@pytest.mark.parametrize('grid, reduction', [
+    ({'cvar': [0.05, 0.15]}, None),
+    ({'alpha': [0.9, 0.95]}, 'forward'),
+    ({'reduced_scenarios': [20, 50]}, 'kmeans'),
+])
+def test_sweep_matches_standalone_runs(config, grid, reduction):
+    config = dict(config, scenario_reduction=reduction, reduced_scenarios=30)
+    sweep, table = run_sweep(config, grid)
+    assert sweep.stage_counts['samples'] == 1
+    for point in sweep.points:
+        standalone = run_backtests(point)
+        rows = table
+        for name in grid:
+            rows = rows[rows[name] == point[name]]
+        assert len(rows) == len(config['model_names'])
+        for _, row in rows.iterrows():
+            results = standalone[row['model']]
+            assert row['annualized_return'] == pytest.approx(results['annualized_return'], rel=1e-12)
+            assert row['cvar_expost'] == pytest.approx(results['cvar_expost'], rel=1e-12)
+            if reduction is not None:
+                assert row['reduction_cvar_error'] == pytest.approx(results['reduction_cvar_error'], rel=1e-12)
+
+
+def test_stage_keys(config):
+    assert stage_key(config, 'problems') == stage_key(dict(config, alpha=0.9), 'problems')
+    assert stage_key(config, 'portfolios') != stage_key(dict(config, alpha=0.9), 'portfolios')
+    # reduced problems share out their representatives and measure their error at alpha
+    reduced = dict(config, scenario_reduction='forward')
+    assert stage_key(reduced, 'problems') != stage_key(dict(reduced, alpha=0.9), 'problems')
+    assert stage_key(config, 'samples') == stage_key(dict(config, executor='thread', cvar=0.2), 'samples')
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+from scipy.optimize import linprog
+
+from src.scenario_reduction import weighted_cvar
+from src.uryasev_optimization import UryasevOptimization, drift_weights
+
+
+def fat_tailed_sample(n_scenarios=300, n_assets=6, seed=0):
+    rng = np.random.default_rng(seed)
+    scales = rng.uniform(0.05, 0.3, n_assets)
+    return 0.05 + scales * rng.standard_t(4, (n_scenarios, n_assets))
+
+
+def dense_baseline(sample, density, alpha, cvar, bounds):
+    '''
+    The dense (2J + 2) x (1 + n + J) system of the first implementation, with explicit z >= 0 rows.
+    '''
+    J, n = sample.shape
+    A = np.zeros((2 * J + 2, 1 + n + J))
+    b = np.zeros(2 * J + 2)
+    A[0, 0] = 1
+    A[0, 1 + n:] = density / (1 - alpha)
+    b[0] = cvar
+    A[1:J + 1, 0] = -1
+    A[1:J + 1, 1:1 + n] = -sample
+    A[1:J + 1, 1 + n:] = -np.identity(J)
+    A[J + 1:2 * J + 1, 1 + n:] = -np.identity(J)
+    A[-1, 1:1 + n] = 1
+    b[-1] = 1
+    c = np.zeros(1 + n + J)
+    c[1:1 + n] = -sample.T.dot(density)
+    v = [(0, None)] + [tuple(bounds)] * n + [(0, None)] * J
+    return linprog(c, A_ub=A, b_ub=b, bounds=v, method='highs')
+
+
+def realized_cvar(sample, weights, alpha, density=None):
+    density = np.full(len(sample), 1 / len(sample)) if density is None else density
+    return weighted_cvar(-(sample @ weights)[:, np.newaxis], density, alpha)[0]
+
+
+@pytest.mark.parametrize('alpha, cvar', [(0.95, 0.05), (0.9, 0.15), (0.99, 0.3)])
+def test_sparse_problem_matches_dense_baseline(alpha, cvar):
+    sample = fat_tailed_sample()
+    density = np.random.default_rng(1).random(len(sample))
+    density /= density.sum()
+    optimization = UryasevOptimization(alpha=alpha, cvar=cvar, bounds=[0.0, 1.0])
+
+    c, A, b, v = optimization.build_problem(sample, density)
+    sparse_result = linprog(c, A_ub=A, b_ub=b, bounds=v, method='highs')
+    baseline_result = dense_baseline(sample, density, alpha, cvar, [0.0, 1.0])
+    assert sparse_result.success and baseline_result.success
+    assert sparse_result.fun == pytest.approx(baseline_result.fun, rel=1e-7, abs=1e-10)
+    assert A.shape == (len(sample) + 2, 1 + sample.shape[1] + len(sample))
+
+
+@pytest.mark.parametrize('cvar', [0.01, 0.05, 0.15])
+def test_portfolio_keeps_the_cvar_restriction(cvar):
+    for seed in range(5):
+        sample = fat_tailed_sample(seed=seed)
+        weights = UryasevOptimization(alpha=0.95, cvar=cvar, bounds=[0.0, 1.0]).get_optimal_portfolio(sample).values / 100
+        # what is not invested is cash, weights are never scaled back up to 100%
+        assert weights.sum() <= 1 + 1e-9
+        assert realized_cvar(sample, weights, 0.95) <= cvar + 1e-7
+        assert not ((weights > 0) & (weights < 0.01)).any()
+
+
+def test_turnover_cap_is_respected():
+    sample = fat_tailed_sample()
+    previous = np.full(sample.shape[1], 1 / sample.shape[1])
+    optimization = UryasevOptimization(alpha=0.95, cvar=0.15, bounds=[0.0, 1.0], max_turnover=0.3)
+    weights = optimization.get_optimal_portfolio(sample, previous=previous).values / 100
+    assert np.abs(weights - previous).sum() <= 0.3 + 1e-7
+    assert realized_cvar(sample, weights, 0.95) <= 0.15 + 1e-7
+
+
+def test_min_lot_weights():
+    sample = fat_tailed_sample()
+    weights = UryasevOptimization(alpha=0.95, cvar=0.1, bounds=[0.0, 1.0], min_lot=0.1).get_optimal_portfolio(sample).values / 100
+    held = weights[weights > 1e-9]
+    assert (held >= 0.1 - 1e-7).all()
+    assert realized_cvar(sample, weights, 0.95) <= 0.1 + 1e-7
+
+
+def test_block_mode_matches_sequential():
+    problems = [(fat_tailed_sample(n_scenarios=100, seed=seed), None) for seed in range(4)]
+    optimization = UryasevOptimization(alpha=0.95, cvar=0.1, bounds=[0.0, 1.0])
+    sequential = optimization.get_optimal_portfolios(problems, mode='sequential')
+    block = optimization.get_optimal_portfolios(problems, mode='block', batch_size=2)
+    for (sample, _), (_, row_sequential), (_, row_block) in zip(problems, sequential.iterrows(), block.iterrows()):
+        expected = sample.mean(axis=0)
+        assert expected @ row_block.values == pytest.approx(expected @ row_sequential.values, rel=1e-6)
+
+
+def test_frontier_matches_single_solves():
+    sample = fat_tailed_sample()
+    frontier = UryasevOptimization(alpha=0.95, cvar=0.1, bounds=[0.0, 1.0]).get_frontier(
+        sample, alpha_range=[0.9, 0.95], cvar_range=[0.05, 0.15])
+    expected = sample.mean(axis=0)
+    for _, row in frontier.iterrows():
+        single = UryasevOptimization(alpha=row['alpha'], cvar=row['cvar'], bounds=[0.0, 1.0]).get_optimal_portfolio(sample)
+        assert expected @ row.values[2:] == pytest.approx(expected @ single.values, rel=1e-6)
+
+
+def test_drift_keeps_cash():
+    drifted = drift_weights(np.array([0.3, 0.3]), np.array([2.0, 1.0]))
+    # 0.6 and 0.3 of assets next to 0.4 of cash
+    np.testing.assert_allclose(drifted, [0.6 / 1.3, 0.3 / 1.3])